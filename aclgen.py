@@ -22,33 +22,33 @@ __author__ = 'pmoody@google.com'
 
 import copy
 import difflib
-import dircache
-import multiprocessing
+import glob
+import gzip
+import hashlib
 import os
+import random
 import sys
+import time
 import types
 
 from lib import aclgenerator
-from lib import arista
-from lib import aruba
-from lib import brocade
-from lib import cisco
-from lib import ciscoasa
-from lib import ciscoxr
-from lib import gce
-from lib import ipset
-from lib import iptables
-from lib import juniper
-from lib import junipersrx
+from lib import aclstore
+from lib import aclwriter
+from lib import changes
+from lib import discovery
+from lib import generators
+from lib import manifest
 from lib import naming
-from lib import nftables
-from lib import nsxv
-from lib import packetfilter
-from lib import pcap
 from lib import policy
-from lib import speedway
-from lib import srxlo
-from lib import windows_advfirewall
+from lib import policy_simple
+from lib import profiling
+from lib import rendercache
+from lib import renderpool
+from lib import renderd
+from lib import schedule
+from lib import shard
+from lib import template
+from lib import watch
 
 import gflags as flags
 import logging
@@ -85,10 +85,38 @@ flags.DEFINE_list(
     'ignore_directories',
     'DEPRECATED, def',
     "Don't descend into directories that look like this string")
+flags.DEFINE_integer(
+    'discovery_threads',
+    1,
+    'Number of directories listed concurrently when looking for policies.')
+flags.DEFINE_string(
+    'discovery_index',
+    None,
+    'Cache the directory listings in this file, and only list the '
+    'directories modified since on the next run.')
 flags.DEFINE_integer(
     'max_renderers',
     10,
     'Max number of rendering processes to use.')
+flags.DEFINE_integer(
+    'renderer_max_tasks',
+    0,
+    'Replace a rendering process by a new one after it rendered this many '
+    'tasks, 0 to never.')
+flags.DEFINE_integer(
+    'renderer_max_rss',
+    0,
+    'Replace a rendering process by a new one once its RSS exceeds this many '
+    'MiB after a task, returning the heap large policies leave behind; 0 to '
+    'never.')
+flags.DEFINE_integer(
+    'render_memory_budget',
+    0,
+    'Only start a task while the estimated memory of the tasks rendering '
+    'stays within this many MiB, so that huge policies do not all render at '
+    'once; a task estimated above the budget renders alone. Tasks are '
+    'estimated at the peak RSS growth recorded in --render_timings_file, or '
+    'from the size of their policy. 0 for no budget.')
 flags.DEFINE_boolean(
     'shade_check',
     False,
@@ -97,6 +125,112 @@ flags.DEFINE_integer(
     'exp_info',
     2,
     'Print a info message when a term is set to expire in that many weeks.')
+flags.DEFINE_list(
+    'platforms',
+    [],
+    'Only render these platforms, e.g. juniper,srx. Headers targeting none '
+    'of them, and terms none of them would render, are dropped before their '
+    'addresses and services are expanded.')
+flags.DEFINE_boolean(
+    'split_platforms',
+    False,
+    'Render each platform of a multi-target policy as a separate task, so '
+    'that one large policy does not keep a single renderer busy. A policy may '
+    'then be parsed by more than one renderer.')
+flags.DEFINE_string(
+    'render_timings_file',
+    None,
+    'Record how long every rendering task took in this file, and use it to '
+    'render the most expensive policies first on the next run.')
+flags.DEFINE_string(
+    'serve',
+    None,
+    'Run as a daemon answering render and check requests on this Unix '
+    'socket, see tools/aclgen_client.py.')
+flags.DEFINE_boolean(
+    'watch',
+    False,
+    'After rendering, keep watching the policies, their includes and the '
+    'definitions, and render again the policies affected by every change.')
+flags.DEFINE_float(
+    'watch_interval',
+    0.25,
+    'Seconds between two polls of the watched files.')
+flags.DEFINE_string(
+    'profile_report',
+    None,
+    'Write the wall and CPU time of every rendering stage, for every policy '
+    'and platform, to this JSON file.')
+flags.DEFINE_integer(
+    'profile_top',
+    10,
+    'Number of slowest policies and platforms listed in the profile report.')
+flags.DEFINE_string(
+    'trace_file',
+    None,
+    'Write a timeline of the run to this file in the Chrome trace event '
+    'format, viewable in chrome://tracing or Perfetto, with a span per '
+    'task, policy, platform and rendering stage in every renderer process.')
+flags.DEFINE_integer(
+    'shard_index',
+    0,
+    'Only render the policies assigned to this shard, from 0 to '
+    'shard_count - 1.')
+flags.DEFINE_integer(
+    'shard_count',
+    1,
+    'Number of shards the discovered policies are split into.')
+flags.DEFINE_boolean(
+    'shard_balance',
+    False,
+    'Assign policies to shards by estimated cost instead of by a hash of '
+    'their path, balancing the shards at the price of moving policies '
+    'between shards as they change.')
+flags.DEFINE_boolean(
+    'fsync',
+    False,
+    'fsync rendered acls, in batches, before renaming them into place.')
+flags.DEFINE_boolean(
+    'output_digests',
+    False,
+    'Keep a .digest file next to every rendered acl, used to tell whether '
+    'the acl changed without reading it.')
+flags.DEFINE_string(
+    'dedup_outputs',
+    None,
+    'Store identical rendered acls once, in the .aclstore directory of the '
+    'output directory, every output being a "hardlink" or a "symlink" to its '
+    'content; .aclstore/manifest.json lists the outputs sharing content. '
+    'Outputs are then replaced when rendered, and must not be edited in '
+    'place.')
+flags.DEFINE_string(
+    'manifest_file',
+    None,
+    'Record the inputs of every rendered policy in this file, and skip '
+    'policies whose inputs have not changed since the last run.')
+flags.DEFINE_string(
+    'render_cache',
+    None,
+    'Directory of a cache of rendered acls, keyed by a digest of their '
+    'inputs, which can be shared by checkouts and jobs on the same host. '
+    'Policies whose renderings are all cached are not parsed, so their '
+    'expiration warnings are not logged again.')
+flags.DEFINE_integer(
+    'render_cache_size',
+    512,
+    'Size in MiB above which the least recently used entries of the render '
+    'cache are evicted.')
+flags.DEFINE_string(
+    'changed_since',
+    None,
+    'Only render the policies affected by the changes since this git '
+    'revision: changed policies, policies including changed files, and '
+    'policies referencing definitions whose value changed.')
+flags.DEFINE_integer(
+    'changed_verify',
+    0,
+    'With --changed_since, also render this many randomly chosen unaffected '
+    'policies, warning if their acls changed.')
 
 
 class Error(Exception):
@@ -115,6 +249,17 @@ class ACLParserError(Error):
   """Raised when the ACL parser fails."""
 
 
+# naming.Naming object shared by all rendering processes, see _InitRenderer.
+_WORKER_DEFINITIONS = None
+# the policy last parsed by this rendering process, see _WorkerPolicy.
+_WORKER_POLICY = {}
+# rendercache.RenderCache object, if --render_cache is set.
+_RENDER_CACHE = None
+_MIB = 1024 * 1024
+# aclstore.AclStore object, if --dedup_outputs is set.
+_ACL_STORE = None
+
+
 # Workaround http://bugs.python.org/issue1515, needed because of
 # http://codereview.appspot.com/4523073/.
 #  (more: http://code.google.com/p/ipaddr-py/issues/detail?id=84)
@@ -139,6 +284,211 @@ def SkipLines(text, skip_line_func=False):
   return [x for x in text if not skip_line_func(x)]
 
 
+# Platforms rendered by aclgen, in rendering order.
+_PLATFORMS = generators.Platforms()
+
+
+def ParsePolicyFile(input_file, definitions):
+  """Read and parse a single policy file.
+
+  Args:
+    input_file: the name of the input policy file.
+    definitions: the definitions from naming.Naming().
+
+  Returns:
+    a policy.Policy object, or None if the policy is shaded.
+
+  Raises:
+    ACLParserError: if the policy fails to parse.
+  """
+  with profiling.Record(input_file):
+    try:
+      with profiling.Stage('read'):
+        if input_file.endswith('.gz'):
+          conf = gzip.open(input_file).read()
+        else:
+          conf = open(input_file).read()
+      logging.debug('opened and read %s', input_file)
+    except IOError as e:
+      logging.warn('bad file: \n%s', e)
+      raise
+
+    try:
+      pol = policy.ParsePolicy(
+          conf, definitions, optimize=FLAGS.optimize,
+          base_dir=FLAGS.base_directory, shade_check=FLAGS.shade_check,
+          platforms=FLAGS.platforms)
+      if pol and profiling.Enabled():
+        _CountRules(pol)
+      return pol
+    except policy.ShadingError as e:
+      logging.warn('shading errors for %s:\n%s', input_file, e)
+      return None
+    except (policy.Error, naming.Error):
+      raise ACLParserError('Error parsing policy file %s:\n%s%s' % (
+          input_file, sys.exc_info()[0], sys.exc_info()[1]))
+
+
+def _CountRules(pol):
+  """Count the terms of a policy, and the rules of a flat acl rendering it.
+
+  A flat acl needs a rule per source address, destination address and
+  destination port of every term.
+
+  Args:
+    pol: the policy.Policy object.
+  """
+  terms = 0
+  rules = 0
+  for _, filter_terms in pol.filters:
+    for term in filter_terms:
+      terms += 1
+      rules += (max(1, len(term.source_address)) *
+                max(1, len(term.destination_address)) *
+                max(1, len(term.destination_port)))
+  profiling.Count('terms', terms)
+  profiling.Count('rules', rules)
+
+
+def PolicyPlatforms(pol):
+  """Return the platforms targeted by a parsed policy, in rendering order."""
+  platforms = set()
+  for header in pol.headers:
+    platforms.update(header.platforms)
+  return [x for x in _PLATFORMS if x in platforms and _Selected(x)]
+
+
+def _Selected(platform):
+  """Whether platform is rendered, see --platforms."""
+  return not FLAGS.platforms or platform in FLAGS.platforms
+
+
+def _AppendGenerators(acls, pol, platform, exp_info):
+  """Append the (suffix prefix, generator) rendering platform to acls.
+
+  Every generator is given its own copy of the policy, which it modifies.
+
+  Args:
+    acls: the list to append to.
+    pol: the policy.Policy object.
+    platform: the platform to render, one of _PLATFORMS.
+    exp_info: print a info message when a term is set to expire
+              in that many weeks.
+  """
+  for suffix_prefix, generator, kwargs in generators.Generators(platform):
+    acls.append((suffix_prefix, generator(copy.deepcopy(pol), exp_info,
+                                          **kwargs)))
+
+
+def _RenderTexts(pol, platform, input_file, exp_info):
+  """Render a parsed policy for a single platform, without writing it.
+
+  Args:
+    pol: the policy.Policy object, which is left unmodified.
+    platform: the platform to render, one of _PLATFORMS.
+    input_file: the name of the input policy file.
+    exp_info: print a info message when a term is set to expire
+              in that many weeks.
+
+  Returns:
+    the list of (file suffix, acl text) rendered.
+
+  Raises:
+    ACLGeneratorError: if the generator fails.
+  """
+  acls = []
+  texts = []
+  try:
+    with profiling.Stage('copy'):
+      _AppendGenerators(acls, pol, platform, exp_info)
+    for suffix_prefix, acl_obj in acls:
+      with profiling.Stage('render'):
+        texts.append((suffix_prefix + acl_obj.SUFFIX, str(acl_obj)))
+    return texts
+  # TODO(robankeny) add additional errors.
+  except generators.Errors():
+    raise ACLGeneratorError('Error generating target ACL for %s:\n%s%s' % (
+        input_file, sys.exc_info()[0], sys.exc_info()[1]))
+
+
+def RenderPlatform(pol, platform, input_file, output_directory, exp_info,
+                   write_files, cached=None, cache_key=None):
+  """Render a parsed policy for a single platform.
+
+  Args:
+    pol: the policy.Policy object, which is left unmodified.
+    platform: the platform to render, one of _PLATFORMS.
+    input_file: the name of the input policy file.
+    output_directory: the directory in which we place the rendered file.
+    exp_info: print a info message when a term is set to expire
+              in that many weeks.
+    write_files: a list of file tuples, (output_file, acl_text), to write
+    cached: optional list of (file suffix, acl text) found in the render
+      cache, used instead of rendering pol, which can then be None.
+    cache_key: optional render cache key the rendering is stored under.
+
+  Returns:
+    the list of output files rendered.
+
+  Raises:
+    ACLGeneratorError: if the generator fails.
+  """
+  if not output_directory.endswith('/'):
+    output_directory += '/'
+
+  outputs = []
+  with profiling.Record(input_file, platform):
+    texts = cached
+    if texts is None:
+      texts = _RenderTexts(pol, platform, input_file, exp_info)
+      if cache_key and _RENDER_CACHE is not None:
+        _RENDER_CACHE.Put(cache_key, texts)
+    for suffix, acl_text in texts:
+      outputs.append(RenderACL(acl_text, suffix, output_directory, input_file,
+                               write_files))
+    profiling.Count('lines', sum(x.count('\n') for _, x in texts))
+  return outputs
+
+
+def _CachedTexts(input_file, definitions, platforms):
+  """Look up the renderings of a policy in the render cache.
+
+  Args:
+    input_file: the name of the input policy file.
+    definitions: the definitions from naming.Naming().
+    platforms: the platforms to look up.
+
+  Returns:
+    a tuple of two dicts, of platform to render cache key, and of platform to
+    the cached list of (file suffix, acl text) for the platforms found.  Both
+    are empty without a render cache.
+  """
+  if _RENDER_CACHE is None or not platforms:
+    return {}, {}
+  return _CacheLookup(PolicyDigest(input_file, None, definitions), platforms)
+
+
+def _CacheLookup(digest, platforms):
+  """Look up the renderings of a policy digest in the render cache.
+
+  Args:
+    digest: the policy digest from PolicyDigest, or None.
+    platforms: the platforms to look up.
+
+  Returns:
+    a tuple of two dicts, see _CachedTexts.
+  """
+  if digest is None:
+    return {}, {}
+  keys = dict((x, rendercache.Key(digest, x)) for x in platforms)
+  texts = {}
+  for platform, key in keys.items():
+    cached = _RENDER_CACHE.Get(key)
+    if cached is not None:
+      texts[platform] = cached
+  return keys, texts
+
+
 def RenderFile(input_file, output_directory, definitions,
                exp_info, write_files):
   """Render a single file.
@@ -150,176 +500,285 @@ def RenderFile(input_file, output_directory, definitions,
     exp_info: print a info message when a term is set to expire
               in that many weeks.
     write_files: a list of file tuples, (output_file, acl_text), to write
+
+  Returns:
+    the list of output files rendered, or None if the policy is shaded.
   """
   logging.debug('rendering file: %s into %s', input_file,
                 output_directory)
-  pol = None
-  jcl = False
-  acl = False
-  asacl = False
-  aacl = False
-  bacl = False
-  eacl = False
-  gcefw = False
-  ips = False
-  ipt = False
-  spd = False
-  nsx = False
-  pcap_accept = False
-  pcap_deny = False
-  pf = False
-  srx = False
-  jsl = False
-  nft = False
-  win_afw = False
-  xacl = False
+  if template.IsTemplate(input_file):
+    return RenderTemplate(input_file, output_directory, definitions, exp_info,
+                          write_files)
+  keys = texts = {}
+  if _RENDER_CACHE is not None:
+    keys, texts = _CachedTexts(input_file, definitions,
+                               _ScanTargets(input_file))
+  if keys and len(texts) == len(keys):
+    # every platform is cached, the policy doesn't need to be parsed.
+    logging.debug('rendering of %s cached', input_file)
+    pol = None
+    platforms = [x for x in _PLATFORMS if x in texts]
+  else:
+    pol = ParsePolicyFile(input_file, definitions)
+    if pol is None:
+      return None
+    platforms = PolicyPlatforms(pol)
+
+  outputs = []
+  for platform in platforms:
+    outputs.extend(RenderPlatform(pol, platform, input_file, output_directory,
+                                  exp_info, write_files,
+                                  cached=texts.get(platform),
+                                  cache_key=keys.get(platform)))
+  return outputs
+
+
+def RenderTemplate(input_file, output_directory, definitions, exp_info,
+                   write_files):
+  """Render every instance of a policy template.
+
+  Instances render like policy files named after them, in the directory of
+  the template; the terms they have in common are parsed only once, and an
+  instance whose renderings are all in the render cache isn't parsed.
+
+  Args:
+    input_file: the name of the template file.
+    output_directory: the directory in which we place the rendered files.
+    definitions: the definitions from naming.Naming().
+    exp_info: print a info message when a term is set to expire
+              in that many weeks.
+    write_files: a list of file tuples, (output_file, acl_text), to write
+
+  Returns:
+    the list of output files rendered, shaded instances being skipped.
+
+  Raises:
+    ACLParserError: if the template or an instance fails to parse.
+  """
+  with profiling.Record(input_file):
+    try:
+      with profiling.Stage('read'):
+        tmpl = template.Load(input_file, base_dir=FLAGS.base_directory)
+    except (policy.Error, template.Error) as e:
+      raise ACLParserError('Error reading template %s:\n%s' % (input_file, e))
+
+  digest = None
+  if _RENDER_CACHE is not None:
+    digest = PolicyDigest(input_file, None, definitions)
+
+  outputs = []
+  for instance in tmpl.Instances():
+    instance_file = tmpl.InstanceFile(instance)
+    keys = texts = {}
+    if digest is not None:
+      try:
+        platforms = [x for x in _PLATFORMS if _Selected(x) and
+                     x in tmpl.Platforms(instance, definitions)]
+      except (policy.Error, naming.Error, template.Error):
+        platforms = []
+      keys, texts = _CacheLookup(
+          template.InstanceDigest(digest, instance), platforms)
+    if keys and len(texts) == len(keys):
+      # every platform is cached, the instance doesn't need to be parsed.
+      logging.debug('rendering of %s cached', instance_file)
+      for platform in platforms:
+        outputs.extend(RenderPlatform(None, platform, instance_file,
+                                      output_directory, exp_info, write_files,
+                                      cached=texts[platform]))
+      continue
+    with profiling.Record(instance_file):
+      try:
+        pol = tmpl.Parse(instance, definitions, optimize=FLAGS.optimize,
+                         shade_check=FLAGS.shade_check,
+                         platforms=FLAGS.platforms)
+      except policy.ShadingError as e:
+        logging.warn('shading errors for %s:\n%s', instance_file, e)
+        continue
+      except (policy.Error, naming.Error, template.Error):
+        raise ACLParserError('Error parsing instance %s of template %s:\n%s%s'
+                             % (instance, input_file, sys.exc_info()[0],
+                                sys.exc_info()[1]))
+      if profiling.Enabled():
+        _CountRules(pol)
+    for platform in PolicyPlatforms(pol):
+      outputs.extend(RenderPlatform(pol, platform, instance_file,
+                                    output_directory, exp_info, write_files,
+                                    cached=texts.get(platform),
+                                    cache_key=keys.get(platform)))
+  return outputs
+
+
+def _InitRenderer(definitions):
+  """Initialize a rendering process with the shared definitions.
+
+  The pool is created after the definitions are parsed, so on platforms which
+  fork() the worker simply keeps a reference to the parent's (copy-on-write)
+  object and nothing is serialized; the definitions are no longer pickled
+  along with every policy file submitted to the pool.
+
+  Args:
+    definitions: the definitions from naming.Naming().
+  """
+  global _WORKER_DEFINITIONS
+  _WORKER_DEFINITIONS = definitions
+  # forget the records and trace events of the parent, which it keeps.
+  profiling.Reset()
+
+
+def _WorkerPolicy(input_file):
+  """Return the parsed policy, reusing the last one parsed by this process.
+
+  Tasks for the platforms of a policy are submitted back to back, so a process
+  which picks up several of them only parses the policy once.
+
+  Args:
+    input_file: the name of the input policy file.
+
+  Returns:
+    a policy.Policy object, or None if the policy is shaded.
+  """
+  if input_file not in _WORKER_POLICY:
+    _WORKER_POLICY.clear()
+    _WORKER_POLICY[input_file] = ParsePolicyFile(input_file,
+                                                 _WORKER_DEFINITIONS)
+  return _WORKER_POLICY[input_file]
+
+
+def _RenderWorkerFile(args):
+  """Render a policy in a pool process using the shared definitions.
 
+  Args:
+    args: tuple of (input_file, output_directory, exp_info, platform), where
+      platform is the single platform to render, or None for all of them.
+
+  Returns:
+    tuple of (input_file, platform, outputs, write_files, error, seconds,
+    profile, cache_stats, trace), where outputs is the list of files rendered
+    (None if the policy is shaded), write_files is the list of (output_file,
+    acl_text) tuples which changed and need to be written, error is the
+    ACLParserError or ACLGeneratorError raised, seconds the wall time of the
+    task, profile the profiling records of the task, cache_stats the render
+    cache statistics of the task and trace its trace events.
+  """
+  input_file, output_directory, exp_info, platform = args
+  with profiling.Span(_TaskKey(input_file, platform), 'task'):
+    result = _RenderWorkerTask(input_file, output_directory, exp_info,
+                               platform)
+  return result + (profiling.CollectTrace(),)
+
+
+def _RenderWorkerTask(input_file, output_directory, exp_info, platform):
+  """Render a task of _RenderWorkerFile, returning all but its trace."""
+  start = time.time()
+  write_files = []
   try:
-    conf = open(input_file).read()
-    logging.debug('opened and read %s', input_file)
-  except IOError as e:
-    logging.warn('bad file: \n%s', e)
-    raise
+    if platform is None:
+      outputs = RenderFile(input_file, output_directory, _WORKER_DEFINITIONS,
+                           exp_info, write_files)
+    else:
+      keys, texts = _CachedTexts(input_file, _WORKER_DEFINITIONS, [platform])
+      if platform in texts:
+        outputs = RenderPlatform(None, platform, input_file, output_directory,
+                                 exp_info, write_files,
+                                 cached=texts[platform])
+      else:
+        pol = _WorkerPolicy(input_file)
+        outputs = None
+        if pol is not None:
+          outputs = []
+          if platform in PolicyPlatforms(pol):
+            outputs = RenderPlatform(pol, platform, input_file,
+                                     output_directory, exp_info, write_files,
+                                     cache_key=keys.get(platform))
+  except (ACLParserError, ACLGeneratorError) as e:
+    outputs = None
+    write_files = []
+    error = e
+  else:
+    error = None
+  cache_stats = {}
+  if _RENDER_CACHE is not None:
+    cache_stats = _RENDER_CACHE.Collect()
+  return (input_file, platform, outputs, write_files, error,
+          time.time() - start, profiling.Collect(), cache_stats)
+
+
+def _TaskKey(input_file, platform):
+  """The key identifying a rendering task in the timings file."""
+  return '%s:%s' % (input_file, platform or '*')
 
+
+def _ScanTargets(input_file):
+  """Return the platforms targeted by a policy file, without expanding it.
+
+  Args:
+    input_file: the name of the input policy file.
+
+  Returns:
+    the list of platforms in rendering order, or None if they cannot be
+    determined without a full parse.
+  """
+  if template.IsTemplate(input_file):
+    return None
   try:
-    pol = policy.ParsePolicy(
-        conf, definitions, optimize=FLAGS.optimize,
-        base_dir=FLAGS.base_directory, shade_check=FLAGS.shade_check)
-  except policy.ShadingError as e:
-    logging.warn('shading errors for %s:\n%s', input_file, e)
-    return
-  except (policy.Error, naming.Error):
-    raise ACLParserError('Error parsing policy file %s:\n%s%s' % (
-        input_file, sys.exc_info()[0], sys.exc_info()[1]))
+    data = '\n'.join(policy._Preprocess(policy._ReadFile(input_file),
+                                        base_dir=FLAGS.base_directory))
+    pol = policy_simple.PolicyParser(data, input_file).Parse()
+  except (policy.Error, ValueError, IndexError) as e:
+    logging.debug('unable to scan platforms of %s: %s', input_file, e)
+    return None
+  targets = set()
+  for member in pol:
+    if isinstance(member, policy_simple.Header):
+      for target in member.FieldsWithType(policy_simple.Target):
+        if target.value.split():
+          targets.add(target.value.split()[0])
+  return [x for x in _PLATFORMS if x in targets and _Selected(x)]
 
-  platforms = set()
-  for header in pol.headers:
-    platforms.update(header.platforms)
 
-  if 'juniper' in platforms:
-    jcl = copy.deepcopy(pol)
-  if 'cisco' in platforms:
-    acl = copy.deepcopy(pol)
-  if 'ciscoasa' in platforms:
-    asacl = copy.deepcopy(pol)
-  if 'brocade' in platforms:
-    bacl = copy.deepcopy(pol)
-  if 'arista' in platforms:
-    eacl = copy.deepcopy(pol)
-  if 'aruba' in platforms:
-    aacl = copy.deepcopy(pol)
-  if 'ipset' in platforms:
-    ips = copy.deepcopy(pol)
-  if 'iptables' in platforms:
-    ipt = copy.deepcopy(pol)
-  if 'nsxv' in platforms:
-    nsx = copy.deepcopy(pol)
-  if 'packetfilter' in platforms:
-    pf = copy.deepcopy(pol)
-  if 'pcap' in platforms:
-    pcap_accept = copy.deepcopy(pol)
-    pcap_deny = copy.deepcopy(pol)
-  if 'speedway' in platforms:
-    spd = copy.deepcopy(pol)
-  if 'srx' in platforms:
-    srx = copy.deepcopy(pol)
-  if 'srxlo' in platforms:
-    jsl = copy.deepcopy(pol)
-  if 'windows_advfirewall' in platforms:
-    win_afw = copy.deepcopy(pol)
-  if 'ciscoxr' in platforms:
-    xacl = copy.deepcopy(pol)
-  if 'nftables' in platforms:
-    nft = copy.deepcopy(pol)
-  if 'gce' in platforms:
-    gcefw = copy.deepcopy(pol)
+def ScanPlatforms(input_file):
+  """Return the platforms to render a policy file for, in separate tasks.
 
-  if not output_directory.endswith('/'):
-    output_directory += '/'
+  Args:
+    input_file: the name of the input policy file.
+
+  Returns:
+    the list of platforms in rendering order, or [None] if they cannot be
+    determined without a full parse or aren't rendered separately.
+  """
+  if not FLAGS.split_platforms:
+    return [None]
+  return _ScanTargets(input_file) or [None]
+
+
+def PolicyDigest(input_file, output_directory, definitions):
+  """Compute the manifest digest of a policy, or None if it can't be read.
 
+  Args:
+    input_file: the name of the input policy file.
+    output_directory: the directory in which we place the rendered file, or
+      None for the digest of the rendered text only, e.g. for the render
+      cache.
+    definitions: the definitions from naming.Naming().
+
+  Returns:
+    a digest string, or None.
+  """
+  render_flags = {'optimize': FLAGS.optimize,
+                  'shade_check': FLAGS.shade_check,
+                  'exp_info': FLAGS.exp_info}
+  if output_directory is not None:
+    render_flags['output_directory'] = output_directory
+  if FLAGS.platforms:
+    render_flags['platforms'] = sorted(FLAGS.platforms)
   try:
-    if jcl:
-      acl_obj = juniper.Juniper(jcl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if srx:
-      acl_obj = junipersrx.JuniperSRX(srx, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if acl:
-      acl_obj = cisco.Cisco(acl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if asacl:
-      acl_obj = ciscoasa.CiscoASA(acl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if aacl:
-      acl_obj = aruba.Aruba(aacl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if bacl:
-      acl_obj = brocade.Brocade(bacl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if eacl:
-      acl_obj = arista.Arista(eacl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if ips:
-      acl_obj = ipset.Ipset(ips, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if ipt:
-      acl_obj = iptables.Iptables(ipt, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if nsx:
-      acl_obj = nsxv.Nsxv(nsx, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if spd:
-      acl_obj = speedway.Speedway(spd, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if pcap_accept:
-      acl_obj = pcap.PcapFilter(pcap_accept, exp_info)
-      RenderACL(str(acl_obj), '-accept' + acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if pcap_deny:
-      acl_obj = pcap.PcapFilter(pcap_deny, exp_info, invert=True)
-      RenderACL(str(acl_obj), '-deny' + acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if pf:
-      acl_obj = packetfilter.PacketFilter(pf, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if win_afw:
-      acl_obj = windows_advfirewall.WindowsAdvFirewall(win_afw, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if jsl:
-      acl_obj = srxlo.SRXlo(jsl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if xacl:
-      acl_obj = ciscoxr.CiscoXR(xacl, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if nft:
-      acl_obj = nftables.Nftables(nft, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-    if gcefw:
-      acl_obj = gce.GCE(gcefw, exp_info)
-      RenderACL(str(acl_obj), acl_obj.SUFFIX, output_directory,
-                input_file, write_files)
-  # TODO(robankeny) add additional errors.
-  except (juniper.Error, junipersrx.Error, cisco.Error, ipset.Error,
-          iptables.Error, speedway.Error, pcap.Error,
-          aclgenerator.Error, aruba.Error, nftables.Error, gce.Error):
-    raise ACLGeneratorError('Error generating target ACL for %s:\n%s%s' % (
-        input_file, sys.exc_info()[0], sys.exc_info()[1]))
+    return manifest.PolicyDigest(input_file, definitions,
+                                 base_dir=FLAGS.base_directory,
+                                 flags=render_flags)
+  except (policy.Error, template.Error, ValueError, IndexError) as e:
+    # let the renderer report any problem with the policy.
+    logging.debug('unable to compute digest of %s: %s', input_file, e)
+    return None
 
 
 def RenderACL(acl_text, acl_suffix, output_directory, input_file, write_files):
@@ -331,90 +790,238 @@ def RenderACL(acl_text, acl_suffix, output_directory, input_file, write_files):
     output_directory: The directory to write the output file
     input_file: The name of the policy file that was used to render ACL
     write_files: a list of file tuples, (output_file, acl_text), to write
+
+  Returns:
+    the name of the output file.
   """
+  input_name = os.path.basename(input_file)
+  if input_name.endswith('.gz'):
+    input_name = input_name[:-len('.gz')]
   output_file = os.path.join(output_directory, '%s%s') % (
-      os.path.splitext(os.path.basename(input_file))[0], acl_suffix)
+      os.path.splitext(input_name)[0], acl_suffix)
 
-  if FilesUpdated(output_file, acl_text):
+  with profiling.Stage('diff'):
+    updated = FilesUpdated(output_file, acl_text)
+  if updated:
     logging.info('file changed: %s', output_file)
     write_files.append((output_file, acl_text))
+  elif (FLAGS.dedup_outputs and
+        not aclstore.IsLinked(output_file, FLAGS.dedup_outputs)):
+    logging.info('file not deduplicated yet: %s', output_file)
+    write_files.append((output_file, acl_text))
   else:
     logging.debug('file not changed: %s', output_file)
+  return output_file
 
 
-def FilesUpdated(file_name, file_string):
-  """Diff the rendered acl with what's already on disk."""
+def _P4Tags(line):
+  """Whether line contains a p4 keyword, which we ignore when comparing."""
+  return ('$I d:'.replace(' ', '') in line or
+          '$Da te:'.replace(' ', '') in line or
+          '$Rev ision:'.replace(' ', '') in line)
+
+
+def _TextDigest(lines):
+  """Digest of a list of lines, as returned by SkipLines."""
+  return hashlib.sha1('\n'.join(lines)).hexdigest()
+
+
+def _DigestFile(file_name):
+  """The name of the sidecar file holding the digest of file_name."""
+  return file_name + '.digest'
+
+
+def _ReadDigest(file_name):
+  """Return the sidecar digest of file_name, if it is still valid.
+
+  The sidecar records the size and mtime of file_name when it was written, so
+  a file changed behind our back (e.g. by a p4 sync) invalidates it.
+
+  Args:
+    file_name: the rendered acl file.
+
+  Returns:
+    the digest string, or None.
+  """
   try:
-    conf = open(file_name).read()
-  except IOError:
-    return True
+    digest, size, mtime = open(_DigestFile(file_name)).read().split()
+    stat = os.stat(file_name)
+  except (IOError, OSError, ValueError):
+    return None
+  if int(size) != stat.st_size or mtime != repr(stat.st_mtime):
+    return None
+  return digest
 
-  p4_id = '$I d:'.replace(' ', '')
-  p4_date = '$Da te:'.replace(' ', '')
-  p4_revision = '$Rev ision:'.replace(' ', '')
 
-  p4_tags = lambda x: p4_id in x or p4_date in x or p4_revision in x
+def _WriteDigest(file_name, digest):
+  """Record digest as the sidecar digest of file_name."""
+  try:
+    stat = os.stat(file_name)
+    with open(_DigestFile(file_name), 'w') as f:
+      f.write('%s %d %r\n' % (digest, stat.st_size, stat.st_mtime))
+  except (IOError, OSError) as e:
+    logging.debug('unable to write digest of %s: %s', file_name, e)
 
-  checked_in_text = SkipLines(conf.split('\n'), skip_line_func=p4_tags)
-  new_text = SkipLines(file_string.split('\n'), skip_line_func=p4_tags)
 
-  diff = difflib.unified_diff(checked_in_text, new_text)
+def FilesUpdated(file_name, file_string):
+  """Compare the rendered acl with what's already on disk, ignoring p4 tags.
+
+  With --output_digests the comparison uses the sidecar digest of file_name
+  when it is valid, so the old output need not be read at all.
 
-  # why oh why is it so hard to simply tell if two strings/lists are different?
-  if not difflib.IS_CHARACTER_JUNK(''.join(diff)):
-    logging.debug('\n'.join(diff))
+  Args:
+    file_name: the rendered acl file.
+    file_string: the newly rendered acl text.
+
+  Returns:
+    True if file_name needs to be written.
+  """
+  new_text = SkipLines(file_string.split('\n'), skip_line_func=_P4Tags)
+  if FLAGS.output_digests:
+    digest = _ReadDigest(file_name)
+    if digest is not None:
+      return digest != _TextDigest(new_text)
+
+  try:
+    conf = open(file_name).read()
+  except IOError:
     return True
 
-  return False
+  checked_in_text = SkipLines(conf.split('\n'), skip_line_func=_P4Tags)
+  if checked_in_text == new_text:
+    if FLAGS.output_digests:
+      _WriteDigest(file_name, _TextDigest(new_text))
+    return False
 
+  if logging.getLogger().isEnabledFor(logging.DEBUG):
+    logging.debug('\n'.join(difflib.unified_diff(checked_in_text, new_text,
+                                                 lineterm='')))
+  return True
 
-def DescendRecursively(input_dirname, output_dirname, definitions, depth=1):
-  """Recursively descend from input_dirname looking for policy files to render.
+
+def DescendRecursively(input_dirname, output_dirname, definitions):
+  """Find the policy files to render below input_dirname.
 
   Args:
     input_dirname: the base directory.
     output_dirname: where to place the rendered files.
     definitions: naming.Naming object
-    depth: integer, used for outputing '---> rendering prod/corp-backbone.jcl'
 
   Returns:
     the files that were found
   """
   # p4 complains if you try to edit a file like ./corp//corp-isp.jcl
-  input_dirname = input_dirname.rstrip('/')
   output_dirname = output_dirname.rstrip('/')
 
+  index = None
+  if FLAGS.discovery_index:
+    index = discovery.LoadIndex(FLAGS.discovery_index)
   files = []
-  # calling all directories
-  for curdir in [x for x in dircache.listdir(input_dirname) if
-                 os.path.isdir(input_dirname + '/' + x)]:
-    # be on the lookout for a policy directory
-    if curdir == 'pol':
-      for input_file in [x for x in dircache.listdir(input_dirname + '/pol')
-                         if x.endswith('.pol')]:
-        files.append({'in_file': os.path.join(input_dirname, 'pol', input_file),
-                      'out_dir': output_dirname,
-                      'defs': definitions})
-    else:
-      # so we don't have a policy directory, we should check if this new
-      # directory has a policy directory
-      if curdir in FLAGS.ignore_directories:
-        continue
-      logging.warn('-' * (2 * depth) + '> %s' % (
-          input_dirname + '/' + curdir))
-      files_found = DescendRecursively(input_dirname + '/' + curdir,
-                                       output_dirname + '/' + curdir,
-                                       definitions, depth + 1)
-      logging.warn('-' * (2 * depth) + '> %s (%d pol files found)' % (
-          input_dirname + '/' + curdir, len(files_found)))
-      files.extend(files_found)
-
+  for input_file, rel_dir in discovery.FindPolicies(
+      input_dirname, FLAGS.ignore_directories,
+      workers=FLAGS.discovery_threads, index=index):
+    out_dir = output_dirname
+    if rel_dir:
+      out_dir = '/'.join([output_dirname, rel_dir])
+    files.append({'in_file': input_file,
+                  'out_dir': out_dir,
+                  'defs': definitions})
+  if FLAGS.discovery_index:
+    discovery.SaveIndex(FLAGS.discovery_index, index)
+  logging.info('found %d policies', len(files))
   return files
 
 
-# TODO(robankeny): Clean up this area to make it easier to abstract our writer.
+def ShardPolicies(pols):
+  """Keep the policies assigned to --shard_index.
+
+  Args:
+    pols: the policies found by DescendRecursively.
+
+  Returns:
+    the policies of this shard, in their original order.
+  """
+  keys = dict((os.path.relpath(x.get('in_file'), FLAGS.base_directory), x)
+              for x in pols)
+  costs = None
+  if FLAGS.shard_balance:
+    costs = dict((key, schedule.ScanUnits(x.get('in_file'), None))
+                 for key, x in keys.items())
+  shards = shard.Assign(keys, FLAGS.shard_count, costs)
+  selected = [x for x in pols if shards[os.path.relpath(
+      x.get('in_file'), FLAGS.base_directory)] == FLAGS.shard_index]
+  logging.info('shard %d of %d: %d of %d policies', FLAGS.shard_index,
+               FLAGS.shard_count, len(selected), len(pols))
+  return selected
+
+
+def ChangedPolicies(pols, definitions):
+  """Keep the policies affected by the changes since --changed_since.
+
+  Every policy is kept if the changes can't be listed, or if the renderer
+  itself changed.  A policy whose references can't be read is always kept.
+
+  Args:
+    pols: the policies found by DescendRecursively.
+    definitions: the current naming.Naming object.
+
+  Returns:
+    a tuple of the policies to render, in their original order, and the set
+    of the unaffected policies among them sampled by --changed_verify.
+  """
+  try:
+    changed = changes.ChangedFiles(FLAGS.changed_since, FLAGS.base_directory)
+  except changes.Error as e:
+    logging.warn('rendering every policy, unable to list changes: %s', e)
+    return pols, set()
+  lib_directory = os.path.dirname(os.path.realpath(changes.__file__))
+  renderer = os.path.splitext(os.path.realpath(__file__))[0] + '.py'
+  if any(os.path.dirname(x) == lib_directory or x == renderer
+         for x in changed):
+    logging.info('rendering every policy, the renderer changed since %s',
+                 FLAGS.changed_since)
+    return pols, set()
+
+  index = watch.DependencyIndex(FLAGS.base_directory)
+  for x in pols:
+    index.Update(x.get('in_file'))
+  old_definitions = None
+  definitions_directory = os.path.realpath(FLAGS.definitions_directory)
+  if any(x.startswith(definitions_directory + os.sep) for x in changed):
+    try:
+      old_definitions = changes.DefinitionsAt(FLAGS.changed_since,
+                                              FLAGS.definitions_directory)
+    except (changes.Error, naming.Error) as e:
+      logging.warn('rendering every policy, unable to read definitions at '
+                   '%s: %s', FLAGS.changed_since, e)
+      return pols, set()
+  affected = changes.Affected(index, changed, old_definitions, definitions)
+  if index.Unscanned():
+    logging.info('rendering %d policies with unreadable references',
+                 len(index.Unscanned()))
+  # the index doesn't follow the variables of templates.
+  affected.update(x.get('in_file') for x in pols
+                  if template.IsTemplate(x.get('in_file')))
+
+  unaffected = sorted(x.get('in_file') for x in pols
+                      if x.get('in_file') not in affected)
+  verify = set(random.sample(unaffected,
+                             min(FLAGS.changed_verify, len(unaffected))))
+  logging.info('%d of %d policies affected by changes since %s',
+               len(pols) - len(unaffected), len(pols), FLAGS.changed_since)
+  return [x for x in pols if x.get('in_file') in affected or
+          x.get('in_file') in verify], verify
+
+
+def _OutputWritten(output_file, file_string):
+  """Called once a rendered acl has been written to disk."""
+  if FLAGS.output_digests:
+    _WriteDigest(output_file, _TextDigest(
+        SkipLines(file_string.split('\n'), skip_line_func=_P4Tags)))
+
+
 def WriteFiles(write_files):
-  """Writes files to disk.
+  """Atomically writes files to disk.
 
   Args:
     write_files: List of file names and strings.
@@ -423,18 +1030,215 @@ def WriteFiles(write_files):
     logging.info('writing %d files to disk...', len(write_files))
   else:
     logging.info('no files changed, not writing to disk')
+  try:
+    aclwriter.WriteFiles(write_files, fsync=FLAGS.fsync, store=_ACL_STORE)
+  except aclwriter.WriteError as e:
+    logging.warn('%s', e)
+    raise
   for output_file, file_string in write_files:
-    try:
-      output = open(output_file, 'w')
-    except IOError:
-      logging.warn('error while writing file: %s', output_file)
-      raise
-    logging.info('writing file: %s', output_file)
-    output.write(file_string)
-    output.flush()
+    _OutputWritten(output_file, file_string)
+  if write_files and _ACL_STORE is not None:
+    _ACL_STORE.Save()
+
+
+def MemoryReport(memory, pool):
+  """Report the memory used by the rendering tasks of a run.
+
+  Args:
+    memory: dict of task key to the stats of the task, see renderpool.
+    pool: the renderpool.RenderPool which ran the tasks.
+
+  Returns:
+    a dict with the highest 'peak_rss' of the tasks, under 'largest' the
+    --profile_top tasks which grew their process the most, and the counts of
+    processes 'recycled' and 'died' and of tasks 'throttled' by the pool.
+  """
+  largest = sorted(memory.items(), key=lambda x: (-x[1]['growth'], x[0]))
+  return {'peak_rss': max([x['peak_rss'] for x in memory.values()] or [0]),
+          'largest': [{'task': key, 'peak_rss': x['peak_rss'],
+                       'growth': x['growth']}
+                      for key, x in largest[:FLAGS.profile_top]],
+          'recycled': pool.recycled, 'died': pool.died,
+          'throttled': pool.throttled,
+          'peak_admitted': pool.peak_admitted}
+
+
+def MemorySummary(report):
+  """Return the lines of a human readable summary of a MemoryReport."""
+  lines = ['renderers: peak RSS %d MiB, %d replaced, %d died, %d tasks '
+           'waited for the memory budget' % (
+               report['peak_rss'] / _MIB, report['recycled'], report['died'],
+               report['throttled'])]
+  for task in report['largest'][:3]:
+    lines.append('%6d MiB peak, grew %d MiB  %s' % (
+        task['peak_rss'] / _MIB, task['growth'] / _MIB, task['task']))
+  return lines
+
+
+def SaveTrace(trace_file):
+  """Save the trace of the run, and log how busy the renderers were."""
+  events = profiling.CollectTrace()
+  names = {os.getpid(): 'aclgen'}
+  for pid in sorted(set(x['pid'] for x in events) - set(names)):
+    names[pid] = 'renderer %d' % len(names)
+  profiling.SaveTrace(trace_file, events, names)
+  summary = profiling.TraceSummary(events)
+  logging.info('trace: %d renderers busy %.0f%% of %.2fs, written to %s',
+               summary['processes'], summary['busy'] * 100,
+               summary['seconds'], trace_file)
+
+
+def _DefinitionsVersion(definitions_directory):
+  """The names and mtimes of the definition files, to notice changes."""
+  version = []
+  for pattern in ('*.net', '*.net.gz', '*.svc', '*.svc.gz'):
+    for file_name in glob.glob(os.path.join(definitions_directory, pattern)):
+      try:
+        version.append((file_name, os.stat(file_name).st_mtime))
+      except OSError:
+        pass
+  return sorted(version)
+
+
+def Serve(socket_path, definitions):
+  """Answer render and check requests on a Unix socket until shut down.
+
+  Requests name a 'policy_file'; render requests may also give an
+  'output_directory' and set 'dry_run' to only report the changed files.
+  The definitions are parsed again when a definition file changes.
+
+  Args:
+    socket_path: path of the Unix socket.
+    definitions: the definitions from naming.Naming().
+  """
+  state = {'definitions': definitions,
+           'version': _DefinitionsVersion(FLAGS.definitions_directory)}
+
+  def _Definitions():
+    version = _DefinitionsVersion(FLAGS.definitions_directory)
+    if version != state['version']:
+      logging.info('definitions changed, reloading')
+      state['definitions'] = naming.Naming(FLAGS.definitions_directory)
+      state['version'] = version
+    return state['definitions']
+
+  def _Render(request):
+    write_files = []
+    outputs = RenderFile(
+        str(request['policy_file']),
+        str(request.get('output_directory', FLAGS.output_directory)),
+        _Definitions(), request.get('exp_info', FLAGS.exp_info), write_files)
+    if not request.get('dry_run'):
+      WriteFiles(write_files)
+    return {'outputs': outputs, 'changed': [x for x, _ in write_files]}
+
+  def _Check(request):
+    pol = ParsePolicyFile(str(request['policy_file']), _Definitions())
+    if pol is None:
+      return {'shaded': True, 'platforms': [], 'terms': 0}
+    return {'shaded': False, 'platforms': PolicyPlatforms(pol),
+            'terms': sum(len(terms) for _, terms in pol.filters)}
+
+  server = renderd.Server(socket_path, {'render': _Render, 'check': _Check})
+  logging.info('serving on %s', socket_path)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+  logging.info('served %d requests, %d errors, in %.2fs', server.requests,
+               server.errors, server.seconds)
+
+
+def _WatchedPolicies(discovery_index):
+  """Return a dict of the policies to watch to their output directory."""
+  if FLAGS.policy_file:
+    return {FLAGS.policy_file: FLAGS.output_directory}
+  output_dirname = FLAGS.output_directory.rstrip('/')
+  policies = {}
+  for input_file, rel_dir in discovery.FindPolicies(
+      FLAGS.base_directory, FLAGS.ignore_directories,
+      workers=FLAGS.discovery_threads, index=discovery_index):
+    policies[input_file] = output_dirname
+    if rel_dir:
+      policies[input_file] = '/'.join([output_dirname, rel_dir])
+  return policies
+
+
+def Watch(definitions, polls=None):
+  """Render again the policies affected by changes to their inputs.
+
+  Policies, their includes and the definition files are polled every
+  --watch_interval seconds.  Affected policies are rendered in this process,
+  which keeps the definitions and the policy parser warm.
+
+  Args:
+    definitions: the definitions from naming.Naming().
+    polls: number of polls before returning, forever if None.
+  """
+  discovery_index = {}
+  policies = _WatchedPolicies(discovery_index)
+  index = watch.DependencyIndex(FLAGS.base_directory)
+  for input_file in policies:
+    index.Update(input_file)
+  def_files = set(x for x, _ in
+                  _DefinitionsVersion(FLAGS.definitions_directory))
+  snapshot = watch.Snapshot(index.Files() | def_files)
+  logging.info('watching %d policies', len(policies))
+
+  while polls is None or polls > 0:
+    if polls is not None:
+      polls -= 1
+    time.sleep(FLAGS.watch_interval)
+    new_policies = _WatchedPolicies(discovery_index)
+    old_def_files = def_files
+    def_files = set(x for x, _ in
+                    _DefinitionsVersion(FLAGS.definitions_directory))
+    new_snapshot = watch.Snapshot(
+        index.Files() | set(new_policies) | def_files)
+    changed = watch.Changed(snapshot, new_snapshot)
+    snapshot = new_snapshot
+    if not changed and set(new_policies) == set(policies):
+      continue
+    start = time.time()
+
+    affected = set(new_policies) - set(policies)
+    for input_file in set(policies) - set(new_policies):
+      index.Remove(input_file)
+    policies = new_policies
+
+    networks = services = ()
+    if changed & (def_files | old_def_files):
+      try:
+        new_definitions = naming.Naming(FLAGS.definitions_directory)
+      except naming.Error as e:
+        logging.warn('not reloading definitions: %s', e)
+      else:
+        networks, services = watch.ChangedTokens(
+            definitions, new_definitions, *index.Tokens())
+        definitions = new_definitions
+    affected |= index.Affected(changed, networks, services)
+
+    write_files = []
+    for input_file in sorted(affected):
+      index.Update(input_file)
+      logging.info('rendering %s', input_file)
+      try:
+        RenderFile(input_file, policies[input_file], definitions,
+                   FLAGS.exp_info, write_files)
+      except (ACLParserError, ACLGeneratorError, IOError) as e:
+        logging.warn('\n\nerror encountered in rendering process:\n%s\n\n', e)
+    WriteFiles(write_files)
+    # includes may have been added.
+    snapshot.update(watch.Snapshot(index.Files() - set(snapshot)))
+    logging.info('rendered %d policies in %.2fs', len(affected),
+                 time.time() - start)
 
 
 def main(_):
+  global _RENDER_CACHE
+  global _ACL_STORE
   logging.debug('binary: %s\noptimize: %d\base_directory: %s\n'
                 'policy_file: %s\nrendered_acl_directory: %s',
                 str(sys.argv[0]),
@@ -443,50 +1247,237 @@ def main(_):
                 str(FLAGS.policy_file),
                 str(FLAGS.output_directory))
 
+  if not 0 <= FLAGS.shard_index < FLAGS.shard_count:
+    logging.fatal('bad shard: --shard_index must be between 0 and '
+                  '--shard_count - 1')
+    sys.exit(1)
+
+  unknown = set(FLAGS.platforms) - set(_PLATFORMS)
+  if unknown:
+    logging.fatal('bad platforms: %s', ', '.join(sorted(unknown)))
+    sys.exit(1)
+
+  if FLAGS.profile_report or FLAGS.trace_file:
+    profiling.Enable()
+  if FLAGS.trace_file:
+    profiling.EnableTrace()
+
   definitions = None
   try:
     definitions = naming.Naming(FLAGS.definitions_directory)
   except naming.NoDefinitionsError:
     logging.fatal('bad definitions directory: %s', FLAGS.definitions_directory)
 
-  # thead-safe list for storing files to write
-  manager = multiprocessing.Manager()
-  write_files = manager.list()
+  if FLAGS.render_cache:
+    _RENDER_CACHE = rendercache.RenderCache(
+        FLAGS.render_cache, max_bytes=FLAGS.render_cache_size * 1024 * 1024)
+
+  if FLAGS.dedup_outputs:
+    try:
+      _ACL_STORE = aclstore.AclStore(
+          os.path.join(FLAGS.output_directory, '.aclstore'),
+          FLAGS.dedup_outputs)
+    except (aclstore.Error, OSError) as e:
+      logging.fatal('bad --dedup_outputs: %s', e)
+      sys.exit(1)
+
+  if FLAGS.serve:
+    Serve(FLAGS.serve, definitions)
+    return
+
+  manifest_entries = None
+  digests = {}
+  if FLAGS.manifest_file:
+    manifest_entries = manifest.Load(FLAGS.manifest_file)
 
   with_errors = False
+  writes = {'files': 0, 'bytes': 0, 'seconds': 0.0}
+  memory_report = None
   if FLAGS.policy_file:
     # render just one file
     logging.info('rendering one file')
-    RenderFile(FLAGS.policy_file, FLAGS.output_directory, definitions,
-               FLAGS.exp_info, write_files)
+    if manifest_entries is not None:
+      digests[FLAGS.policy_file] = PolicyDigest(
+          FLAGS.policy_file, FLAGS.output_directory, definitions)
+    if manifest.IsCurrent(manifest_entries or {}, FLAGS.policy_file,
+                          digests.get(FLAGS.policy_file)):
+      logging.info('policy not changed: %s', FLAGS.policy_file)
+    else:
+      write_files = []
+      with profiling.Span(_TaskKey(FLAGS.policy_file, None), 'task'):
+        outputs = RenderFile(FLAGS.policy_file, FLAGS.output_directory,
+                             definitions, FLAGS.exp_info, write_files)
+      start = time.time()
+      WriteFiles(write_files)
+      writes = {'files': len(write_files),
+                'bytes': sum(len(x) for _, x in write_files),
+                'seconds': time.time() - start}
+      if manifest_entries is not None and outputs is not None:
+        manifest.Record(manifest_entries, FLAGS.policy_file,
+                        digests.get(FLAGS.policy_file), outputs)
   else:
     # render all files in parallel
     logging.info('finding policies...')
     pols = []
-    pols.extend(DescendRecursively(FLAGS.base_directory, FLAGS.output_directory,
-                                   definitions))
+    with profiling.Span('discover'):
+      pols.extend(DescendRecursively(FLAGS.base_directory,
+                                     FLAGS.output_directory, definitions))
+    if FLAGS.shard_count > 1:
+      pols = ShardPolicies(pols)
+    if manifest_entries is not None:
+      # policies deleted, or assigned to another shard, since the last run.
+      for input_file in manifest.Prune(manifest_entries,
+                                       [x.get('in_file') for x in pols]):
+        logging.info('dropped %s from the manifest', input_file)
+    verify = set()
+    if FLAGS.changed_since:
+      pols, verify = ChangedPolicies(pols, definitions)
+
+    if manifest_entries is not None:
+      changed_pols = []
+      for x in pols:
+        digest = PolicyDigest(x.get('in_file'), x.get('out_dir'), definitions)
+        if manifest.IsCurrent(manifest_entries, x.get('in_file'), digest):
+          logging.debug('policy not changed: %s', x.get('in_file'))
+          continue
+        digests[x.get('in_file')] = digest
+        changed_pols.append(x)
+      logging.info('%d of %d policies changed', len(changed_pols), len(pols))
+      pols = changed_pols
 
-    pool = multiprocessing.Pool(processes=FLAGS.max_renderers)
-    results = []
+    # rendered files are written from a separate thread as they arrive.
+    writer = aclwriter.AclWriter(fsync=FLAGS.fsync,
+                                 written_callback=_OutputWritten,
+                                 store=_ACL_STORE)
+    pool = renderpool.RenderPool(
+        FLAGS.max_renderers, _RenderWorkerFile, initializer=_InitRenderer,
+        initargs=(definitions,), max_tasks=FLAGS.renderer_max_tasks,
+        max_rss=FLAGS.renderer_max_rss * _MIB,
+        memory_budget=FLAGS.render_memory_budget * _MIB,
+        fork_lock=writer.lock)
+    # one task per (policy, platform), so a large multi-target policy is spread
+    # over the pool; workers return their rendered files, which are written as
+    # they arrive.
+    tasks = []
+    pending = {}
     for x in pols:
-      results.append(pool.apply_async(RenderFile,
-                                      args=(x.get('in_file'),
-                                            x.get('out_dir'),
-                                            definitions,
-                                            FLAGS.exp_info,
-                                            write_files)))
-    pool.close()
-    pool.join()
-
-    for result in results:
-      try:
-        result.get()
-      except (ACLParserError, ACLGeneratorError) as e:
+      platforms = ScanPlatforms(x.get('in_file'))
+      pending[x.get('in_file')] = len(platforms)
+      for p in platforms:
+        tasks.append(schedule.Task(
+            _TaskKey(x.get('in_file'), p),
+            schedule.ScanUnits(x.get('in_file'), p and 1),
+            (x.get('in_file'), x.get('out_dir'), FLAGS.exp_info, p),
+            group=x.get('in_file')))
+
+    # submit the most expensive policies first, so the pool stays balanced,
+    # the tasks of a policy together, so _WorkerPolicy parses it once.
+    timings = {}
+    if FLAGS.render_timings_file:
+      timings = schedule.LoadTimings(FLAGS.render_timings_file)
+    schedule.Estimate(tasks, timings)
+    schedule.EstimateMemory(tasks, timings)
+    tasks = schedule.LptOrder(tasks)
+    predicted = schedule.PredictMakespan(tasks, FLAGS.max_renderers)
+    units = dict((x.key, x.units) for x in tasks)
+
+    start = time.time()
+    writer.start()
+    policy_outputs = {}
+    incomplete = set()
+    memory = {}
+    for args, result, stats in pool.Run([(x.args, x.memory) for x in tasks]):
+      if result is None:
+        result = (args[0], args[3], None, [], stats['error'], 0.0, {}, {}, [])
+      (in_file, platform, outputs, changed_files, error, seconds, profile,
+       cache_stats, trace) = result
+      if 'growth' in stats:
+        memory[_TaskKey(in_file, platform)] = stats
+        logging.debug('%s: peak RSS %d MiB, grew %d MiB',
+                      _TaskKey(in_file, platform), stats['peak_rss'] / _MIB,
+                      stats['growth'] / _MIB)
+        if (FLAGS.render_memory_budget and
+            stats['growth'] > FLAGS.render_memory_budget * _MIB):
+          logging.warn('%s grew its renderer by %d MiB, above the memory '
+                       'budget', _TaskKey(in_file, platform),
+                       stats['growth'] / _MIB)
+      profiling.Merge(profile)
+      profiling.MergeTrace(trace)
+      if _RENDER_CACHE is not None:
+        _RENDER_CACHE.Merge(cache_stats)
+      pending[in_file] -= 1
+      if not error:
+        timings[_TaskKey(in_file, platform)] = {
+            'seconds': seconds, 'units': units[_TaskKey(in_file, platform)],
+            'memory': stats['growth']}
+      if error:
         with_errors = True
-        logging.warn('\n\nerror encountered in rendering process:\n%s\n\n', e)
+        if in_file not in incomplete:
+          logging.warn('\n\nerror encountered in rendering process:\n%s\n\n',
+                       error)
+        incomplete.add(in_file)
+      elif outputs is None:
+        incomplete.add(in_file)
+      else:
+        policy_outputs.setdefault(in_file, []).extend(outputs)
+      if changed_files and in_file in verify:
+        logging.warn('%s changed but is not affected by the changes since %s',
+                     in_file, FLAGS.changed_since)
+      writer.Write(changed_files)
+      # policies without a digest are recorded too, for merging shards.
+      if (manifest_entries is not None and not pending[in_file] and
+          in_file not in incomplete):
+        manifest.Record(manifest_entries, in_file, digests.get(in_file),
+                        policy_outputs.get(in_file, []))
+    pool.Close()
+    writer.Close()
+    writes = {'files': writer.files, 'bytes': writer.bytes,
+              'seconds': writer.seconds}
+    if writer.files:
+      logging.info(writer.Stats())
+    else:
+      logging.info('no files changed, not writing to disk')
+    if tasks:
+      logging.info('rendered %d tasks, predicted makespan %.2fs, actual %.2fs',
+                   len(tasks), predicted, time.time() - start)
+    memory_report = MemoryReport(memory, pool)
+    for line in MemorySummary(memory_report):
+      logging.info(line)
+    if FLAGS.render_timings_file:
+      schedule.SaveTimings(FLAGS.render_timings_file, timings)
+
+  if manifest_entries is not None:
+    manifest.Save(FLAGS.manifest_file, manifest_entries)
+
+  if _ACL_STORE is not None:
+    removed = _ACL_STORE.Save()
+    logging.info('%s, %d unused objects removed', _ACL_STORE.Stats(), removed)
+
+  if _RENDER_CACHE is not None:
+    stats = dict(_RENDER_CACHE.stats)
+    totals = _RENDER_CACHE.Flush()
+    logging.info('render cache: %d hits, %d misses, %d stored, %d evicted '
+                 '(%d hits, %d misses in total)', stats['hits'],
+                 stats['misses'], stats['puts'], stats['evictions'],
+                 totals['hits'], totals['misses'])
+
+  if FLAGS.profile_report:
+    report = profiling.Report(profiling.Collect(), FLAGS.profile_top)
+    # writes are batched across policies, so they're only reported per run.
+    report['write'] = writes
+    if memory_report is not None:
+      report['memory'] = memory_report
+    profiling.Save(FLAGS.profile_report, report)
+    for line in profiling.Summary(report):
+      logging.info(line)
+    logging.info('write %9.3fs  %d files, %d bytes', writes['seconds'],
+                 writes['files'], writes['bytes'])
+
+  if FLAGS.trace_file:
+    SaveTrace(FLAGS.trace_file)
 
-  # actually write files to disk
-  WriteFiles(write_files)
+  if FLAGS.watch:
+    Watch(definitions)
 
   if with_errors:
     logging.warn('done, with errors.')
@@ -20,6 +20,7 @@ import re
 from string import Template
 
 from lib import policy
+from lib import profiling
 
 
 # generic error class
@@ -299,7 +300,8 @@ class ACLGenerator(object):
                                      self._PLATFORM))
         continue
 
-    self._TranslatePolicy(pol, exp_info)
+    with profiling.Stage('translate_policy'):
+      self._TranslatePolicy(pol, exp_info)
 
   def _TranslatePolicy(self, pol, exp_info):
     # pylint: disable=unused-argument
@@ -0,0 +1,262 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""A content-addressed store of rendered ACLs, deduplicating outputs.
+
+Many devices receive byte identical ACLs.  With a store, every distinct
+rendered text is written once, as an object named after its digest, and
+every output is a hard link or a symbolic link to its object.  Outputs are
+still replaced atomically: the link is created under a temporary name and
+renamed over the output, so replacing one output never changes the others
+sharing its object.  An output edited in place, however, changes them all.
+
+The store's manifest.json lists, for every object, the outputs sharing it.
+Saving the store drops the outputs no longer linked to their object, e.g.
+rewritten without the store, and removes the objects no output uses.
+
+Sample usage:
+    store = aclstore.AclStore('filters/.aclstore', aclstore.HARDLINK)
+    aclwriter.WriteFiles([('filters/foo.jcl', acl_text), ...], store=store)
+    store.Save()
+    logging.info(store.Stats())
+"""
+
+__author__ = 'pmoody@google.com'
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import logging
+
+
+HARDLINK = 'hardlink'
+SYMLINK = 'symlink'
+MODES = (HARDLINK, SYMLINK)
+
+MANIFEST = 'manifest.json'
+# the manifest format, a change of which discards saved manifests.
+VERSION = 1
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+class UnknownModeError(Error):
+  """Raised when the store mode is neither HARDLINK nor SYMLINK."""
+
+
+def Digest(file_string):
+  return hashlib.sha1(file_string).hexdigest()
+
+
+def IsLinked(output_file, mode):
+  """Whether an output is already a link of the given mode into a store.
+
+  This is a cheap test, not checking which store or object the output is
+  linked to, used to tell the outputs left to move into a store.
+  """
+  try:
+    if mode == SYMLINK:
+      return os.path.islink(output_file)
+    return os.lstat(output_file).st_nlink > 1
+  except OSError:
+    return False
+
+
+class AclStore(object):
+  """A directory of rendered ACLs, linked to by the outputs.
+
+  Attributes:
+    directory: the store directory.
+    mode: HARDLINK or SYMLINK, how the outputs link to their object.
+    objects: number of objects written.
+    links: number of outputs linked.
+    saved_bytes: number of bytes not written, as their object existed.
+  """
+
+  def __init__(self, directory, mode=HARDLINK):
+    """Initializer.
+
+    Args:
+      directory: the store directory, created if needed.  With HARDLINK it
+        must be on the filesystem of the outputs.
+      mode: HARDLINK or SYMLINK.
+
+    Raises:
+      UnknownModeError: if mode is unknown.
+      OSError: if the directory can't be created.
+    """
+    if mode not in MODES:
+      raise UnknownModeError('unknown store mode %s, expected one of %s' %
+                             (mode, ', '.join(MODES)))
+    self.directory = directory
+    self.mode = mode
+    self.objects = 0
+    self.links = 0
+    self.saved_bytes = 0
+    self._lock = threading.Lock()
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    # dict of output file to the digest of its object.
+    self._outputs = {}
+    self._collect = self._Load()
+
+  def _Load(self):
+    """Load the manifest, returning whether unused objects can be removed."""
+    try:
+      with open(os.path.join(self.directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    except (IOError, ValueError) as e:
+      logging.debug('not using store manifest: %s', e)
+      # symbolic links to the objects of an empty store can't be lost.
+      return self.mode == HARDLINK or not self._Objects()
+    if manifest.get('version') != VERSION:
+      return self.mode == HARDLINK
+    for digest, outputs in manifest.get('objects', {}).items():
+      for output_file in outputs:
+        self._outputs[str(output_file)] = str(digest)
+    return manifest.get('mode') == self.mode
+
+  def _Objects(self):
+    return [x for x in os.listdir(self.directory)
+            if x != MANIFEST and not x.startswith('.')]
+
+  def ObjectFile(self, digest):
+    return os.path.join(self.directory, digest)
+
+  def Put(self, file_string, fsync=False, umask=0o022):
+    """Store a rendered ACL, unless an identical one is stored already.
+
+    Args:
+      file_string: the ACL text.
+      fsync: whether to fsync a new object.
+      umask: the umask applied to a new object.
+
+    Returns:
+      a tuple of the digest of the text and the path of its object.
+
+    Raises:
+      OSError, IOError: if the object can't be written.
+    """
+    digest = Digest(file_string)
+    object_file = self.ObjectFile(digest)
+    if os.path.exists(object_file):
+      with self._lock:
+        self.saved_bytes += len(file_string)
+      return digest, object_file
+    fd, temp_file = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+    try:
+      with os.fdopen(fd, 'w') as output:
+        output.write(file_string)
+        output.flush()
+        if fsync:
+          os.fsync(output.fileno())
+      os.chmod(temp_file, 0o666 & ~umask)
+      os.rename(temp_file, object_file)
+    except (IOError, OSError):
+      if os.path.exists(temp_file):
+        os.unlink(temp_file)
+      raise
+    with self._lock:
+      self.objects += 1
+    return digest, object_file
+
+  def Link(self, object_file, link_file):
+    """Create link_file, a new link to object_file."""
+    if self.mode == SYMLINK:
+      os.symlink(os.path.relpath(os.path.abspath(object_file),
+                                 os.path.dirname(os.path.abspath(link_file))),
+                 link_file)
+    else:
+      os.link(object_file, link_file)
+
+  def Record(self, output_file, digest):
+    """Record that output_file now links to the object of digest."""
+    with self._lock:
+      self._outputs[os.path.normpath(output_file)] = digest
+      self.links += 1
+
+  def _IsCurrent(self, output_file, digest):
+    """Whether output_file still links to the object of digest."""
+    object_file = self.ObjectFile(digest)
+    try:
+      if self.mode == SYMLINK:
+        return (os.path.islink(output_file) and
+                os.path.realpath(output_file) == os.path.realpath(object_file))
+      output_stat = os.lstat(output_file)
+      object_stat = os.stat(object_file)
+    except OSError:
+      return False
+    return (output_stat.st_ino == object_stat.st_ino and
+            output_stat.st_dev == object_stat.st_dev)
+
+  def Shared(self):
+    """Return a dict of digest to the sorted outputs sharing its object."""
+    objects = {}
+    with self._lock:
+      for output_file, digest in self._outputs.items():
+        objects.setdefault(digest, []).append(output_file)
+    return dict((digest, sorted(outputs))
+                for digest, outputs in objects.items() if len(outputs) > 1)
+
+  def Save(self):
+    """Save the manifest, and remove the objects no output links to.
+
+    Returns:
+      the number of objects removed.
+    """
+    with self._lock:
+      self._outputs = dict(x for x in self._outputs.items()
+                           if self._IsCurrent(*x))
+      objects = {}
+      for output_file, digest in self._outputs.items():
+        objects.setdefault(digest, []).append(output_file)
+      removed = 0
+      if self._collect:
+        for digest in self._Objects():
+          object_file = self.ObjectFile(digest)
+          try:
+            # a hard linked output may be missing from a lost manifest.
+            if (digest not in objects and
+                (self.mode == SYMLINK or os.stat(object_file).st_nlink == 1)):
+              os.unlink(object_file)
+              removed += 1
+          except OSError as e:
+            logging.warn('unable to remove %s: %s', object_file, e)
+      else:
+        logging.warn('not removing unused objects of %s, its manifest was '
+                     'missing or of another mode', self.directory)
+      manifest_file = os.path.join(self.directory, MANIFEST)
+      with open(manifest_file + '.tmp', 'w') as f:
+        json.dump({'version': VERSION, 'mode': self.mode,
+                   'objects': dict((x, sorted(y))
+                                   for x, y in objects.items())},
+                  f, indent=1, sort_keys=True)
+      os.rename(manifest_file + '.tmp', manifest_file)
+      self._collect = True
+    return removed
+
+  def Stats(self):
+    """Return a summary of the deduplication."""
+    with self._lock:
+      outputs = len(self._outputs)
+      objects = len(set(self._outputs.values()))
+    return ('store: %d outputs share %d objects, %d objects written, %d '
+            'outputs linked, %d bytes not written' % (
+                outputs, objects, self.objects, self.links, self.saved_bytes))
@@ -0,0 +1,229 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Atomic, batched writing of rendered ACLs.
+
+Every ACL is written to a temporary file in its destination directory and
+renamed over the destination, so a crash never leaves a half written ACL.
+AclWriter does this from a background thread, so that writing overlaps with
+rendering, batching the files queued while it was busy.  With an
+aclstore.AclStore, the temporary file is a link to the stored ACL instead, so
+identical ACLs are written once.
+
+Sample usage:
+    writer = aclwriter.AclWriter(fsync=True)
+    writer.start()
+    writer.Write([('filters/foo.jcl', acl_text), ...])
+    ...
+    writer.Close()
+    logging.info(writer.Stats())
+"""
+
+__author__ = 'pmoody@google.com'
+
+import errno
+import itertools
+import os
+import Queue
+import tempfile
+import threading
+import time
+
+from lib import profiling
+
+import logging
+
+
+# numbers the temporary links to an aclstore.AclStore object.
+_LINK_COUNTER = itertools.count()
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+class WriteError(Error):
+  """Raised when a rendered ACL can't be written."""
+
+
+def _Umask():
+  umask = os.umask(0)
+  os.umask(umask)
+  return umask
+
+
+def _LinkTemp(store, object_file, output_file):
+  """Link object_file under a new temporary name next to output_file."""
+  while True:
+    temp_file = os.path.join(
+        os.path.dirname(output_file) or '.', '.%s.%d.%d' % (
+            os.path.basename(output_file), os.getpid(), next(_LINK_COUNTER)))
+    try:
+      store.Link(object_file, temp_file)
+      return temp_file
+    except OSError as e:
+      # left behind by a crashed process with the same pid.
+      if e.errno != errno.EEXIST:
+        raise
+
+
+def WriteFiles(write_files, fsync=False, umask=None, store=None):
+  """Atomically write a batch of files.
+
+  All files are written to temporary files first, then, with fsync, flushed to
+  disk together before any is renamed over its destination.
+
+  Args:
+    write_files: list of (output_file, file_string) tuples.
+    fsync: whether to fsync the files and their directories.
+    umask: the umask applied to the new files, defaults to the process umask.
+    store: optional aclstore.AclStore the files are links to.
+
+  Raises:
+    WriteError: if a file can't be written.
+  """
+  if umask is None:
+    umask = _Umask()
+  temp_files = []
+  digests = []
+  try:
+    for output_file, file_string in write_files:
+      if store is not None:
+        digest, object_file = store.Put(file_string, fsync=fsync, umask=umask)
+        digests.append(digest)
+        temp_files.append(_LinkTemp(store, object_file, output_file))
+        continue
+      fd, temp_file = tempfile.mkstemp(
+          dir=os.path.dirname(output_file) or '.',
+          prefix='.%s.' % os.path.basename(output_file))
+      temp_files.append(temp_file)
+      with os.fdopen(fd, 'w') as output:
+        output.write(file_string)
+        output.flush()
+        if fsync:
+          os.fsync(output.fileno())
+      os.chmod(temp_file, 0o666 & ~umask)
+    for (output_file, _), temp_file in zip(write_files, temp_files):
+      logging.info('writing file: %s', output_file)
+      os.rename(temp_file, output_file)
+  except (IOError, OSError) as e:
+    for temp_file in temp_files:
+      if os.path.lexists(temp_file):
+        os.unlink(temp_file)
+    raise WriteError('error while writing file: %s' % e)
+  for (output_file, _), digest in zip(write_files, digests):
+    store.Record(output_file, digest)
+  if fsync:
+    directories = set(os.path.dirname(x) or '.' for x, _ in write_files)
+    if store is not None and write_files:
+      directories.add(store.directory)
+    for directory in directories:
+      fd = os.open(directory, os.O_RDONLY)
+      try:
+        os.fsync(fd)
+      finally:
+        os.close(fd)
+
+
+class AclWriter(threading.Thread):
+  """A thread writing ACLs as they are queued.
+
+  Attributes:
+    files: number of files written.
+    bytes: number of bytes written.
+    seconds: time spent writing.
+    lock: held while a batch is written.  Holding it, no lock is held by the
+      writer thread, so that e.g. a new process can safely be forked.
+  """
+
+  def __init__(self, fsync=False, batch_size=64, written_callback=None,
+               store=None):
+    """Initializer.
+
+    Args:
+      fsync: whether to fsync each batch of files.
+      batch_size: maximum number of files written in one batch.
+      written_callback: optional function called with (output_file,
+        file_string) once a file is written.
+      store: optional aclstore.AclStore the files are links to.
+    """
+    threading.Thread.__init__(self, name='AclWriter')
+    self.daemon = True
+    self.files = 0
+    self.bytes = 0
+    self.seconds = 0.0
+    self._fsync = fsync
+    self._batch_size = batch_size
+    self._written_callback = written_callback
+    self._store = store
+    self._umask = _Umask()
+    self.lock = threading.Lock()
+    self._queue = Queue.Queue()
+    self._error = None
+
+  def Write(self, write_files):
+    """Queue a list of (output_file, file_string) tuples to be written."""
+    for write_file in write_files:
+      self._queue.put(write_file)
+
+  def Close(self):
+    """Wait for every queued file to be written.
+
+    Raises:
+      WriteError: if a file couldn't be written.
+    """
+    self._queue.put(None)
+    self.join()
+    if self._error:
+      raise self._error
+
+  def Stats(self):
+    """Return a summary of the write throughput."""
+    rate = 0.0
+    if self.seconds:
+      rate = self.bytes / self.seconds / 1024 / 1024
+    return 'wrote %d files, %d bytes in %.2fs (%.1f MiB/s)' % (
+        self.files, self.bytes, self.seconds, rate)
+
+  def run(self):
+    done = False
+    while not done:
+      batch = [self._queue.get()]
+      while len(batch) < self._batch_size:
+        try:
+          batch.append(self._queue.get_nowait())
+        except Queue.Empty:
+          break
+      if None in batch:
+        done = True
+        batch = [x for x in batch if x is not None]
+      if not batch or self._error:
+        continue
+      start = time.time()
+      try:
+        with self.lock:
+          with profiling.Span('write', 'write', {'files': len(batch)}):
+            WriteFiles(batch, fsync=self._fsync, umask=self._umask,
+                       store=self._store)
+          if self._written_callback:
+            for output_file, file_string in batch:
+              self._written_callback(output_file, file_string)
+      except Exception as e:  # pylint: disable=broad-except
+        # reported to the main thread by Close().
+        self._error = e
+        continue
+      self.seconds += time.time() - start
+      self.files += len(batch)
+      self.bytes += sum(len(x) for _, x in batch)
@@ -0,0 +1,140 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Finding the policies affected by the changes since a git revision.
+
+The files changed since the revision, committed or not, map to policies
+through a watch.DependencyIndex: a changed policy or include affects the
+policies reading it, and changed definitions affect the policies referencing
+a token whose expanded value differs from its value at the revision.  The
+policies whose references can't be read are always affected.
+
+Sample usage:
+    changed = changes.ChangedFiles('origin/master', './policies')
+    old_definitions = changes.DefinitionsAt('origin/master', './def')
+    affected = changes.Affected(index, changed, old_definitions, definitions)
+"""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+from lib import naming
+from lib import watch
+
+
+# the suffixes of the definitions files naming.Naming reads.
+_DEFINITION_SUFFIXES = ('.net', '.svc', '.net.gz', '.svc.gz')
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+class GitError(Error):
+  """Raised when a git command fails."""
+
+
+def _Git(args, cwd):
+  """Run a git command, returning its output."""
+  try:
+    process = subprocess.Popen(['git'] + args, cwd=cwd, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+  except OSError as e:
+    raise GitError('unable to run git: %s' % e)
+  output, error = process.communicate()
+  if process.returncode:
+    raise GitError('git %s failed: %s' % (' '.join(args), error.strip()))
+  return output
+
+
+def _TopLevel(directory):
+  return _Git(['rev-parse', '--show-toplevel'], directory).strip()
+
+
+def ChangedFiles(rev, directory='.'):
+  """Return the files changed since a revision, in the work tree.
+
+  Args:
+    rev: the git revision to compare to.
+    directory: a directory of the git work tree.
+
+  Returns:
+    the set of real paths of the files modified, added or removed since rev,
+    untracked files included.
+
+  Raises:
+    GitError: if git fails, e.g. if rev is unknown.
+  """
+  top = _TopLevel(directory)
+  files = _Git(['diff', '--name-only', '--no-renames', '-z', rev, '--'], top)
+  files += _Git(['ls-files', '--others', '--exclude-standard', '-z'], top)
+  return set(os.path.realpath(os.path.join(top, x))
+             for x in files.split('\0') if x)
+
+
+def DefinitionsAt(rev, definitions_directory):
+  """Load the definitions as they were at a revision.
+
+  Args:
+    rev: the git revision.
+    definitions_directory: the definitions directory, in the work tree.
+
+  Returns:
+    a naming.Naming object.
+
+  Raises:
+    GitError: if git fails.
+    naming.Error: if the definitions at rev can't be loaded.
+  """
+  top = _TopLevel(definitions_directory)
+  relative = os.path.relpath(os.path.realpath(definitions_directory), top)
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    for path in _Git(['ls-tree', '--name-only', '-z', rev, relative + '/'],
+                     top).split('\0'):
+      if path.endswith(_DEFINITION_SUFFIXES):
+        with open(os.path.join(tmp_dir, os.path.basename(path)), 'wb') as f:
+          f.write(_Git(['show', '%s:%s' % (rev, path)], top))
+    return naming.Naming(tmp_dir)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def Affected(index, changed_files, old_definitions=None,
+             new_definitions=None):
+  """Return the policies affected by changed files.
+
+  Args:
+    index: the watch.DependencyIndex of the policies.
+    changed_files: the real paths of the changed files.
+    old_definitions: the naming.Naming object before the changes, if the
+      definitions changed.
+    new_definitions: the naming.Naming object after the changes.
+
+  Returns:
+    the set of affected policy files, as named in index, including the
+    policies whose references can't be read.
+  """
+  by_path = dict((os.path.realpath(x), x) for x in index.Files())
+  changed = set(by_path[x] for x in changed_files if x in by_path)
+  networks = services = ()
+  if old_definitions is not None:
+    networks, services = watch.ChangedTokens(old_definitions, new_definitions,
+                                             *index.Tokens())
+  return index.Affected(changed, networks, services)
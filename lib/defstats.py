@@ -0,0 +1,201 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Statistics on naming definitions and what they cost to expand.
+
+A single token which expands to thousands of prefixes, or which is nested
+many levels deep, makes every policy term that references it expensive to
+render on every platform.  TokenReport() measures, for every network and
+service token:
+
+  expanded:    number of values once nested tokens are expanded.
+  collapsed:   (networks only) number of prefixes after CollapseAddrList.
+  depth:       nesting depth, 1 for a token holding only values.
+  token_fanin: number of tokens which directly include this token.
+  term_fanin:  number of policy terms which directly reference this token.
+  cost:        expanded * (1 + term_fanin), the values expanded on each render.
+
+Sample usage:
+    defs = naming.Naming('./def')
+    report = TokenReport(defs, ['policies/pol/sample.pol'], base_dir='.')
+    print json.dumps(report, indent=2)
+"""
+
+__author__ = 'watson@google.com (Tony Watson)'
+
+import os
+
+from lib import nacaddr
+from lib import naming
+from lib import policy
+from lib import policy_simple
+
+
+def _Value(item):
+  """Strip the comment from a naming item."""
+  return item.split('#')[0].strip()
+
+
+def ReadPolicyReferences(filename, base_dir='', max_depth=5):
+  """Find the includes and naming tokens referenced by a policy file.
+
+  The policy is read with policy_simple, so no definitions are expanded.
+
+  Args:
+    filename: path of the policy file.
+    base_dir: base path string where to look for include files.
+    max_depth: maximum depth of included files.
+
+  Returns:
+    A tuple (includes, terms): includes is the list of included file paths,
+    nested includes included; terms is a list of (term name, set of network
+    tokens, set of service tokens) for every term in the policy.
+
+  Raises:
+    policy.RecursionTooDeepError: nested include files exceed maximum.
+  """
+  if not max_depth:
+    raise policy.RecursionTooDeepError(
+        'Included files exceed maximum recursion depth.')
+  data = policy._ReadFile(filename)
+  pol = policy_simple.PolicyParser(data, filename).Parse()
+  includes = []
+  terms = []
+  for member in pol:
+    if isinstance(member, policy_simple.Include):
+      include_file = os.path.join(base_dir, member.identifier.strip('\'"'))
+      includes.append(include_file)
+      inc_includes, inc_terms = ReadPolicyReferences(include_file, base_dir,
+                                                     max_depth - 1)
+      includes.extend(inc_includes)
+      terms.extend(inc_terms)
+    elif isinstance(member, policy_simple.Term):
+      terms.append(TermReferences(member))
+  return includes, terms
+
+
+def TermReferences(term):
+  """Find the naming tokens referenced by a term.
+
+  Args:
+    term: a policy_simple.Term object.
+
+  Returns:
+    a tuple (term name, set of network tokens, set of service tokens).
+  """
+  networks = set()
+  services = set()
+  for field in term:
+    if isinstance(field, policy_simple.Address):
+      networks.update(field.value)
+    elif isinstance(field, policy_simple.NextIP):
+      networks.update(field.value.split())
+    elif isinstance(field, policy_simple.Port):
+      services.update(field.value)
+  return term.Name(), networks, services
+
+
+def _Depth(token, group, depths, seen=None):
+  """Return the nesting depth of token in group, memoized in depths."""
+  if token in depths:
+    return depths[token]
+  seen = seen or set()
+  seen.add(token)
+  depth = 1
+  for item in group[token].items:
+    value = _Value(item)
+    if value in group and value not in seen:
+      depth = max(depth, 1 + _Depth(value, group, depths, seen))
+  seen.discard(token)
+  depths[token] = depth
+  return depth
+
+
+def _GroupReport(group, expand, term_refs, collapse=False):
+  """Build the report for one naming group.
+
+  Args:
+    group: the networks or services dict of a naming.Naming object.
+    expand: function expanding a token into its list of values.
+    term_refs: dict of token to the number of terms referencing it.
+    collapse: whether to report the CollapseAddrList prefix count.
+
+  Returns:
+    dict of token name to statistics dict.
+  """
+  token_refs = {}
+  for token in group:
+    for value in set(_Value(x) for x in group[token].items):
+      if value in group:
+        token_refs[value] = token_refs.get(value, 0) + 1
+
+  depths = {}
+  report = {}
+  for token in group:
+    try:
+      values = expand(token)
+    except naming.Error:
+      continue
+    stats = {
+        'expanded': len(values),
+        'depth': _Depth(token, group, depths),
+        'token_fanin': token_refs.get(token, 0),
+        'term_fanin': term_refs.get(token, 0),
+    }
+    if collapse:
+      stats['collapsed'] = len(nacaddr.CollapseAddrList(values))
+    stats['cost'] = stats['expanded'] * (1 + stats['term_fanin'])
+    report[token] = stats
+  return report
+
+
+def TokenReport(definitions, policy_files=None, base_dir=''):
+  """Report expansion statistics for every token in definitions.
+
+  Args:
+    definitions: a naming.Naming object.
+    policy_files: optional list of policy files whose terms count as fan-in.
+    base_dir: base path string where to look for include files.
+
+  Returns:
+    A dict {'networks': {token: stats}, 'services': {token: stats}}, see the
+    module docstring for the statistics reported.
+  """
+  net_refs = {}
+  svc_refs = {}
+  for filename in policy_files or []:
+    _, terms = ReadPolicyReferences(filename, base_dir)
+    for _, networks, services in terms:
+      for token in networks:
+        net_refs[token] = net_refs.get(token, 0) + 1
+      for token in services:
+        svc_refs[token] = svc_refs.get(token, 0) + 1
+
+  return {
+      'networks': _GroupReport(definitions.networks, definitions.GetNet,
+                               net_refs, collapse=True),
+      'services': _GroupReport(definitions.services, definitions.GetService,
+                               svc_refs),
+  }
+
+
+def MostExpensive(report, count=10):
+  """Return the count most expensive (type, token, stats) in a report."""
+  tokens = []
+  for def_type in sorted(report):
+    for token, stats in report[def_type].items():
+      tokens.append((def_type, token, stats))
+  tokens.sort(key=lambda x: (-x[2]['cost'], x[1]))
+  return tokens[:count]
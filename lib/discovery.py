@@ -0,0 +1,199 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Discovery of the policy files under a base directory.
+
+Policies live in 'pol' directories anywhere below the base directory, and
+are rendered into the same relative directory of the output directory.
+
+Directories are listed with scandir when it is available, which gets the
+type of each entry from the directory itself (d_type) instead of a stat per
+entry.  The tree is walked one level at a time, and the directories of a
+level can be listed concurrently, which hides most of the latency of a
+network filesystem.
+
+With an index file, the listing of every directory is saved along with its
+mtime.  Creating, removing or renaming an entry changes the mtime of its
+directory, so on the next run only directories whose mtime changed are
+listed again; the others cost a single stat.
+
+Sample usage:
+    for in_file, rel_dir in discovery.FindPolicies('./policies', workers=8):
+      ...
+"""
+
+__author__ = 'pmoody@google.com'
+
+import json
+import os
+import time
+from multiprocessing import pool as mp_pool
+
+import logging
+
+try:
+  from os import scandir as _scandir  # pylint: disable=g-import-not-at-top
+except ImportError:
+  try:
+    from scandir import scandir as _scandir  # pylint: disable=g-import-not-at-top
+  except ImportError:
+    _scandir = None
+
+
+POLICY_DIRECTORY = 'pol'
+# policy files, and policy templates, see template.py.
+POLICY_SUFFIXES = ('.pol', '.pol.gz', '.tmpl')
+
+# listings of directories modified this recently are not trusted, as a
+# further change within the mtime granularity would go unnoticed.
+_RACY_SECONDS = 2
+
+
+def ListDirectory(dirname):
+  """List the subdirectories and files of a directory.
+
+  Args:
+    dirname: path of the directory.
+
+  Returns:
+    a tuple of the sorted lists of subdirectory names and of file names.
+  """
+  subdirs = []
+  files = []
+  if _scandir:
+    for entry in _scandir(dirname):
+      # is_dir() only stats symlinks and entries without a d_type.
+      if entry.is_dir():
+        subdirs.append(entry.name)
+      else:
+        files.append(entry.name)
+  else:
+    for name in os.listdir(dirname):
+      if os.path.isdir(os.path.join(dirname, name)):
+        subdirs.append(name)
+      else:
+        files.append(name)
+  return sorted(subdirs), sorted(files)
+
+
+def LoadIndex(index_file):
+  """Load a discovery index, returning an empty one if it cannot be read."""
+  try:
+    with open(index_file) as f:
+      return json.load(f)
+  except (IOError, ValueError) as e:
+    logging.debug('not using discovery index %s: %s', index_file, e)
+    return {}
+
+
+def SaveIndex(index_file, index):
+  """Atomically replace index_file with index."""
+  tmp_file = '%s.tmp' % index_file
+  with open(tmp_file, 'w') as f:
+    json.dump(index, f, sort_keys=True)
+  os.rename(tmp_file, index_file)
+
+
+class _Lister(object):
+  """Lists directories, through the index when it is current."""
+
+  def __init__(self, index):
+    self.old_index = index or {}
+    self.index = {}
+    self.start = time.time()
+
+  def __call__(self, dirname):
+    """Return the subdirectories and files of dirname.
+
+    Args:
+      dirname: path of the directory.
+
+    Returns:
+      a tuple (subdirs, files, listed), listed being False if the listing
+      came from the index.
+    """
+    try:
+      mtime = os.stat(dirname).st_mtime
+    except OSError as e:
+      logging.warn('cannot list %s: %s', dirname, e)
+      return [], [], False
+    entry = self.old_index.get(dirname)
+    if entry and entry['mtime'] == mtime:
+      self.index[dirname] = entry
+      return entry['subdirs'], entry['files'], False
+    logging.debug('listing %s', dirname)
+    subdirs, files = ListDirectory(dirname)
+    if mtime < self.start - _RACY_SECONDS:
+      self.index[dirname] = {'mtime': mtime, 'subdirs': subdirs,
+                             'files': files}
+    return subdirs, files, True
+
+
+def FindPolicies(base_dir, ignore_directories=(), workers=1, index=None):
+  """Find the policy files below base_dir.
+
+  Args:
+    base_dir: the base directory.
+    ignore_directories: names of directories not to descend into.
+    workers: number of directories listed concurrently.
+    index: optional dict loaded by LoadIndex, updated in place.
+
+  Returns:
+    a list of (policy file, directory relative to base_dir) tuples, in the
+    order of a depth-first walk of the sorted directories.
+  """
+  base_dir = base_dir.rstrip('/') or '/'
+  lister = _Lister(index)
+  thread_pool = None
+  if workers > 1:
+    thread_pool = mp_pool.ThreadPool(workers)
+  policies = []
+  directories = 0
+  listed = 0
+  try:
+    # (directory relative to base_dir, path, whether it's a policy directory)
+    level = [('', base_dir, False)]
+    while level:
+      paths = [x[1] for x in level]
+      if thread_pool:
+        listings = thread_pool.map(lister, paths)
+      else:
+        listings = [lister(x) for x in paths]
+      directories += len(listings)
+      listed += len([x for x in listings if x[2]])
+      next_level = []
+      for (rel_dir, path, is_pol), (subdirs, files, _) in zip(level, listings):
+        if is_pol:
+          policies.extend((os.path.join(path, x), rel_dir) for x in files
+                          if x.endswith(POLICY_SUFFIXES))
+          continue
+        for subdir in subdirs:
+          if subdir == POLICY_DIRECTORY:
+            next_level.append((rel_dir, os.path.join(path, subdir), True))
+          elif subdir not in ignore_directories:
+            next_level.append((os.path.join(rel_dir, subdir),
+                               os.path.join(path, subdir), False))
+      level = next_level
+  finally:
+    if thread_pool:
+      thread_pool.close()
+      thread_pool.join()
+  if index is not None:
+    index.clear()
+    index.update(lister.index)
+  logging.debug('found %d policies in %d directories, %d listed',
+                len(policies), directories, listed)
+  policies.sort(key=lambda x: x[0].split('/'))
+  return policies
@@ -0,0 +1,152 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""The ACL generators of each platform, imported when first used.
+
+A platform maps to one or more generator classes, each named by its module
+and class name, and rendered to a file suffixed with a prefix of its own and
+the generator's SUFFIX.  Generator modules are only imported when a policy is
+rendered for their platform, so rendering a single platform doesn't pay for
+importing all of them.
+
+Sample usage:
+    for suffix_prefix, generator, kwargs in generators.Generators('pcap'):
+      acl_text = str(generator(pol, exp_info, **kwargs))
+"""
+
+__author__ = 'pmoody@google.com'
+
+import importlib
+import sys
+import time
+
+from lib import aclgenerator
+from lib import profiling
+
+import logging
+
+
+# platform -> list of (suffix prefix, module name, class name, kwargs)
+_REGISTRY = {}
+# the platforms in the order they are rendered in.
+_ORDER = []
+# module name -> seconds taken to import it.
+_IMPORT_TIMES = {}
+# generator modules whose errors are reported as rendering errors; errors
+# of the others are not caught.
+_CAUGHT_ERRORS = ('juniper', 'junipersrx', 'cisco', 'ipset', 'iptables',
+                  'speedway', 'pcap', 'aruba', 'nftables', 'gce')
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+class UnknownPlatformError(Error):
+  """Raised when no generator is registered for a platform."""
+
+
+def Register(platform, module_name, class_name, suffix_prefix='', **kwargs):
+  """Register a generator class for a platform.
+
+  Args:
+    platform: the target name of the platform in policy headers.
+    module_name: the name of the module, in lib, of the generator.
+    class_name: the name of the generator class in the module.
+    suffix_prefix: prepended to the generator's SUFFIX in the file name.
+    **kwargs: extra arguments passed to the generator.
+  """
+  if platform not in _REGISTRY:
+    _REGISTRY[platform] = []
+    _ORDER.append(platform)
+  _REGISTRY[platform].append((suffix_prefix, module_name, class_name, kwargs))
+
+
+def Platforms():
+  """Return the registered platforms, in rendering order."""
+  return tuple(_ORDER)
+
+
+def _Import(module_name):
+  """Import a generator module, timing the first import."""
+  full_name = 'lib.%s' % module_name
+  if full_name in sys.modules:
+    return sys.modules[full_name]
+  with profiling.Stage('import'):
+    start = time.time()
+    module = importlib.import_module(full_name)
+  _IMPORT_TIMES.setdefault(module_name, time.time() - start)
+  logging.debug('imported %s in %.1fms', full_name,
+                _IMPORT_TIMES[module_name] * 1000)
+  return module
+
+
+def Generators(platform):
+  """Return the generators of a platform, importing their modules.
+
+  Args:
+    platform: a registered platform.
+
+  Returns:
+    a list of (suffix prefix, generator class, kwargs) tuples.
+
+  Raises:
+    UnknownPlatformError: if no generator is registered for platform.
+  """
+  if platform not in _REGISTRY:
+    raise UnknownPlatformError('no generator for platform %s' % platform)
+  return [(suffix_prefix, getattr(_Import(module_name), class_name), kwargs)
+          for suffix_prefix, module_name, class_name, kwargs
+          in _REGISTRY[platform]]
+
+
+def Errors():
+  """Return the tuple of generator errors to report as rendering errors.
+
+  Only modules already imported are considered, which is enough to catch an
+  error raised by a generator.
+  """
+  errors = [aclgenerator.Error]
+  for module_name in _CAUGHT_ERRORS:
+    module = sys.modules.get('lib.%s' % module_name)
+    if module is not None:
+      errors.append(module.Error)
+  return tuple(errors)
+
+
+def ImportTimes():
+  """Return a dict of generator module name to the seconds to import it."""
+  return dict(_IMPORT_TIMES)
+
+
+Register('juniper', 'juniper', 'Juniper')
+Register('srx', 'junipersrx', 'JuniperSRX')
+Register('cisco', 'cisco', 'Cisco')
+Register('ciscoasa', 'ciscoasa', 'CiscoASA')
+Register('aruba', 'aruba', 'Aruba')
+Register('brocade', 'brocade', 'Brocade')
+Register('arista', 'arista', 'Arista')
+Register('ipset', 'ipset', 'Ipset')
+Register('iptables', 'iptables', 'Iptables')
+Register('nsxv', 'nsxv', 'Nsxv')
+Register('speedway', 'speedway', 'Speedway')
+Register('pcap', 'pcap', 'PcapFilter', '-accept')
+Register('pcap', 'pcap', 'PcapFilter', '-deny', invert=True)
+Register('packetfilter', 'packetfilter', 'PacketFilter')
+Register('windows_advfirewall', 'windows_advfirewall', 'WindowsAdvFirewall')
+Register('srxlo', 'srxlo', 'SRXlo')
+Register('ciscoxr', 'ciscoxr', 'CiscoXR')
+Register('nftables', 'nftables', 'Nftables')
+Register('gce', 'gce', 'GCE')
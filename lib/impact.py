@@ -0,0 +1,361 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Which policies, filters and terms a naming token change affects.
+
+The index records, for every policy below a base directory, its filters
+(the targets of each header) and the network and service tokens referenced
+by each term, read with policy_simple so nothing is expanded; and, for the
+definitions, the tokens nesting each token.  Changing a token affects the
+terms referencing it or any token nesting it, directly or not.  Policy
+templates are indexed as the policies of each of their instances.
+
+The index is a dict which can be saved as JSON.  Every policy and include
+file, and every definitions file, is recorded with its mtime and size, so
+updating the index only reads the files which changed since.
+
+Sample usage:
+    index = impact.Load('impact.json')
+    impact.Update(index, './policies', './def')
+    impact.Save('impact.json', index)
+    for reference in impact.Impact(index, 'RFC1918')['references']:
+      print reference['policy'], reference['platform'], reference['filter']
+"""
+
+__author__ = 'pmoody@google.com'
+
+import glob
+import json
+import os
+import time
+
+from lib import defstats
+from lib import discovery
+from lib import generators
+from lib import naming
+from lib import policy
+from lib import policy_simple
+from lib import template
+
+import logging
+
+
+# the index format, a change of which discards saved indexes.
+VERSION = 1
+# files modified this recently are read again on the next update, as a
+# further change within the mtime granularity would go unnoticed.
+_RACY_SECONDS = 2
+
+
+def Load(index_file):
+  """Load an impact index, returning an empty one if it cannot be read."""
+  try:
+    with open(index_file) as f:
+      index = json.load(f)
+  except (IOError, ValueError) as e:
+    logging.debug('not using impact index %s: %s', index_file, e)
+    return {}
+  if index.get('version') != VERSION:
+    return {}
+  return index
+
+
+def Save(index_file, index):
+  """Atomically replace index_file with index."""
+  tmp_file = '%s.tmp' % index_file
+  with open(tmp_file, 'w') as f:
+    json.dump(index, f, sort_keys=True)
+  os.rename(tmp_file, index_file)
+
+
+def _Stamps(files, start):
+  """Return a dict of file to [mtime, size], None for racy or missing files."""
+  stamps = {}
+  for filename in files:
+    try:
+      st = os.stat(filename)
+    except OSError:
+      stamps[filename] = None
+      continue
+    stamps[filename] = [st.st_mtime, st.st_size]
+    if st.st_mtime >= start - _RACY_SECONDS:
+      stamps[filename] = None
+  return stamps
+
+
+def _IsCurrent(stamps):
+  """Whether none of the files recorded with stamps changed."""
+  if not stamps:
+    return False
+  for filename, stamp in stamps.items():
+    if stamp is None:
+      return False
+    try:
+      st = os.stat(filename)
+    except OSError:
+      return False
+    if [st.st_mtime, st.st_size] != stamp:
+      return False
+  return True
+
+
+def _ReadMembers(filename, base_dir, bindings=None, max_depth=5):
+  """Return the included files and the members of a policy, includes inlined.
+
+  Raises:
+    policy.RecursionTooDeepError: nested include files exceed maximum.
+  """
+  if not max_depth:
+    raise policy.RecursionTooDeepError(
+        'Included files exceed maximum recursion depth.')
+  data = policy._ReadFile(filename)
+  if bindings is not None:
+    data = template.Substitute(data, bindings)
+  includes = []
+  members = []
+  for member in policy_simple.PolicyParser(data, filename).Parse():
+    if isinstance(member, policy_simple.Include):
+      include_file = os.path.join(base_dir, member.identifier.strip('\'"'))
+      includes.append(include_file)
+      inc_includes, inc_members = _ReadMembers(include_file, base_dir,
+                                               bindings, max_depth - 1)
+      includes.extend(inc_includes)
+      members.extend(inc_members)
+    else:
+      members.append(member)
+  return includes, members
+
+
+def ReadFilters(filename, base_dir='', bindings=None):
+  """Read the filters of a policy file and the tokens their terms reference.
+
+  Args:
+    filename: path of the policy file.
+    base_dir: base path string where to look for include files.
+    bindings: for a policy template, the variables of the instance to read.
+
+  Returns:
+    A tuple (includes, filters): includes is the list of included file paths,
+    filters a list of {'targets': [[platform, filter name]], 'terms':
+    [[term name, network tokens, service tokens]]} dicts, one per header.
+  """
+  includes, members = _ReadMembers(filename, base_dir, bindings)
+  filters = []
+  for member in members:
+    if isinstance(member, policy_simple.Header):
+      targets = []
+      for target in member.FieldsWithType(policy_simple.Target):
+        words = target.value.split()
+        if words:
+          targets.append([words[0], words[1] if len(words) > 1 else ''])
+      filters.append({'targets': targets, 'terms': []})
+    elif isinstance(member, policy_simple.Term):
+      if not filters:
+        filters.append({'targets': [], 'terms': []})
+      networks = set()
+      services = set()
+      for field in member:
+        if isinstance(field, policy_simple.Address):
+          networks.update(field.value)
+        elif isinstance(field, policy_simple.NextIP):
+          networks.update(field.value.split())
+        elif isinstance(field, policy_simple.Port):
+          services.update(field.value)
+      filters[-1]['terms'].append(
+          [member.Name(), sorted(networks), sorted(services)])
+  return includes, filters
+
+
+def _DefinitionFiles(definitions_directory):
+  files = []
+  for suffix in ('*.net', '*.net.gz', '*.svc', '*.svc.gz'):
+    files.extend(glob.glob(os.path.join(definitions_directory, suffix)))
+  return sorted(files)
+
+
+def _Parents(group):
+  """Return a dict of token to the sorted tokens directly nesting it."""
+  parents = {}
+  for token in group:
+    for value in set(defstats._Value(x) for x in group[token].items):
+      if value in group:
+        parents.setdefault(value, []).append(token)
+  return dict((token, sorted(x)) for token, x in parents.items())
+
+
+def Update(index, base_dir, definitions_directory, policy_files=None):
+  """Bring an index up to date with the policies and definitions.
+
+  Args:
+    index: a dict loaded by Load, updated in place.
+    base_dir: the base directory of the policies and their includes.
+    definitions_directory: the definitions directory.
+    policy_files: optional list of (policy file, directory relative to
+      base_dir) tuples, by default found with discovery.FindPolicies.
+
+  Returns:
+    the number of policies and definitions read again.
+
+  Raises:
+    naming.Error: if the definitions changed and cannot be parsed.
+  """
+  start = time.time()
+  read = 0
+  index['version'] = VERSION
+  definitions = index.get('definitions', {})
+  definition_files = _DefinitionFiles(definitions_directory)
+  if (sorted(definitions.get('files', {})) != definition_files or
+      not _IsCurrent(definitions['files'])):
+    defs = naming.Naming(definitions_directory)
+    definitions = {
+        'files': _Stamps(definition_files, start),
+        'networks': _Parents(defs.networks),
+        'services': _Parents(defs.services),
+    }
+    read += 1
+  index['definitions'] = definitions
+
+  if policy_files is None:
+    policy_files = discovery.FindPolicies(base_dir)
+  old_policies = index.get('policies', {})
+  policies = {}
+  for policy_file, rel_dir in policy_files:
+    entry = old_policies.get(policy_file)
+    if entry and _IsCurrent(entry['files']):
+      policies[policy_file] = entry
+      continue
+    read += 1
+    entry = {'rel_dir': rel_dir, 'filters': []}
+    try:
+      if template.IsTemplate(policy_file):
+        includes, entry['instances'] = _ReadTemplate(policy_file, base_dir)
+      else:
+        includes, entry['filters'] = ReadFilters(policy_file, base_dir)
+      entry['files'] = _Stamps([policy_file] + includes, start)
+    except (policy.Error, template.Error, IOError, ValueError,
+            IndexError) as e:
+      logging.warn('unable to read references of %s: %s', policy_file, e)
+      # the includes are unknown, read the policy again on the next update.
+      entry['files'] = {policy_file: None}
+    policies[policy_file] = entry
+  index['policies'] = policies
+  logging.debug('impact index: %d of %d policies read', read,
+                len(policies))
+  return read
+
+
+def _ReadTemplate(template_file, base_dir):
+  """Read the filters of every instance of a policy template.
+
+  Returns:
+    A tuple (files, instances): files is the list of the bindings and
+    included files, instances a dict of the policy file each instance
+    renders as to its filters, see ReadFilters.
+  """
+  bindings_file = template.BindingsFile(template_file)
+  files = [bindings_file]
+  instances = {}
+  for instance, bindings in template.ParseBindings(
+      policy._ReadFile(bindings_file)):
+    includes, instances[template.InstanceFile(template_file, instance)] = (
+        ReadFilters(template_file, base_dir, bindings))
+    files.extend(x for x in includes if x not in files)
+  return files, instances
+
+
+def _Policies(index):
+  """Yield the (policy file, entry, filters) of every indexed policy."""
+  for policy_file, entry in sorted(index.get('policies', {}).items()):
+    if 'instances' in entry:
+      for instance_file, filters in sorted(entry['instances'].items()):
+        yield instance_file, entry, filters
+    else:
+      yield policy_file, entry, entry['filters']
+
+
+def Ancestors(index, token, def_type):
+  """Return the set of token and the tokens nesting it, directly or not.
+
+  Args:
+    index: an updated impact index.
+    token: the token name.
+    def_type: 'networks' or 'services'.
+  """
+  parents = index.get('definitions', {}).get(def_type, {})
+  tokens = set([token])
+  pending = [token]
+  while pending:
+    for parent in parents.get(pending.pop(), []):
+      if parent not in tokens:
+        tokens.add(parent)
+        pending.append(parent)
+  return tokens
+
+
+def Impact(index, token):
+  """Find the filters and terms affected by a change of token.
+
+  Args:
+    index: an updated impact index.
+    token: the network or service token name.
+
+  Returns:
+    a dict with 'networks' and 'services', the sorted tokens whose value
+    changes with token, and 'references', a sorted list of {'policy',
+    'rel_dir', 'platform', 'filter', 'terms'} dicts, one per affected target.
+  """
+  networks = Ancestors(index, token, 'networks')
+  services = Ancestors(index, token, 'services')
+  references = []
+  for policy_file, entry, filters in _Policies(index):
+    for pol_filter in filters:
+      terms = [name for name, term_networks, term_services
+               in pol_filter['terms']
+               if networks.intersection(term_networks) or
+               services.intersection(term_services)]
+      if not terms:
+        continue
+      for platform, filter_name in pol_filter['targets']:
+        references.append({'policy': policy_file,
+                           'rel_dir': entry['rel_dir'],
+                           'platform': platform,
+                           'filter': filter_name,
+                           'terms': terms})
+  return {'networks': sorted(networks), 'services': sorted(services),
+          'references': references}
+
+
+def Outputs(reference):
+  """Return the rendered files of an Impact reference.
+
+  The generator modules of the platform are imported to find their suffix.
+
+  Args:
+    reference: one of the references returned by Impact.
+
+  Returns:
+    the list of files, relative to the output directory.
+  """
+  name = os.path.basename(reference['policy'])
+  if name.endswith('.gz'):
+    name = name[:-len('.gz')]
+  name = os.path.splitext(name)[0]
+  try:
+    platform_generators = generators.Generators(reference['platform'])
+  except generators.UnknownPlatformError:
+    return []
+  return [os.path.join(reference['rel_dir'],
+                       name + suffix_prefix + generator.SUFFIX)
+          for suffix_prefix, generator, _ in platform_generators]
@@ -0,0 +1,218 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Input manifests for incremental ACL rendering.
+
+A manifest records, for every policy rendered, a digest of everything the
+rendered output depends on and the output files it produced:
+
+  - the policy file and every file it includes,
+  - for a template, the bindings of its instances,
+  - the resolved values (and comments) of every network and service token
+    referenced by its terms, or by the terms of every instance of a template,
+  - the source of the library modules, i.e. the generator versions,
+  - the rendering flags,
+  - the current date, if any term has an expiration.
+
+A policy whose digest matches its manifest entry, and whose outputs are all
+still on disk, does not need to be parsed or rendered again.
+
+Sample usage:
+    entries = manifest.Load('.aclgen_manifest')
+    digest = manifest.PolicyDigest('pol/foo.pol', defs, base_dir='.')
+    if not manifest.IsCurrent(entries, 'pol/foo.pol', digest):
+      ...render...
+      manifest.Record(entries, 'pol/foo.pol', digest, outputs)
+    manifest.Save('.aclgen_manifest', entries)
+"""
+
+__author__ = 'pmoody@google.com'
+
+import datetime
+import glob
+import hashlib
+import json
+import os
+
+from lib import defstats
+from lib import naming
+from lib import policy
+from lib import policy_simple
+from lib import template
+
+import logging
+
+
+# the digest recorded for a policy whose digest can't be computed, which
+# never matches, so the policy is always rendered.
+UNKNOWN_DIGEST = 'unknown'
+
+_LIBRARY_VERSION = None
+
+
+def LibraryVersion():
+  """Return a digest of the source of every library module."""
+  global _LIBRARY_VERSION
+  if _LIBRARY_VERSION is None:
+    digest = hashlib.sha1()
+    lib_dir = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(glob.glob(os.path.join(lib_dir, '*.py'))):
+      digest.update(os.path.basename(filename))
+      digest.update(open(filename, 'rb').read())
+    _LIBRARY_VERSION = digest.hexdigest()
+  return _LIBRARY_VERSION
+
+
+def _TokenValues(definitions, token, def_type):
+  """Return the resolved values of token as a list of strings."""
+  try:
+    if def_type == 'networks':
+      return ['%s %s %s' % (x, x.token, x.text)
+              for x in definitions.GetNet(token)]
+    return definitions.GetService(token)
+  except naming.Error:
+    # leave it to the renderer to report the undefined token.
+    return ['UNDEFINED']
+
+
+def _PolicyInputs(input_file, base_dir):
+  """Return the (file name, text) of the inputs of a policy, and its terms.
+
+  The terms are (term name, network tokens, service tokens) tuples, see
+  defstats.ReadPolicyReferences.
+  """
+  includes, terms = defstats.ReadPolicyReferences(input_file, base_dir)
+  return [(x, policy._ReadFile(x)) for x in [input_file] + includes], terms
+
+
+def _TemplateInputs(input_file, base_dir):
+  """Like _PolicyInputs, for a template and the instances of its bindings.
+
+  The text of the template has its includes expanded, and its bindings
+  stand for the bindings file.
+  """
+  tmpl = template.Load(input_file, base_dir=base_dir)
+  inputs = [(input_file, tmpl.data),
+            (template.BindingsFile(input_file),
+             json.dumps(tmpl.bindings, sort_keys=True))]
+  terms = []
+  for instance in tmpl.Instances():
+    pol = policy_simple.PolicyParser(tmpl.Text(instance), input_file).Parse()
+    terms.extend(defstats.TermReferences(x) for x in pol
+                 if isinstance(x, policy_simple.Term))
+  return inputs, terms
+
+
+def PolicyDigest(input_file, definitions, base_dir='', flags=None):
+  """Compute a digest of all the inputs to the rendering of a policy.
+
+  Args:
+    input_file: the name of the input policy or template file.
+    definitions: the definitions from naming.Naming().
+    base_dir: base path string where to look for include files.
+    flags: optional dict of rendering flags which affect the output.
+
+  Returns:
+    a hex digest string.
+
+  Raises:
+    policy.Error: if the policy or its includes cannot be read.
+    template.Error: if a template or its bindings are malformed.
+  """
+  if template.IsTemplate(input_file):
+    inputs, terms = _TemplateInputs(input_file, base_dir)
+  else:
+    inputs, terms = _PolicyInputs(input_file, base_dir)
+  digest = hashlib.sha1()
+  digest.update(LibraryVersion())
+  digest.update(json.dumps(flags or {}, sort_keys=True))
+  expires = False
+  for filename, data in inputs:
+    expires = expires or 'expiration::' in data
+    # relative to base_dir, so checkouts elsewhere share the digest.
+    digest.update(os.path.relpath(filename, base_dir or os.curdir))
+    digest.update(hashlib.sha1(data).hexdigest())
+  if expires:
+    digest.update(str(datetime.date.today()))
+
+  networks = set()
+  services = set()
+  for _, term_networks, term_services in terms:
+    networks.update(term_networks)
+    services.update(term_services)
+  for def_type, tokens in (('networks', networks), ('services', services)):
+    for token in sorted(tokens):
+      digest.update('%s %s\n' % (def_type, token))
+      digest.update('\n'.join(_TokenValues(definitions, token, def_type)))
+  return digest.hexdigest()
+
+
+def Load(manifest_file):
+  """Load a manifest, returning an empty one if it cannot be read."""
+  try:
+    with open(manifest_file) as f:
+      return json.load(f)
+  except (IOError, ValueError) as e:
+    logging.debug('not using manifest %s: %s', manifest_file, e)
+    return {}
+
+
+def Save(manifest_file, entries):
+  """Atomically replace manifest_file with entries."""
+  tmp_file = '%s.tmp' % manifest_file
+  with open(tmp_file, 'w') as f:
+    json.dump(entries, f, indent=1, sort_keys=True)
+  os.rename(tmp_file, manifest_file)
+
+
+def IsCurrent(entries, input_file, digest):
+  """Whether the outputs of input_file are up to date with digest."""
+  entry = entries.get(input_file)
+  if (not entry or digest in (None, UNKNOWN_DIGEST) or
+      entry.get('digest') != digest):
+    return False
+  return all(os.path.exists(x) for x in entry.get('outputs', []))
+
+
+def Prune(entries, input_files):
+  """Drop the entries of the policies not among input_files.
+
+  Args:
+    entries: the manifest entries, modified in place.
+    input_files: the policies of the run, e.g. those of its shard.
+
+  Returns:
+    the sorted list of the policies dropped, deleted or moved elsewhere.
+  """
+  input_files = set(input_files)
+  dropped = sorted(x for x in entries if x not in input_files)
+  for input_file in dropped:
+    del entries[input_file]
+  return dropped
+
+
+def Record(entries, input_file, digest, outputs):
+  """Record the digest and outputs of a rendered policy.
+
+  Args:
+    entries: the manifest entries.
+    input_file: the name of the input policy file.
+    digest: the digest of the policy, None or UNKNOWN_DIGEST if it couldn't
+      be computed, in which case the outputs are recorded, e.g. for merging
+      shards, but the policy is never considered current.
+    outputs: the output files of the policy.
+  """
+  entries[input_file] = {'digest': digest or UNKNOWN_DIGEST,
+                         'outputs': sorted(outputs)}
@@ -30,7 +30,8 @@ Sample usage with definition files contained in ./acl/defs:
 
 The definition files are contained in a single directory and
 may consist of multiple files ending in .net or .svc extensions,
-indicating network or service definitions respectively.  The
+indicating network or service definitions respectively, optionally
+gzip compressed with an additional .gz extension.  The
 format of the files consists of a 'token' value, followed by a
 list of values and optional comments, such as:
 
@@ -47,6 +48,7 @@ DNS = 53/tcp
 __author__ = 'watson@google.com (Tony Watson)'
 
 import glob
+import gzip
 import os
 
 from lib import nacaddr
@@ -84,6 +86,13 @@ class UnexpectedDefinitionType(Error):
   """An unexpected/unknown definition type was used."""
 
 
+def _OpenFile(filename):
+  """Open a definitions file, decompressing it on the fly if it ends in .gz."""
+  if filename.endswith('.gz'):
+    return gzip.open(filename, 'r')
+  return open(filename, 'r')
+
+
 class _ItemUnit(object):
   """This class is a container for an index key and a list of associated values.
 
@@ -116,9 +125,12 @@ class Naming(object):
     self.networks = {}
     self.unseen_services = {}
     self.unseen_networks = {}
+    self._service_index = None
+    # services of the index whose nested tokens are all defined.
+    self._resolved_services = set()
     if naming_file and naming_type:
       filename = os.path.sep.join([naming_dir, naming_file])
-      file_handle = open(filename, 'r')
+      file_handle = _OpenFile(filename)
       self._ParseFile(file_handle, naming_type)
     elif naming_dir:
       self._Parse(naming_dir, 'services')
@@ -126,6 +138,7 @@ class Naming(object):
 
       self._Parse(naming_dir, 'networks')
       self._CheckUnseen('networks')
+      self.GetServiceIndex()
 
   def _CheckUnseen(self, def_type):
     if def_type == 'services':
@@ -283,6 +296,37 @@ class Naming(object):
         expandset.add(service)
     return sorted(expandset)
 
+  def GetServiceIndex(self):
+    """Return the precomputed (service, protocol) to ports lookup table.
+
+    The table is built once from the loaded definitions, with nested services
+    already expanded, and is rebuilt after any further services are parsed.
+    Services which reference an undefined token are left out of the table.
+
+    Returns:
+      A dict mapping (service name, upper-case protocol) to a sorted tuple of
+      port or port-range strings, such as {('DNS', 'UDP'): ('53',), ...}
+    """
+    if self._service_index is None:
+      index = {}
+      resolved = set()
+      for servicename in self.services:
+        try:
+          services = self.GetService(servicename)
+        except UndefinedServiceError:
+          continue
+        resolved.add(servicename)
+        ports_by_proto = {}
+        for service in services:
+          if service and '/' in service:
+            parts = service.split('/')
+            ports_by_proto.setdefault(parts[1].upper(), set()).add(parts[0])
+        for proto, ports in ports_by_proto.items():
+          index[(servicename, proto)] = tuple(sorted(ports))
+      self._service_index = index
+      self._resolved_services = resolved
+    return self._service_index
+
   def GetServiceByProto(self, query, proto):
     """Given a service name, return list of ports in the service by protocol.
 
@@ -296,8 +340,6 @@ class Naming(object):
     Raises:
       UndefinedServiceError: If the service name isn't defined.
     """
-    services_set = set()
-    proto = proto.upper()
     data = []
     servicename = ''
     data = query.split('#')     # Get the token keyword and remove any comment
@@ -305,12 +347,13 @@ class Naming(object):
     if servicename not in self.services:
       raise UndefinedServiceError('%s %s' % ('\nNo such service,', servicename))
 
-    for service in self.GetService(servicename):
-      if service and '/' in service:
-        parts = service.split('/')
-        if parts[1].upper() == proto:
-          services_set.add(parts[0])
-    return sorted(services_set)
+    ports = self.GetServiceIndex().get((servicename, proto.upper()))
+    if ports is None:
+      if servicename not in self._resolved_services:
+        # a nested service is undefined, GetService raises the error.
+        self.GetService(servicename)
+      return []
+    return list(ports)
 
   def GetNetAddr(self, token):
     """Given a network token, return a list of netaddr.IPv4 objects.
@@ -390,8 +433,10 @@ class Naming(object):
       NoDefinitionsError: if no definitions are found.
     """
     file_names = []
-    get_files = {'services': lambda: glob.glob(defdirectory + '/*.svc'),
-                 'networks': lambda: glob.glob(defdirectory + '/*.net')}
+    get_files = {'services': lambda: (glob.glob(defdirectory + '/*.svc') +
+                                      glob.glob(defdirectory + '/*.svc.gz')),
+                 'networks': lambda: (glob.glob(defdirectory + '/*.net') +
+                                      glob.glob(defdirectory + '/*.net.gz'))}
 
     if def_type in get_files:
       file_names = get_files[def_type]()
@@ -403,7 +448,7 @@ class Naming(object):
 
     for current_file in file_names:
       try:
-        file_handle = open(current_file, 'r')
+        file_handle = _OpenFile(current_file)
         self._ParseFile(file_handle, def_type)
       except IOError as error_info:
         raise NoDefinitionsError('%s', error_info)
@@ -459,6 +504,9 @@ class Naming(object):
     line = line.strip()
     if not line or line.startswith('#'):  # Skip comments and blanks.
       return
+    if definition_type == 'services':
+      # any new service data invalidates the precomputed service index.
+      self._service_index = None
     comment = ''
     if line.find('#') > -1:  # if there is a comment, save it
       (line, comment) = line.split('#', 1)
@@ -0,0 +1,367 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""SQLite backed naming definitions.
+
+For very large definition sets, keeping every token and value in memory and
+answering reverse lookups with linear scans does not scale.  SQLiteNaming has
+the same interface as naming.Naming, but stores tokens, their values and the
+integer ranges of every network value in indexed SQLite tables.
+
+Sample usage, importing the text definitions in ./def once:
+    defs = SQLiteNaming('./def', database='defs.sqlite')
+
+and later reusing the database without parsing the text files again:
+    defs = SQLiteNaming(database='defs.sqlite')
+    parents = defs.GetIpParents('10.1.1.1')
+"""
+
+__author__ = 'watson@google.com (Tony Watson)'
+
+import sqlite3
+
+from lib import nacaddr
+from lib import naming
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (type, name));
+CREATE TABLE IF NOT EXISTS items (
+    token_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    raw TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (token_id, position));
+CREATE INDEX IF NOT EXISTS items_raw ON items (raw);
+CREATE INDEX IF NOT EXISTS items_value ON items (value);
+CREATE TABLE IF NOT EXISTS ranges (
+    token_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    first TEXT NOT NULL,
+    last TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS ranges_first ON ranges (version, first, last);
+"""
+
+
+def _RangeKey(address):
+  """Return a fixed width string which sorts like the integer address.
+
+  SQLite integers are 64 bits wide, too small for IPv6 addresses.
+
+  Args:
+    address: an ipaddr address object.
+
+  Returns:
+    a 32 character hex string.
+  """
+  return '%032x' % int(address)
+
+
+def _ParentRanges(query):
+  """Return the range keys of every prefix containing an address.
+
+  Prefixes nest, so the networks containing query are exactly its supernets,
+  one per prefix length up to its own.
+
+  Args:
+    query: an ipaddr network object.
+
+  Returns:
+    a tuple of the lists of first and of last range keys of the supernets.
+  """
+  network = int(query.network)
+  firsts = []
+  lasts = []
+  for prefixlen in range(query.prefixlen + 1):
+    size = 1 << (query.max_prefixlen - prefixlen)
+    first = network & ~(size - 1)
+    firsts.append(_RangeKey(first))
+    lasts.append(_RangeKey(first + size - 1))
+  return firsts, lasts
+
+
+class _DefinitionTable(object):
+  """A dict-like view of the tokens of one definition type.
+
+  naming.Naming parses definitions into a dict of token names to _ItemUnit
+  objects.  This class stands in for that dict: units are written to the
+  database once parsing moves on to the next token, and read back on lookup.
+  """
+
+  def __init__(self, conn, def_type):
+    self._conn = conn
+    self._def_type = def_type
+    self._pending = None
+
+  def __contains__(self, name):
+    if self._pending and self._pending.name == name:
+      return True
+    return self._TokenId(name) is not None
+
+  def __getitem__(self, name):
+    self.Flush()
+    token_id = self._TokenId(name)
+    if token_id is None:
+      raise KeyError(name)
+    unit = naming._ItemUnit(name)
+    unit.items = [row[0] for row in self._conn.execute(
+        'SELECT raw FROM items WHERE token_id = ? ORDER BY position',
+        (token_id,))]
+    return unit
+
+  def __setitem__(self, name, unit):
+    self.Flush()
+    self._pending = unit
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    self.Flush()
+    return self._conn.execute('SELECT COUNT(*) FROM tokens WHERE type = ?',
+                              (self._def_type,)).fetchone()[0]
+
+  def keys(self):
+    self.Flush()
+    return [row[0] for row in self._conn.execute(
+        'SELECT name FROM tokens WHERE type = ? ORDER BY id',
+        (self._def_type,))]
+
+  def _TokenId(self, name):
+    row = self._conn.execute(
+        'SELECT id FROM tokens WHERE type = ? AND name = ?',
+        (self._def_type, name)).fetchone()
+    if row:
+      return row[0]
+    return None
+
+  def Delete(self, name):
+    """Remove a token and its values from the database, if present."""
+    token_id = self._TokenId(name)
+    if token_id is None:
+      return
+    for table in ('items', 'ranges'):
+      self._conn.execute('DELETE FROM %s WHERE token_id = ?' % table,
+                         (token_id,))
+    self._conn.execute('DELETE FROM tokens WHERE id = ?', (token_id,))
+
+  def Flush(self):
+    """Write the unit currently being parsed to the database."""
+    unit = self._pending
+    if unit is None:
+      return
+    self._pending = None
+    cursor = self._conn.execute('INSERT INTO tokens (type, name) VALUES (?, ?)',
+                                (self._def_type, unit.name))
+    token_id = cursor.lastrowid
+    items = []
+    ranges = []
+    for position, raw in enumerate(unit.items):
+      value = raw.split('#')[0].strip()
+      items.append((token_id, position, raw, value))
+      # only values which naming.Naming.GetIpParents would consider as ips.
+      if self._def_type == 'networks' and value[:1].isdigit():
+        try:
+          addr = nacaddr.IP(value)
+        except ValueError:
+          continue
+        ranges.append((token_id, addr.version, _RangeKey(addr.network),
+                       _RangeKey(addr.broadcast)))
+    self._conn.executemany('INSERT INTO items VALUES (?, ?, ?, ?)', items)
+    self._conn.executemany('INSERT INTO ranges VALUES (?, ?, ?, ?)', ranges)
+
+
+class SQLiteNaming(naming.Naming):
+  """naming.Naming with definitions stored in a SQLite database.
+
+  Attributes:
+     database: path of the SQLite database, or ':memory:'.
+     services: A dict-like view of all of the service item tokens.
+     networks: A dict-like view of all of the network item tokens.
+  """
+
+  def __init__(self, naming_dir=None, naming_file=None, naming_type=None,
+               database=':memory:'):
+    """Open the database and import any text definitions given.
+
+    Args:
+      naming_dir: directory of .net and .svc files to import, replacing the
+        definitions already in the database.
+      naming_file: a single definitions file in naming_dir to import, its
+        tokens replacing those of the same name in the database.
+      naming_type: 'networks' or 'services', the type of naming_file.
+      database: path of the SQLite database to use.
+    """
+    self.database = database
+    self._Connect()
+    self.current_symbol = None
+    self.unseen_services = {}
+    self.unseen_networks = {}
+    self._service_index = None
+    self._resolved_services = set()
+    if naming_file and naming_type:
+      self.ImportFile('/'.join([naming_dir, naming_file]), naming_type)
+    elif naming_dir:
+      self._Clear()
+      self._Parse(naming_dir, 'services')
+      self._CheckUnseen('services')
+
+      self._Parse(naming_dir, 'networks')
+      self._CheckUnseen('networks')
+      self._conn.commit()
+      self.GetServiceIndex()
+
+  def _Connect(self, dump=None):
+    """Open the database, loading dump, SQL statements, into it if given."""
+    self._conn = sqlite3.connect(self.database)
+    self._conn.text_factory = str
+    if dump:
+      self._conn.executescript(dump)
+    self._conn.executescript(_SCHEMA)
+    self.services = _DefinitionTable(self._conn, 'services')
+    self.networks = _DefinitionTable(self._conn, 'networks')
+
+  def __getstate__(self):
+    self._Flush()
+    state = self.__dict__.copy()
+    for attribute in ('_conn', 'services', 'networks'):
+      del state[attribute]
+    # a copy connecting to ':memory:' would find an empty database.
+    if self.database == ':memory:':
+      state['_dump'] = '\n'.join(self._conn.iterdump())
+    return state
+
+  def __setstate__(self, state):
+    dump = state.pop('_dump', None)
+    self.__dict__.update(state)
+    self._Connect(dump)
+
+  def _Clear(self):
+    """Remove every definition from the database."""
+    self._conn.executescript('DELETE FROM ranges; DELETE FROM items; '
+                             'DELETE FROM tokens;')
+
+  def _Flush(self):
+    self.services.Flush()
+    self.networks.Flush()
+    self._conn.commit()
+
+  def ImportFile(self, filename, def_type):
+    """Import a text definitions file into the database.
+
+    Args:
+      filename: path of a .net or .svc file, optionally gzip compressed.
+      def_type: 'networks' or 'services'.
+    """
+    file_handle = naming._OpenFile(filename)
+    try:
+      # parsed apart, so the tokens of the file replace those in the database.
+      defs = naming.Naming(None)
+      defs._ParseFile(file_handle, def_type)
+    finally:
+      file_handle.close()
+    table = getattr(self, def_type)
+    for name, unit in getattr(defs, def_type).items():
+      table.Delete(name)
+      table[name] = unit
+    self._service_index = None
+    self._Flush()
+
+  def _ParseFile(self, file_handle, def_type):
+    naming.Naming._ParseFile(self, file_handle, def_type)
+    self._Flush()
+
+  def ParseServiceList(self, data):
+    naming.Naming.ParseServiceList(self, data)
+    self._Flush()
+
+  def ParseNetworkList(self, data):
+    naming.Naming.ParseNetworkList(self, data)
+    self._Flush()
+
+  def GetIpParents(self, query):
+    """Return network tokens that contain IP in query.
+
+    Args:
+      query: an ip string ('10.1.1.1') or nacaddr.IP object
+
+    Returns:
+      A sorted list of unique parent tokens.
+    """
+    recursive_parents = []
+    if type(query) != nacaddr.IPv4 and type(query) != nacaddr.IPv6:
+      if query[:1].isdigit():
+        query = nacaddr.IP(query)
+    if type(query) == nacaddr.IPv4 or type(query) == nacaddr.IPv6:
+      # a range containing query is one of its supernets, so they are looked
+      # up in the index rather than scanning every range before query.  Any
+      # first and last of two supernets also bound a range containing query.
+      firsts, lasts = _ParentRanges(query)
+      base_parents = self._Column(
+          'SELECT t.name FROM ranges r JOIN tokens t ON t.id = r.token_id '
+          'WHERE r.version = ? AND r.first IN (%s) AND r.last IN (%s) '
+          'ORDER BY t.id' % (','.join('?' * len(firsts)),
+                             ','.join('?' * len(lasts))),
+          [query.version] + firsts + lasts)
+    else:
+      base_parents = self._Column(
+          'SELECT t.name FROM items i JOIN tokens t ON t.id = i.token_id '
+          'WHERE t.type = ? AND i.value = ? ORDER BY t.id',
+          ('networks', query))
+      base_parents = [x for x in base_parents if query[:1].isalpha()]
+    # look for nested tokens
+    for bp in base_parents:
+      if not bp[:1].isalpha() or bp in recursive_parents:
+        continue
+      recursive_parents.append(bp)
+      if self._Column(
+          'SELECT t.name FROM items i JOIN tokens t ON t.id = i.token_id '
+          'WHERE t.type = ? AND i.raw = ? LIMIT 1', ('networks', bp)):
+        recursive_parents.extend(self.GetIpParents(bp))
+    return sorted(list(set(recursive_parents)))
+
+  def _GetParents(self, query, query_group):
+    """Given a naming item view, return any tokens containing the value.
+
+    Args:
+      query: a service or token name, such as 53/tcp or DNS
+      query_group: either the services or networks view
+
+    Returns:
+      Returns a list of definitions containing the token in desired group.
+    """
+    def_type = 'services' if query_group is self.services else 'networks'
+    recursive_parents = []
+    base_parents = self._Column(
+        'SELECT DISTINCT t.name FROM items i '
+        'JOIN tokens t ON t.id = i.token_id '
+        'WHERE t.type = ? AND i.raw = ? ORDER BY t.id', (def_type, query))
+    for bp in base_parents:
+      if bp not in recursive_parents and self._Column(
+          'SELECT t.name FROM items i JOIN tokens t ON t.id = i.token_id '
+          'WHERE t.type = ? AND i.raw = ? LIMIT 1', (def_type, bp)):
+        recursive_parents.append(bp)
+        recursive_parents.extend(self._GetParents(bp, query_group))
+      if bp not in recursive_parents:
+        recursive_parents.append(bp)
+    return recursive_parents
+
+  def _Column(self, statement, args):
+    self._Flush()
+    return [row[0] for row in self._conn.execute(statement, args)]
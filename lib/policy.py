@@ -20,11 +20,13 @@ __author__ = ['pmoody@google.com',
               'watson@google.com']
 
 import datetime
+import gzip
 import os
 import sys
 
 from lib import nacaddr
 from lib import naming
+from lib import profiling
 from ply import lex
 from ply import yacc
 
@@ -37,6 +39,23 @@ ACTIONS = set(('accept', 'deny', 'reject', 'next', 'reject-with-tcp-rst'))
 _LOGGING = set(('true', 'True', 'syslog', 'local', 'disable', 'log-both'))
 _OPTIMIZE = True
 _SHADE_CHECK = False
+# the platforms rendered, if not all of them; see ParsePolicy.
+_RENDER_PLATFORMS = None
+# generators which render nothing for, and collect nothing from, a term whose
+# platform:: or platform_exclude:: excludes them.  Others still collect their
+# addresses (srx, cisco object-groups, ipset), print a blank line (ciscoasa)
+# or render them anyway (aruba, gce, windows).
+_SKIP_OTHER_PLATFORM_TERMS = frozenset([
+    'juniper', 'srxlo', 'iptables', 'speedway', 'nftables', 'nsxv', 'pcap'])
+# generators which drop expired terms before collecting anything from them.
+# aruba doesn't support expiration, packetfilter collects their addresses.
+_SKIP_EXPIRED_TERMS = frozenset([
+    'arista', 'brocade', 'cisco', 'ciscoasa', 'ciscoxr', 'gce', 'ipset',
+    'iptables', 'juniper', 'junipersrx', 'nftables', 'nsxv', 'pcap',
+    'speedway', 'srx', 'srxlo', 'windows_advfirewall'])
+# the lexer and parser are built once, building the parser tables is slow.
+_LEXER = None
+_PARSER = None
 
 
 class Error(Exception):
@@ -158,16 +177,37 @@ class Policy(object):
     self.AddFilter(header, terms)
 
   def AddFilter(self, header, terms):
-    """Add another header & filter."""
+    """Add another header & filter.
+
+    When only some platforms are rendered, see ParsePolicy, a header which
+    targets none of them is dropped, and so are the terms none of them would
+    render, before their addresses are expanded.
+    """
+    if _RENDER_PLATFORMS is not None:
+      if not terms:
+        raise NoTermsError('no terms found')
+      platforms = [x for x in header.platforms if x in _RENDER_PLATFORMS]
+      if not platforms:
+        return
+      terms = _PruneTerms(header, terms, platforms)
+      if not terms:
+        # the generators render the filter without any term.
+        self.filters.append((header, terms))
+        return
     self.filters.append((header, terms))
-    self._TranslateTerms(terms)
+    with profiling.Stage('translate_terms'):
+      self._TranslateTerms(terms)
     if _SHADE_CHECK:
-      self._DetectShading(terms)
+      with profiling.Stage('shade_check'):
+        self._DetectShading(terms)
 
   def _TranslateTerms(self, terms):
     """."""
     if not terms:
       raise NoTermsError('no terms found')
+    for term in terms:
+      if not term.translated:
+        term.ExpandAddresses()
     for term in terms:
       # TODO(pmoody): this probably belongs in Term.SanityCheck(),
       # or at the very least, in some method under class Term()
@@ -402,6 +442,8 @@ class Term(object):
     self.flattened_addr = None
     self.flattened_saddr = None
     self.flattened_daddr = None
+    # (attribute, token) of the addresses to look up, see ExpandAddresses.
+    self.unexpanded = []
 
     # AddObject touches variables which might not have been initialized
     # further up so this has to be at the end.
@@ -859,6 +901,19 @@ class Term(object):
 
     return filter(lambda x: x.version == af, getattr(self, addr_type))
 
+  def ExpandAddresses(self):
+    """Look up the address tokens of the term in the definitions.
+
+    Lookups are deferred from parsing to the translation of the terms, so
+    terms which are dropped before it are never expanded.
+    """
+    for attribute, token in self.unexpanded:
+      if attribute == 'next_ip':
+        self.next_ip = DEFINITIONS.GetNetAddr(token)
+      else:
+        getattr(self, attribute).extend(DEFINITIONS.GetNetAddr(token))
+    self.unexpanded = []
+
   def AddObject(self, obj):
     """Add an object of unknown type to this term.
 
@@ -878,25 +933,20 @@ class Term(object):
         # do we have a list of addresses?
         # expanded address fields consolidate naked address fields with
         # saddr/daddr.
+        # addresses are looked up by ExpandAddresses.
         if x.var_type is VarType.SADDRESS:
-          saddr = DEFINITIONS.GetNetAddr(x.value)
-          self.source_address.extend(saddr)
+          self.unexpanded.append(('source_address', x.value))
         elif x.var_type is VarType.DADDRESS:
-          daddr = DEFINITIONS.GetNetAddr(x.value)
-          self.destination_address.extend(daddr)
+          self.unexpanded.append(('destination_address', x.value))
         elif x.var_type is VarType.ADDRESS:
-          addr = DEFINITIONS.GetNetAddr(x.value)
-          self.address.extend(addr)
+          self.unexpanded.append(('address', x.value))
         # do we have address excludes?
         elif x.var_type is VarType.SADDREXCLUDE:
-          saddr_exclude = DEFINITIONS.GetNetAddr(x.value)
-          self.source_address_exclude.extend(saddr_exclude)
+          self.unexpanded.append(('source_address_exclude', x.value))
         elif x.var_type is VarType.DADDREXCLUDE:
-          daddr_exclude = DEFINITIONS.GetNetAddr(x.value)
-          self.destination_address_exclude.extend(daddr_exclude)
+          self.unexpanded.append(('destination_address_exclude', x.value))
         elif x.var_type is VarType.ADDREXCLUDE:
-          addr_exclude = DEFINITIONS.GetNetAddr(x.value)
-          self.address_exclude.extend(addr_exclude)
+          self.unexpanded.append(('address_exclude', x.value))
         # do we have a list of ports?
         elif x.var_type is VarType.PORT:
           self.port.append(x.value)
@@ -928,7 +978,7 @@ class Term(object):
         elif x.var_type is VarType.FORWARDING_CLASS:
           self.forwarding_class = obj.value
         elif x.var_type is VarType.NEXT_IP:
-          self.next_ip = DEFINITIONS.GetNetAddr(x.value)
+          self.unexpanded.append(('next_ip', x.value))
         elif x.var_type is VarType.PLATFORM:
           self.platform.append(x.value)
         elif x.var_type is VarType.PLATFORMEXCLUDE:
@@ -962,7 +1012,7 @@ class Term(object):
       elif obj.var_type is VarType.FORWARDING_CLASS:
         self.forwarding_class = obj.value
       elif obj.var_type is VarType.NEXT_IP:
-        self.next_ip = DEFINITIONS.GetNetAddr(obj.value)
+        self.unexpanded.append(('next_ip', obj.value))
       elif obj.var_type is VarType.VERBATIM:
         self.verbatim.append(obj)
       elif obj.var_type is VarType.ACTION:
@@ -2072,6 +2122,9 @@ def p_error(p):
 def _ReadFile(filename):
   """Read data from a file if it exists.
 
+  Gzip compressed files are read transparently, either when filename ends in
+  .gz or when only a compressed filename.gz exists.
+
   Args:
     filename: str - Filename
 
@@ -2083,9 +2136,14 @@ def _ReadFile(filename):
     FileReadError: Any error resulting from trying to open/read file.
   """
   logging.debug('ReadFile(%s)', filename)
+  if not os.path.exists(filename) and os.path.exists(filename + '.gz'):
+    filename += '.gz'
   if os.path.exists(filename):
     try:
-      data = open(filename, 'r').read()
+      if filename.endswith('.gz'):
+        data = gzip.open(filename, 'r').read()
+      else:
+        data = open(filename, 'r').read()
       return data
     except IOError:
       raise FileReadError('Unable to open or read file %s' % filename)
@@ -2128,8 +2186,67 @@ def _Preprocess(data, max_depth=5, base_dir=''):
   return rval
 
 
+def _TermSkipped(term, platform, yesterday):
+  """Whether the generator of platform renders nothing for term."""
+  if (platform in _SKIP_EXPIRED_TERMS and term.expiration and
+      term.expiration < yesterday):
+    return True
+  if platform in _SKIP_OTHER_PLATFORM_TERMS:
+    if term.platform and platform not in term.platform:
+      return True
+    if term.platform_exclude and platform in term.platform_exclude:
+      return True
+  return False
+
+
+def TermRendered(term, platforms):
+  """Whether the generator of any of platforms renders something for term.
+
+  Args:
+    term: a Term object.
+    platforms: list of platform names.
+  """
+  # generators compare to the local or the UTC date, leave them a day.
+  yesterday = datetime.date.today() - datetime.timedelta(days=1)
+  return not all(_TermSkipped(term, x, yesterday) for x in platforms)
+
+
+def _PruneTerms(header, terms, platforms):
+  """Drop the terms which none of the rendered platforms would render.
+
+  Args:
+    header: the Header object of the terms.
+    terms: list of Term objects, not yet translated.
+    platforms: the targets of header which are rendered.
+
+  Returns:
+    the list of terms to keep.
+  """
+  # generators compare to the local or the UTC date, leave them a day.
+  yesterday = datetime.date.today() - datetime.timedelta(days=1)
+  kept = []
+  for term in terms:
+    if all(_TermSkipped(term, x, yesterday) for x in platforms):
+      if term.expiration and term.expiration < yesterday:
+        logging.warn('WARNING: Term %s in policy %s is expired and will not '
+                     'be rendered.', term.name, header.FilterName(platforms[0]))
+      continue
+    kept.append(term)
+  return kept
+
+
+def _Parser():
+  """Return a fresh lexer and the policy parser, building them once."""
+  global _LEXER, _PARSER
+  if _PARSER is None:
+    _LEXER = lex.lex()
+    _PARSER = yacc.yacc(write_tables=False, debug=0,
+                        errorlog=yacc.NullLogger())
+  return _LEXER.clone(), _PARSER
+
+
 def ParseFile(filename, definitions=None, optimize=True, base_dir='',
-              shade_check=False):
+              shade_check=False, platforms=None):
   """Parse the policy contained in file, optionally provide a naming object.
 
   Read specified policy file and parse into a policy object.
@@ -2140,18 +2257,19 @@ def ParseFile(filename, definitions=None, optimize=True, base_dir='',
     optimize: bool - whether to summarize networks and services.
     base_dir: base path string to look for acls or include files.
     shade_check: bool - whether to raise an exception when a term is shaded.
+    platforms: optional list of the only platforms which will be rendered.
 
   Returns:
     policy object or False (if parse error).
   """
   data = _ReadFile(filename)
   p = ParsePolicy(data, definitions, optimize, base_dir=base_dir,
-                  shade_check=shade_check)
+                  shade_check=shade_check, platforms=platforms)
   return p
 
 
 def ParsePolicy(data, definitions=None, optimize=True, base_dir='',
-                shade_check=False):
+                shade_check=False, platforms=None):
   """Parse the policy in 'data', optionally provide a naming object.
 
   Parse a blob of policy text into a policy object.
@@ -2162,6 +2280,10 @@ def ParsePolicy(data, definitions=None, optimize=True, base_dir='',
     optimize: bool - whether to summarize networks and services.
     base_dir: base path string to look for acls or include files.
     shade_check: bool - whether to raise an exception when a term is shaded.
+    platforms: optional list of the only platforms which will be rendered;
+      headers targeting none of them and terms none of them would render
+      are dropped before their addresses are expanded.  The policy must then
+      only be rendered for these platforms.
 
   Returns:
     policy object or False (if parse error).
@@ -2175,18 +2297,54 @@ def ParsePolicy(data, definitions=None, optimize=True, base_dir='',
       globals()['_OPTIMIZE'] = False
     if shade_check:
       globals()['_SHADE_CHECK'] = True
+    globals()['_RENDER_PLATFORMS'] = None
+    if platforms:
+      globals()['_RENDER_PLATFORMS'] = frozenset(platforms)
 
-    lexer = lex.lex()
+    lexer, p = _Parser()
 
-    preprocessed_data = '\n'.join(_Preprocess(data, base_dir=base_dir))
-    p = yacc.yacc(write_tables=False, debug=0, errorlog=yacc.NullLogger())
+    with profiling.Stage('preprocess'):
+      preprocessed_data = '\n'.join(_Preprocess(data, base_dir=base_dir))
 
-    return p.parse(preprocessed_data, lexer=lexer)
+    with profiling.Stage('parse'):
+      return p.parse(preprocessed_data, lexer=lexer)
 
   except IndexError:
     return False
 
 
+def BuildPolicy(filters, definitions=None, shade_check=False,
+                platforms=None):
+  """Build a policy object from parsed headers and terms.
+
+  The terms are pruned, translated and checked for shading as ParsePolicy
+  would; terms translated already, e.g. shared by several policies, are not
+  translated again.
+
+  Args:
+    filters: a non-empty list of (Header, [Term]) tuples.
+    definitions: optional naming library definitions object.
+    shade_check: bool - whether to raise an exception when a term is shaded.
+    platforms: optional list of the only platforms which will be rendered,
+      see ParsePolicy.
+
+  Returns:
+    policy object.
+  """
+  if definitions:
+    globals()['DEFINITIONS'] = definitions
+  else:
+    globals()['DEFINITIONS'] = naming.Naming(DEFAULT_DEFINITIONS)
+  globals()['_SHADE_CHECK'] = shade_check
+  globals()['_RENDER_PLATFORMS'] = None
+  if platforms:
+    globals()['_RENDER_PLATFORMS'] = frozenset(platforms)
+  pol = Policy(*filters[0])
+  for header, terms in filters[1:]:
+    pol.AddFilter(header, terms)
+  return pol
+
+
 # if you call this from the command line, you can specify a pol file for it to
 # read.
 if __name__ == '__main__':
@@ -120,6 +120,18 @@ class Address(NamingField):
   """An address field."""
 
 
+class AddressExclude(Address):
+  """An address-exclude field."""
+
+
+class ApplyGroups(Field):
+  """An apply-groups field."""
+
+
+class ApplyGroupsExcept(Field):
+  """An apply-groups-except field."""
+
+
 class Port(NamingField):
   """A port field."""
 
@@ -161,6 +173,10 @@ class DestinationTag(Field):
   """A destination tag field."""
 
 
+class DscpExcept(Field):
+  """A dscp-except field."""
+
+
 class DscpMatch(Field):
   """A dscp-match field."""
 
@@ -177,10 +193,18 @@ class Expiration(Field):
   """An expiration field."""
 
 
+class ForwardingClass(Field):
+  """A forwarding-class field."""
+
+
 class FragmentOffset(Field):
   """A fragment-offset field."""
 
 
+class HopLimit(Field):
+  """A hop-limit field."""
+
+
 class IcmpType(Field):
   """A icmp-type field."""
 
@@ -295,6 +319,9 @@ destination_address_fields = (DestinationAddress, DestinationExclude,
 field_map = {
     'action': Action,
     'address': Address,
+    'address-exclude': AddressExclude,
+    'apply-groups': ApplyGroups,
+    'apply-groups-except': ApplyGroupsExcept,
     'comment': Comment,
     'counter': Counter,
     'destination-address': DestinationAddress,
@@ -303,11 +330,14 @@ field_map = {
     'destination-port': DestinationPort,
     'destination-prefix': DestinationPrefix,
     'destination-tag': DestinationTag,
+    'dscp-except': DscpExcept,
     'dscp-match': DscpMatch,
     'dscp-set': DscpSet,
     'ether-type': EtherType,
     'expiration': Expiration,
+    'forwarding-class': ForwardingClass,
     'fragment-offset': FragmentOffset,
+    'hop-limit': HopLimit,
     'icmp-type': IcmpType,
     'logging': Logging,
     'loss-priority': LossPriority,
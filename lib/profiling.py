@@ -0,0 +1,337 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Wall and CPU time spent in each stage of rendering a policy.
+
+Code is split into stages with the Stage context manager, and stages are
+accounted to the policy and platform of the enclosing Record.  The time of a
+stage excludes the time of the stages nested in it, e.g. the time of 'parse'
+excludes the 'translate_terms' done by the parser's actions.
+
+Stages are only timed while profiling is enabled, otherwise they cost a
+function call and an attribute lookup.
+
+With tracing enabled too, every Record, Stage and Span is also kept as a
+trace event, which SaveTrace writes in the Chrome trace event format, to be
+viewed in chrome://tracing or Perfetto with one track per process.
+
+Sample usage:
+    profiling.Enable()
+    with profiling.Record('pol/foo.pol', 'juniper'):
+      with profiling.Stage('render'):
+        text = str(acl)
+      profiling.Count('lines', len(text.split('\\n')))
+    report = profiling.Report(profiling.Collect())
+    profiling.SaveTrace('trace.json', profiling.CollectTrace())
+"""
+
+__author__ = 'pmoody@google.com'
+
+import json
+import os
+import resource
+import threading
+import time
+
+
+_ENABLED = False
+_TRACE = False
+_LOCAL = threading.local()
+_LOCK = threading.Lock()
+# (policy file, platform) -> {'stages': {name: stats}, 'counts': {name: int}}
+_RECORDS = {}
+# trace events of this process, see _Event.
+_EVENTS = []
+
+
+def Enable(enabled=True):
+  """Enable or disable profiling."""
+  global _ENABLED
+  _ENABLED = enabled
+
+
+def Enabled():
+  return _ENABLED
+
+
+def EnableTrace(enabled=True):
+  """Enable or disable tracing, which only traces while profiling is enabled."""
+  global _TRACE
+  _TRACE = enabled
+
+
+def _Event(name, category, start, end, args=None):
+  """Keep a complete trace event of the current thread."""
+  event = {'name': name, 'cat': category, 'ph': 'X',
+           'ts': int(start * 1e6), 'dur': int((end - start) * 1e6),
+           'pid': os.getpid(), 'tid': threading.current_thread().ident}
+  if args:
+    event['args'] = args
+  with _LOCK:
+    _EVENTS.append(event)
+
+
+def _Now():
+  """Return the wall time and the CPU time used by the process."""
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  return time.time(), usage.ru_utime + usage.ru_stime
+
+
+def _Entry(key):
+  """Return the record of key, creating it. Called with _LOCK held."""
+  if key not in _RECORDS:
+    _RECORDS[key] = {'stages': {}, 'counts': {}}
+  return _RECORDS[key]
+
+
+class Record(object):
+  """Account the stages run in this context to a policy and platform."""
+
+  def __init__(self, policy_file, platform=None):
+    self.key = (policy_file, platform)
+
+  def __enter__(self):
+    if not _ENABLED:
+      return self
+    self._previous = getattr(_LOCAL, 'key', None), getattr(_LOCAL, 'stack',
+                                                            None)
+    _LOCAL.key = self.key
+    _LOCAL.stack = []
+    self._start = time.time()
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    if _ENABLED:
+      _LOCAL.key, _LOCAL.stack = self._previous
+      if _TRACE:
+        policy_file, platform = self.key
+        if platform is None:
+          _Event(policy_file, 'policy', self._start, time.time())
+        else:
+          _Event(platform, 'platform', self._start, time.time(),
+                 {'policy': policy_file})
+    return False
+
+
+class Span(object):
+  """Trace a span of time outside of the stages of a Record."""
+
+  def __init__(self, name, category='run', args=None):
+    self.name = name
+    self.category = category
+    self.args = args
+    self._start = None
+
+  def __enter__(self):
+    if _ENABLED and _TRACE:
+      self._start = time.time()
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    if self._start is not None:
+      _Event(self.name, self.category, self._start, time.time(), self.args)
+      self._start = None
+    return False
+
+
+class Stage(object):
+  """Time a stage of the current Record."""
+
+  def __init__(self, name):
+    self.name = name
+    self._frame = None
+
+  def __enter__(self):
+    if not _ENABLED or getattr(_LOCAL, 'key', None) is None:
+      return self
+    wall, cpu = _Now()
+    # [start wall, start cpu, wall of nested stages, cpu of nested stages]
+    self._frame = [wall, cpu, 0.0, 0.0]
+    _LOCAL.stack.append(self._frame)
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    frame = self._frame
+    if frame is None:
+      return False
+    self._frame = None
+    wall, cpu = _Now()
+    wall -= frame[0]
+    cpu -= frame[1]
+    _LOCAL.stack.pop()
+    if _LOCAL.stack:
+      _LOCAL.stack[-1][2] += wall
+      _LOCAL.stack[-1][3] += cpu
+    Add(_LOCAL.key, self.name, wall - frame[2], cpu - frame[3])
+    if _TRACE:
+      _Event(self.name, 'stage', frame[0], frame[0] + wall, {'cpu': cpu})
+    return False
+
+
+def Add(key, name, wall, cpu, calls=1):
+  """Add time to a stage of the record of key."""
+  with _LOCK:
+    stages = _Entry(key)['stages']
+    stats = stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+    stats['wall'] += wall
+    stats['cpu'] += cpu
+    stats['calls'] += calls
+
+
+def Count(name, value):
+  """Set a count, e.g. the number of terms, of the current Record."""
+  key = getattr(_LOCAL, 'key', None)
+  if not _ENABLED or key is None:
+    return
+  with _LOCK:
+    _Entry(key)['counts'][name] = value
+
+
+def Collect():
+  """Return and forget the records of this process."""
+  with _LOCK:
+    records = dict(_RECORDS)
+    _RECORDS.clear()
+  return records
+
+
+def Merge(records):
+  """Merge records collected by another process into this one's."""
+  for key, record in records.items():
+    for name, stats in record['stages'].items():
+      Add(key, name, stats['wall'], stats['cpu'], stats['calls'])
+    with _LOCK:
+      _Entry(key)['counts'].update(record['counts'])
+
+
+def Report(records, top=10):
+  """Build the profile report of a run.
+
+  Args:
+    records: the records returned by Collect.
+    top: the number of slowest (policy, platform) to list.
+
+  Returns:
+    a dict with, under 'policies', the stages and counts of every policy and
+    of each of its platforms, under 'totals' the time of each stage over all
+    policies, and under 'slowest' the top slowest (policy, platform).
+  """
+  policies = {}
+  totals = {}
+  tasks = []
+  for (policy_file, platform), record in sorted(records.items()):
+    entry = policies.setdefault(policy_file, {'platforms': {}})
+    if platform is None:
+      entry.update(record)
+    else:
+      entry['platforms'][platform] = record
+    for name, stats in record['stages'].items():
+      total = totals.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+      for field in total:
+        total[field] += stats[field]
+    tasks.append({'policy': policy_file, 'platform': platform,
+                  'wall': sum(x['wall'] for x in record['stages'].values()),
+                  'cpu': sum(x['cpu'] for x in record['stages'].values())})
+  tasks.sort(key=lambda x: (-x['wall'], x['policy'], x['platform']))
+  return {'policies': policies, 'totals': totals, 'slowest': tasks[:top]}
+
+
+def Summary(report):
+  """Return the lines of a human readable summary of a report."""
+  lines = ['%-20s %10s %10s %8s' % ('stage', 'wall', 'cpu', 'calls')]
+  for name, stats in sorted(report['totals'].items(),
+                            key=lambda x: -x[1]['wall']):
+    lines.append('%-20s %9.3fs %9.3fs %8d' % (
+        name, stats['wall'], stats['cpu'], stats['calls']))
+  lines.append('slowest:')
+  for task in report['slowest']:
+    lines.append('%9.3fs %9.3fs  %s:%s' % (
+        task['wall'], task['cpu'], task['policy'], task['platform'] or '*'))
+  return lines
+
+
+def Save(report_file, report):
+  """Write a report as JSON."""
+  with open(report_file, 'w') as f:
+    json.dump(report, f, indent=1, sort_keys=True)
+
+
+def Reset():
+  """Forget the records and trace events, e.g. inherited from a parent."""
+  with _LOCK:
+    _RECORDS.clear()
+    del _EVENTS[:]
+
+
+def CollectTrace():
+  """Return and forget the trace events of this process."""
+  with _LOCK:
+    events = list(_EVENTS)
+    del _EVENTS[:]
+  return events
+
+
+def MergeTrace(events):
+  """Merge trace events collected by another process into this one's."""
+  with _LOCK:
+    _EVENTS.extend(events)
+
+
+def TraceSummary(events, category='task'):
+  """Summarize how busy the processes running spans of category were.
+
+  Args:
+    events: trace events, as returned by CollectTrace.
+    category: the category of the spans of work, e.g. one per render task.
+
+  Returns:
+    a dict with the number of 'processes', the 'seconds' from the first span
+    start to the last span end, the 'busy' fraction of processes * seconds
+    spent in spans, and the 'idle' seconds of each process.
+  """
+  spans = [x for x in events if x.get('cat') == category]
+  if not spans:
+    return {'processes': 0, 'seconds': 0.0, 'busy': 0.0, 'idle': {}}
+  start = min(x['ts'] for x in spans)
+  end = max(x['ts'] + x['dur'] for x in spans)
+  busy = {}
+  for span in spans:
+    busy[span['pid']] = busy.get(span['pid'], 0) + span['dur']
+  length = max(end - start, 1)
+  return {'processes': len(busy),
+          'seconds': length / 1e6,
+          'busy': float(sum(busy.values())) / (length * len(busy)),
+          'idle': dict((pid, (length - x) / 1e6) for pid, x in busy.items())}
+
+
+def SaveTrace(trace_file, events, process_names=None):
+  """Write trace events in the Chrome trace event format.
+
+  Args:
+    trace_file: the JSON file to write.
+    events: trace events, as returned by CollectTrace.
+    process_names: optional dict of pid to the name of its track.
+  """
+  events = sorted(events, key=lambda x: (x['ts'], -x['dur']))
+  base = events[0]['ts'] if events else 0
+  trace = []
+  for pid, name in sorted((process_names or {}).items()):
+    trace.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                  'args': {'name': name}})
+  for event in events:
+    event = dict(event, ts=event['ts'] - base)
+    trace.append(event)
+  with open(trace_file, 'w') as f:
+    json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,209 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""A content-addressed cache of rendered ACLs, shared between processes.
+
+Entries are keyed by a digest of everything a rendering depends on, see
+manifest.PolicyDigest, and the platform.  Checkouts and jobs on the same host
+which render identical inputs can then share one cache directory.
+
+Entries are written to a temporary file and renamed into place, so readers
+never see a partial entry and need no lock.  Reading an entry bumps its
+mtime, and once the cache outgrows its size the least recently used entries
+are removed.  Eviction and the hit/miss statistics are serialized with an
+flock() on the cache directory's lock file.
+
+Sample usage:
+    cache = rendercache.RenderCache('/var/cache/aclgen', max_bytes=2**29)
+    key = rendercache.Key(manifest.PolicyDigest(...), 'juniper')
+    texts = cache.Get(key)
+    if texts is None:
+      texts = [('', str(juniper.Juniper(pol, exp_info)))]
+      cache.Put(key, texts)
+    cache.Flush()
+"""
+
+__author__ = 'pmoody@google.com'
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+
+import logging
+
+
+_STAT_FIELDS = ('hits', 'misses', 'puts', 'evictions')
+
+
+def Key(policy_digest, platform):
+  """Return the cache key of a policy rendered for a platform."""
+  return hashlib.sha1('%s %s' % (policy_digest, platform)).hexdigest()
+
+
+class RenderCache(object):
+  """A directory of rendered ACLs, with LRU size based eviction.
+
+  Attributes:
+    cache_dir: the cache directory.
+    max_bytes: the size the cache is evicted down to.
+    stats: dict of the hits, misses, puts and evictions of this process
+      since the last Flush.
+  """
+
+  def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self.stats = dict((x, 0) for x in _STAT_FIELDS)
+    self._objects = os.path.join(cache_dir, 'objects')
+    if not os.path.isdir(self._objects):
+      try:
+        os.makedirs(self._objects)
+      except OSError:
+        # created by a concurrent process.
+        if not os.path.isdir(self._objects):
+          raise
+
+  def _Path(self, key):
+    return os.path.join(self._objects, key[:2], key)
+
+  def Get(self, key):
+    """Return the cached list of (suffix, acl text) of key, or None."""
+    path = self._Path(key)
+    try:
+      with open(path) as f:
+        texts = [tuple(x) for x in json.load(f)]
+      os.utime(path, None)
+    except (IOError, OSError, ValueError):
+      # missing, or evicted since.
+      self.stats['misses'] += 1
+      return None
+    self.stats['hits'] += 1
+    return [(str(suffix), str(text)) for suffix, text in texts]
+
+  def Put(self, key, texts):
+    """Atomically store the list of (suffix, acl text) of key."""
+    path = self._Path(key)
+    try:
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+      if not os.path.isdir(os.path.dirname(path)):
+        raise
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+      with os.fdopen(fd, 'w') as f:
+        json.dump(texts, f)
+      os.chmod(tmp_file, 0o644)
+      os.rename(tmp_file, path)
+    except (IOError, OSError) as e:
+      logging.warn('unable to cache %s: %s', key, e)
+      if os.path.exists(tmp_file):
+        os.unlink(tmp_file)
+      return
+    self.stats['puts'] += 1
+
+  def Collect(self):
+    """Return and reset the statistics of this process."""
+    stats = self.stats
+    self.stats = dict((x, 0) for x in _STAT_FIELDS)
+    return stats
+
+  def Merge(self, stats):
+    """Add statistics collected by another process to this one's."""
+    for field in _STAT_FIELDS:
+      self.stats[field] += stats.get(field, 0)
+
+  def _Lock(self):
+    """Return an open file holding the exclusive lock of the cache."""
+    lock = open(os.path.join(self.cache_dir, 'lock'), 'a')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+  def Flush(self):
+    """Record the statistics of this process, and evict if needed.
+
+    Returns:
+      the cumulated statistics of the cache.
+    """
+    lock = self._Lock()
+    try:
+      self.stats['evictions'] += self._Evict()
+      totals = self._ReadStats()
+      for field in _STAT_FIELDS:
+        totals[field] = totals.get(field, 0) + self.stats[field]
+      stats_file = os.path.join(self.cache_dir, 'stats.json')
+      with open(stats_file + '.tmp', 'w') as f:
+        json.dump(totals, f, sort_keys=True)
+      os.rename(stats_file + '.tmp', stats_file)
+    finally:
+      lock.close()
+    self.stats = dict((x, 0) for x in _STAT_FIELDS)
+    return totals
+
+  def _ReadStats(self):
+    try:
+      with open(os.path.join(self.cache_dir, 'stats.json')) as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return {}
+
+  def Stats(self):
+    """Return the cumulated statistics, and the size of the cache."""
+    stats = self._ReadStats()
+    entries = self._Entries()
+    stats['entries'] = len(entries)
+    stats['bytes'] = sum(x[1] for x in entries)
+    return stats
+
+  def _Entries(self):
+    """Return a list of (mtime, size, path) of the cache entries."""
+    entries = []
+    for dirname, _, filenames in os.walk(self._objects):
+      for filename in filenames:
+        if filename.startswith('.tmp'):
+          continue
+        path = os.path.join(dirname, filename)
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+  def _Evict(self):
+    """Remove the least recently used entries, with the lock held.
+
+    Returns:
+      the number of entries removed.
+    """
+    entries = self._Entries()
+    size = sum(x[1] for x in entries)
+    if size <= self.max_bytes:
+      return 0
+    evicted = 0
+    # leave some room, so the next runs don't all have to evict.
+    for _, entry_size, path in sorted(entries):
+      if size <= self.max_bytes * 0.9:
+        break
+      try:
+        os.unlink(path)
+      except OSError:
+        continue
+      size -= entry_size
+      evicted += 1
+    logging.debug('evicted %d entries from %s', evicted, self.cache_dir)
+    return evicted
@@ -0,0 +1,224 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""A render daemon protocol over a local Unix socket.
+
+A long running aclgen keeps its definitions, the policy parser and its caches
+in memory, and answers requests from short lived clients, which then no
+longer pay for starting an interpreter and parsing the definitions.
+
+Requests and responses are JSON objects, one per line, several of which can
+be sent over one connection.  A request names its 'command', the response
+has 'ok' set, and either the result of the command or an 'error' string.
+Commands are run one at a time, as the policy parser is not thread safe.
+
+Sample usage, on the server:
+    server = renderd.Server('/tmp/aclgen.sock', {'render': Render})
+    server.serve_forever()
+
+and on the client:
+    client = renderd.Client('/tmp/aclgen.sock')
+    result = client.Call('render', policy_file='policies/pol/sample.pol')
+"""
+
+__author__ = 'pmoody@google.com'
+
+import json
+import os
+import socket
+import SocketServer
+import threading
+import time
+
+import logging
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+class RequestError(Error):
+  """Raised by the client when the daemon fails a request."""
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+  """Answers the requests of one client connection."""
+
+  def handle(self):
+    while True:
+      line = self.rfile.readline()
+      if not line:
+        return
+      self.wfile.write(json.dumps(self.server.Dispatch(line)) + '\n')
+      self.wfile.flush()
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+  """A Unix socket server dispatching requests to command handlers.
+
+  Besides the handlers given, 'status' reports the request counters and
+  'shutdown' stops the server.
+  """
+
+  daemon_threads = True
+
+  def __init__(self, socket_path, handlers):
+    """Initializer.
+
+    Args:
+      socket_path: path of the Unix socket, replaced if it exists.
+      handlers: dict of command name to a function called with the request
+        dict, returning a dict of results or raising an exception.
+    """
+    if os.path.exists(socket_path):
+      os.unlink(socket_path)
+    SocketServer.UnixStreamServer.__init__(self, socket_path, _Handler)
+    self.socket_path = socket_path
+    self.handlers = dict(handlers)
+    self.handlers['status'] = self._Status
+    self.handlers['shutdown'] = self._Shutdown
+    self.started = time.time()
+    self.requests = 0
+    self.errors = 0
+    self.seconds = 0.0
+    self._lock = threading.Lock()
+
+  def Dispatch(self, line):
+    """Run the request in line, returning the response dict."""
+    try:
+      request = json.loads(line)
+      handler = self.handlers[request['command']]
+    except (ValueError, TypeError, KeyError) as e:
+      return {'ok': False, 'error': 'bad request: %s' % e}
+    with self._lock:
+      start = time.time()
+      self.requests += 1
+      try:
+        response = handler(request) or {}
+        response['ok'] = True
+      except KeyError as e:
+        self.errors += 1
+        response = {'ok': False, 'error': 'missing argument: %s' % e}
+      except Exception as e:  # pylint: disable=broad-except
+        logging.warn('%s request failed: %s', request['command'], e)
+        self.errors += 1
+        response = {'ok': False, 'error': str(e)}
+      self.seconds += time.time() - start
+    return response
+
+  def _Status(self, unused_request):
+    return {'pid': os.getpid(),
+            'uptime': time.time() - self.started,
+            'requests': self.requests,
+            'errors': self.errors,
+            'seconds': self.seconds}
+
+  def _Shutdown(self, unused_request):
+    # shutdown() waits for serve_forever() to return, so it can't be called
+    # from the thread handling this request.
+    threading.Thread(target=self.shutdown).start()
+    return {}
+
+  def server_close(self):
+    SocketServer.UnixStreamServer.server_close(self)
+    if os.path.exists(self.socket_path):
+      os.unlink(self.socket_path)
+
+
+class Client(object):
+  """A connection to a render daemon."""
+
+  def __init__(self, socket_path, timeout=None):
+    self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self._socket.settimeout(timeout)
+    self._socket.connect(socket_path)
+    self._file = self._socket.makefile('rw')
+
+  def Call(self, command, **kwargs):
+    """Send a request and wait for its response.
+
+    Args:
+      command: the name of the command.
+      **kwargs: the arguments of the command.
+
+    Returns:
+      the response dict.
+
+    Raises:
+      RequestError: if the daemon failed the request.
+    """
+    kwargs['command'] = command
+    self._file.write(json.dumps(kwargs) + '\n')
+    self._file.flush()
+    line = self._file.readline()
+    if not line:
+      raise RequestError('connection closed by the daemon')
+    response = json.loads(line)
+    if not response.get('ok'):
+      raise RequestError(response.get('error'))
+    return response
+
+  def Close(self):
+    self._file.close()
+    self._socket.close()
+
+
+def LoadTest(socket_path, request, count=100, concurrency=1):
+  """Measure the request rate of a daemon.
+
+  Args:
+    socket_path: path of the daemon's socket.
+    request: the request dict sent, repeatedly.
+    count: total number of requests sent.
+    concurrency: number of clients sending requests at the same time.
+
+  Returns:
+    a dict with the number of 'requests' and 'errors', the wall 'seconds',
+    the 'rps' and the 'p50' and 'p99' request latencies in seconds.
+  """
+  latencies = []
+  errors = []
+  request = dict(request)
+  command = request.pop('command')
+
+  def _Run(requests):
+    client = Client(socket_path)
+    try:
+      for _ in range(requests):
+        start = time.time()
+        try:
+          client.Call(command, **request)
+        except RequestError:
+          errors.append(1)
+        latencies.append(time.time() - start)
+    finally:
+      client.Close()
+
+  threads = [threading.Thread(target=_Run, args=(
+      count // concurrency + (i < count % concurrency),))
+             for i in range(concurrency)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  seconds = time.time() - start
+  latencies.sort()
+  return {'requests': len(latencies),
+          'errors': len(errors),
+          'seconds': seconds,
+          'rps': len(latencies) / seconds if seconds else 0.0,
+          'p50': latencies[len(latencies) // 2] if latencies else 0.0,
+          'p99': latencies[len(latencies) * 99 // 100] if latencies else 0.0}
@@ -0,0 +1,315 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""A pool of rendering processes which governs their memory.
+
+A multiprocessing.Pool keeps its processes for the whole run.  The heap a
+large policy leaves behind (deep copies, expanded address lists) is rarely
+returned to the system, so the RSS of every process only ratchets up.
+RenderPool instead:
+
+  - replaces a process by a freshly forked one after max_tasks tasks, or
+    once its RSS exceeds max_rss after a task;
+  - only starts a task while the estimated memory of the running tasks stays
+    within memory_budget, so huge policies don't all render at once.  A task
+    estimated above the budget renders alone;
+  - reports the peak RSS of every task, and how much it grew the RSS the
+    process started the task with.
+
+Every process is handed its tasks over its own pipe, so the pool knows which
+task each process runs, and a process which dies, e.g. killed by the OOM
+killer, fails its task rather than hanging the run.  Processes are forked,
+so the pool is only available where fork() is.
+
+Sample usage:
+    pool = renderpool.RenderPool(4, Render, max_rss=2**30,
+                                 memory_budget=2**32)
+    for args, result, stats in pool.Run([(args, memory_estimate), ...]):
+      ...
+    pool.Close()
+"""
+
+__author__ = 'pmoody@google.com'
+
+import multiprocessing
+import os
+import resource
+import select
+import sys
+import traceback
+
+import logging
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+def _Status(field):
+  """Return a size field of /proc/self/status in bytes, or None."""
+  try:
+    with open('/proc/self/status') as f:
+      for line in f:
+        if line.startswith(field + ':'):
+          return int(line.split()[1]) * 1024
+  except (IOError, ValueError, IndexError):
+    pass
+  return None
+
+
+def _MaxRss():
+  """The peak RSS of the process since it started, in bytes."""
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    return maxrss
+  return maxrss * 1024
+
+
+def Rss():
+  """Return the RSS of the process in bytes, or its peak if unknown."""
+  rss = _Status('VmRSS')
+  if rss is None:
+    return _MaxRss()
+  return rss
+
+
+def PeakRss():
+  """Return the peak RSS of the process since ResetPeakRss, in bytes."""
+  peak = _Status('VmHWM')
+  if peak is None:
+    return _MaxRss()
+  return peak
+
+
+def ResetPeakRss():
+  """Reset the peak RSS of the process to its RSS, where Linux allows it.
+
+  Elsewhere, PeakRss keeps returning the peak since the process started.
+  """
+  try:
+    with open('/proc/self/clear_refs', 'w') as f:
+      f.write('5')
+  except IOError:
+    pass
+
+
+def _Work(conn, func, initializer, initargs, max_tasks, max_rss, inherited):
+  """The loop of a pool process, running the tasks sent over conn."""
+  # the pipes of the other processes, so they see the pool close them.
+  for other in inherited:
+    other.close()
+  if initializer is not None:
+    initializer(*initargs)
+  tasks = 0
+  while True:
+    try:
+      args = conn.recv()
+    except EOFError:
+      return
+    if args is None:
+      return
+    ResetPeakRss()
+    start_rss = Rss()
+    try:
+      result = func(args)
+      error = None
+    except Exception:  # pylint: disable=broad-except
+      result = None
+      error = traceback.format_exc()
+    tasks += 1
+    rss = Rss()
+    peak = max(PeakRss(), rss)
+    stats = {'pid': os.getpid(), 'tasks': tasks, 'rss': rss,
+             'peak_rss': peak, 'growth': max(0, peak - start_rss)}
+    if error:
+      stats['error'] = error
+    retire = bool((max_tasks and tasks >= max_tasks) or
+                  (max_rss and rss > max_rss))
+    conn.send((result, stats, retire))
+    if retire:
+      return
+
+
+class _Process(object):
+  """A pool process, its pipe and the task it runs."""
+
+  def __init__(self, process, conn):
+    self.process = process
+    self.conn = conn
+    # (index, args, memory) of the running task, or None.
+    self.task = None
+
+  def fileno(self):
+    return self.conn.fileno()
+
+
+class RenderPool(object):
+  """A pool of processes running tasks within a memory budget.
+
+  Attributes:
+    recycled: number of processes replaced after max_tasks or max_rss.
+    died: number of processes which died while running a task.
+    throttled: number of tasks which waited for the memory budget.
+    peak_admitted: the highest estimated memory of the tasks run at once.
+  """
+
+  def __init__(self, processes, func, initializer=None, initargs=(),
+               max_tasks=0, max_rss=0, memory_budget=0, fork_lock=None):
+    """Initializer.
+
+    Args:
+      processes: number of processes.
+      func: the function run by the processes, called with the args of a
+        task; it and its result must be picklable.
+      initializer: optional function called by every new process.
+      initargs: the arguments of initializer.
+      max_tasks: replace a process after this many tasks, 0 to never.
+      max_rss: replace a process once its RSS exceeds this many bytes after
+        a task, 0 to never.
+      memory_budget: bytes the estimated memory of the running tasks is kept
+        within, 0 for no budget.
+      fork_lock: optional lock held while forking a new process, which the
+        other threads of the process hold while they hold locks that the new
+        process may need, e.g. aclwriter.AclWriter.lock.
+    """
+    self.recycled = 0
+    self.died = 0
+    self.throttled = 0
+    self.peak_admitted = 0
+    self._func = func
+    self._initializer = initializer
+    self._initargs = initargs
+    self._max_tasks = max_tasks
+    self._max_rss = max_rss
+    self._memory_budget = memory_budget
+    self._fork_lock = fork_lock
+    self._waited = set()
+    self._processes = []
+    for _ in range(max(1, processes)):
+      self._processes.append(self._Start())
+
+  def _Start(self):
+    """Fork a new pool process."""
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_Work,
+        args=(child_conn, self._func, self._initializer, self._initargs,
+              self._max_tasks, self._max_rss,
+              [conn] + [x.conn for x in self._processes]))
+    process.daemon = True
+    if self._fork_lock is not None:
+      with self._fork_lock:
+        process.start()
+    else:
+      process.start()
+    child_conn.close()
+    return _Process(process, conn)
+
+  def _Replace(self, worker):
+    """Reap a process which exited, and fork its replacement."""
+    worker.conn.close()
+    worker.process.join()
+    self._processes[self._processes.index(worker)] = self._Start()
+
+  def _Admit(self, pending):
+    """Pop the first pending task the memory budget lets start, or None.
+
+    Tasks starting ahead of a task waiting for the budget leave it room to
+    start once the running tasks at least as large as it finish.
+
+    Args:
+      pending: list of (index, args, memory) in submission order.
+    """
+    if not pending:
+      return None
+    running = [x.task[2] for x in self._processes if x.task]
+    if not self._memory_budget or not running:
+      return pending.pop(0)
+    in_use = sum(running)
+    head = pending[0][2]
+    if in_use + head <= self._memory_budget:
+      return pending.pop(0)
+    if pending[0][0] not in self._waited:
+      self._waited.add(pending[0][0])
+      self.throttled += 1
+    smaller = sum(x for x in running if x < head)
+    for i, (_, _, memory) in enumerate(pending):
+      if (in_use + memory <= self._memory_budget and
+          smaller + memory <= self._memory_budget - head):
+        return pending.pop(i)
+    return None
+
+  def Run(self, tasks):
+    """Run tasks, yielding their results as they complete.
+
+    Args:
+      tasks: list of (args, memory) tuples in the order they should start,
+        memory being the estimated memory of the task in bytes.
+
+    Yields:
+      (args, result, stats) tuples, result being None if the task failed.
+      stats is a dict with the 'pid' of the process, its 'rss' after the
+      task, the 'peak_rss' during the task and its 'growth' over the RSS
+      before the task, and, if the task failed, the 'error' string.
+    """
+    pending = [(i, args, memory) for i, (args, memory) in enumerate(tasks)]
+    # the indexes of the tasks which waited for the memory budget.
+    self._waited = set()
+    while pending or any(x.task for x in self._processes):
+      for worker in self._processes:
+        if worker.task:
+          continue
+        task = self._Admit(pending)
+        if task is None:
+          break
+        worker.task = task
+        worker.conn.send(task[1])
+      self.peak_admitted = max(self.peak_admitted, sum(
+          x.task[2] for x in self._processes if x.task))
+      ready, _, _ = select.select(
+          [x for x in self._processes if x.task], [], [])
+      for worker in ready:
+        _, args, _ = worker.task
+        worker.task = None
+        try:
+          result, stats, retire = worker.conn.recv()
+        except (EOFError, IOError):
+          worker.process.join()
+          self.died += 1
+          logging.warn('rendering process %d died with exit code %s',
+                       worker.process.pid, worker.process.exitcode)
+          self._Replace(worker)
+          yield args, None, {'pid': worker.process.pid, 'error': (
+              'rendering process died with exit code %s' %
+              worker.process.exitcode)}
+          continue
+        if retire:
+          self.recycled += 1
+          logging.debug('replacing rendering process %d after %d tasks, '
+                        'RSS %d MiB', stats['pid'], stats['tasks'],
+                        stats['rss'] / 1024 / 1024)
+          self._Replace(worker)
+        yield args, result, stats
+
+  def Close(self):
+    """Stop the processes once they finished their task."""
+    for worker in self._processes:
+      try:
+        worker.conn.send(None)
+      except IOError:
+        pass
+    for worker in self._processes:
+      worker.process.join()
+      worker.conn.close()
@@ -0,0 +1,203 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Cost-aware ordering of rendering tasks.
+
+Submitting policies to the rendering pool in directory order lets a few large
+policies which happen to come last define the run's wall-clock.  Tasks are
+instead submitted largest first (LPT), using as their cost the time they took
+on the previous run when known, and otherwise an estimate from a quick scan of
+the policy: its size and the number of terms and targets it has.  The tasks
+of a group, e.g. the platforms of one policy, are kept together, largest
+group first, so a process rendering them in turn parses the policy once.  The
+memory a task needs, the growth of the peak RSS of the process rendering it,
+is estimated the same way, for pools rendering with a memory budget.
+
+Sample usage:
+    timings = schedule.LoadTimings('.aclgen_timings')
+    tasks = [schedule.Task(key, schedule.ScanUnits(pol_file), args), ...]
+    schedule.Estimate(tasks, timings)
+    schedule.EstimateMemory(tasks, timings)
+    tasks = schedule.LptOrder(tasks)
+    predicted = schedule.PredictMakespan(tasks, workers)
+"""
+
+__author__ = 'pmoody@google.com'
+
+import json
+import os
+import re
+
+from lib import policy
+
+import logging
+
+
+# seconds per cost unit used when there are no timings to calibrate with.
+DEFAULT_SECONDS_PER_UNIT = 0.01
+# bytes of peak RSS growth per cost unit, likewise.
+DEFAULT_BYTES_PER_UNIT = 64 * 1024
+
+_TERM_RE = re.compile(r'^\s*term\s', re.MULTILINE)
+_TARGET_RE = re.compile(r'^\s*target::', re.MULTILINE)
+
+
+class Task(object):
+  """A rendering task and its estimated cost.
+
+  Attributes:
+    key: a string identifying the task across runs.
+    units: the heuristic cost of the task, see ScanUnits.
+    args: the arguments of the task.
+    group: the tasks submitted together, by default the task alone.
+    estimate: the estimated run time of the task in seconds.
+    memory: the estimated peak RSS growth of the task in bytes.
+  """
+
+  def __init__(self, key, units, args, group=None):
+    self.key = key
+    self.units = units
+    self.args = args
+    self.group = key if group is None else group
+    self.estimate = None
+    self.memory = None
+
+
+def ScanUnits(input_file, platforms=1):
+  """Return the heuristic cost of rendering a policy, without parsing it.
+
+  Args:
+    input_file: the name of the input policy file.
+    platforms: number of platforms rendered by the task, or None if the task
+      renders every platform targeted by the policy.
+
+  Returns:
+    a float, (1 + terms + size in KiB) * platforms.
+  """
+  try:
+    data = policy._ReadFile(input_file)
+  except policy.Error:
+    return 1.0
+  if platforms is None:
+    platforms = len(_TARGET_RE.findall(data))
+  return (1 + len(_TERM_RE.findall(data)) + len(data) / 1024.0) * max(
+      1, platforms)
+
+
+def Estimate(tasks, timings):
+  """Set the estimated run time of tasks.
+
+  Tasks which ran before are estimated at their previous run time, the others
+  from their units, at the average seconds per unit of the tasks which ran.
+
+  Args:
+    tasks: list of Task objects.
+    timings: dict of task key to {'seconds': float, 'units': float}.
+  """
+  seconds = sum(timings[x.key]['seconds'] for x in tasks if x.key in timings)
+  units = sum(timings[x.key]['units'] for x in tasks if x.key in timings)
+  seconds_per_unit = DEFAULT_SECONDS_PER_UNIT
+  if seconds and units:
+    seconds_per_unit = seconds / units
+  for task in tasks:
+    if task.key in timings:
+      task.estimate = timings[task.key]['seconds']
+    else:
+      task.estimate = task.units * seconds_per_unit
+
+
+def EstimateMemory(tasks, timings):
+  """Set the estimated memory of tasks.
+
+  Tasks whose peak RSS growth was recorded are estimated at it, the others
+  from their units, at the average bytes per unit of the recorded tasks.
+
+  Args:
+    tasks: list of Task objects.
+    timings: dict of task key to {'units': float, 'memory': bytes, ...},
+      'memory' being optional.
+  """
+  known = [timings[x.key] for x in tasks
+           if x.key in timings and 'memory' in timings[x.key]]
+  memory = sum(x['memory'] for x in known)
+  units = sum(x['units'] for x in known)
+  bytes_per_unit = DEFAULT_BYTES_PER_UNIT
+  if memory and units:
+    bytes_per_unit = float(memory) / units
+  for task in tasks:
+    if task.key in timings and 'memory' in timings[task.key]:
+      task.memory = timings[task.key]['memory']
+    else:
+      task.memory = int(task.units * bytes_per_unit)
+
+
+def LptOrder(tasks):
+  """Return tasks ordered longest processing time first.
+
+  The groups are ordered by their total estimate, and the tasks of a group
+  are kept contiguous, longest first.
+
+  Args:
+    tasks: list of Task objects, with estimates.
+
+  Returns:
+    the list of tasks in submission order.
+  """
+  groups = {}
+  order = []
+  for task in tasks:
+    if task.group not in groups:
+      groups[task.group] = []
+      order.append(task.group)
+    groups[task.group].append(task)
+  order.sort(key=lambda x: -sum(y.estimate for y in groups[x]))
+  ordered = []
+  for group in order:
+    ordered.extend(sorted(groups[group], key=lambda x: -x.estimate))
+  return ordered
+
+
+def PredictMakespan(tasks, workers):
+  """Predict the wall-clock of running tasks in order on a pool of workers.
+
+  Args:
+    tasks: list of Task objects, with estimates, in submission order.
+    workers: number of processes in the pool.
+
+  Returns:
+    the predicted makespan in seconds.
+  """
+  loads = [0.0] * max(1, workers)
+  for task in tasks:
+    loads[loads.index(min(loads))] += task.estimate
+  return max(loads)
+
+
+def LoadTimings(timings_file):
+  """Load task timings, returning none if they cannot be read."""
+  try:
+    with open(timings_file) as f:
+      return json.load(f)
+  except (IOError, ValueError) as e:
+    logging.debug('not using timings %s: %s', timings_file, e)
+    return {}
+
+
+def SaveTimings(timings_file, timings):
+  """Atomically replace timings_file with timings."""
+  tmp_file = '%s.tmp' % timings_file
+  with open(tmp_file, 'w') as f:
+    json.dump(timings, f, indent=1, sort_keys=True)
+  os.rename(tmp_file, timings_file)
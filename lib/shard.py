@@ -0,0 +1,142 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Splitting an aclgen run into shards, and merging their results.
+
+Every runner discovers the same policies and keeps those assigned to its
+shard.  Policies are assigned by a stable hash of their path relative to the
+base directory, so the assignment doesn't depend on the machine, the order
+of discovery or the other policies.  With costs, e.g. the timings of a
+previous run shared by all runners, policies are instead assigned largest
+first to the least loaded shard, which balances the shards but moves
+policies between shards when the costs change.
+
+Each shard renders into its own output directory and records its outputs in
+its manifest (see manifest.py).  Merge() combines the manifests and copies
+the outputs into a single directory, and Verify() checks that every policy
+was rendered by exactly one shard.
+
+Sample usage:
+    shards = shard.Assign(['corp/pol/a.pol', 'prod/pol/b.pol'], 4)
+    if shards['corp/pol/a.pol'] == shard_index:
+      ...
+"""
+
+__author__ = 'pmoody@google.com'
+
+import filecmp
+import hashlib
+import os
+import shutil
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+class MergeError(Error):
+  """Raised when shards can't be merged."""
+
+
+def StableShard(key, shard_count):
+  """Return the shard of key, from a hash independent of the platform."""
+  return int(hashlib.sha1(key).hexdigest(), 16) % shard_count
+
+
+def Assign(keys, shard_count, costs=None):
+  """Assign keys to shards.
+
+  Args:
+    keys: the keys to assign, e.g. policy paths relative to the base dir.
+    shard_count: the number of shards.
+    costs: optional dict of key to cost; keys are then assigned largest first
+      to the least loaded shard, ties broken by key, instead of by hash.
+
+  Returns:
+    a dict of key to shard index.
+  """
+  if costs is None:
+    return dict((x, StableShard(x, shard_count)) for x in keys)
+  loads = [0.0] * shard_count
+  shards = {}
+  for key in sorted(keys, key=lambda x: (-costs.get(x, 0.0), x)):
+    shards[key] = loads.index(min(loads))
+    loads[shards[key]] += costs.get(key, 0.0)
+  return shards
+
+
+def Merge(shards, output_directory):
+  """Combine the outputs and manifests of shards.
+
+  Args:
+    shards: list of (shard output directory, manifest entries) tuples.
+    output_directory: the directory the outputs are copied into.
+
+  Returns:
+    the merged manifest entries, with outputs under output_directory.
+
+  Raises:
+    MergeError: if a policy was rendered by more than one shard, or an output
+      is missing or outside the output directory of its shard.
+  """
+  merged = {}
+  for shard_directory, entries in shards:
+    for input_file, entry in sorted(entries.items()):
+      if input_file in merged:
+        raise MergeError('%s was rendered by more than one shard' % input_file)
+      outputs = []
+      for output_file in entry.get('outputs', []):
+        relative = os.path.relpath(output_file, shard_directory)
+        if relative.startswith(os.pardir) or not os.path.exists(output_file):
+          raise MergeError('output %s of %s is missing from %s' % (
+              output_file, input_file, shard_directory))
+        target = os.path.join(output_directory, relative)
+        if not os.path.isdir(os.path.dirname(target)):
+          os.makedirs(os.path.dirname(target))
+        shutil.copy2(output_file, target)
+        outputs.append(target)
+      merged[input_file] = dict(entry, outputs=sorted(outputs))
+  return merged
+
+
+def Verify(entries, expected_policies):
+  """Check that merged manifest entries cover exactly the expected policies.
+
+  Args:
+    entries: the merged manifest entries.
+    expected_policies: the policies of a full run.
+
+  Returns:
+    a tuple of the sorted lists of missing and unexpected policies.
+  """
+  expected = set(expected_policies)
+  return sorted(expected - set(entries)), sorted(set(entries) - expected)
+
+
+def CompareTrees(directory, other_directory):
+  """Return the sorted relative paths of files which differ between trees."""
+  files = set()
+  for root in (directory, other_directory):
+    for dirname, _, filenames in os.walk(root):
+      for filename in filenames:
+        files.add(os.path.relpath(os.path.join(dirname, filename), root))
+  differ = []
+  for relative in sorted(files):
+    a = os.path.join(directory, relative)
+    b = os.path.join(other_directory, relative)
+    if not (os.path.isfile(a) and os.path.isfile(b) and
+            filecmp.cmp(a, b, shallow=False)):
+      differ.append(relative)
+  return differ
@@ -0,0 +1,353 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Policy templates, rendered into one policy per instance.
+
+A template is a policy file ending in .tmpl whose headers and terms may use
+${NAME} variables, next to a .bindings file of the same name holding the
+table of instances: a first line naming the columns, the first being the
+instance name, then one line per instance giving the value of each variable.
+
+    # edge.bindings
+    instance  SITE  SITE_SERVERS
+    nyc1      nyc1  NYC1_SERVERS
+    lon1      lon1  LON1_SERVERS
+
+Each instance renders like a policy file named after the instance holding
+the template with its bindings substituted.  The template is split into its
+header and term blocks once, and every distinct block, after substitution, is
+parsed and expanded once: the terms without variables are shared by all the
+instances, so only the terms using variables are expanded per instance.
+
+Sample usage:
+    tmpl = template.Load('pol/edge.tmpl', base_dir='.')
+    for instance in tmpl.Instances():
+      pol = tmpl.Parse(instance, definitions)
+"""
+
+__author__ = 'pmoody@google.com'
+
+import hashlib
+import os
+import re
+
+from lib import policy
+
+
+SUFFIX = '.tmpl'
+BINDINGS_SUFFIX = '.bindings'
+
+_VARIABLE = re.compile(r'\$\{(\w+)\}')
+# parsed along with a header, which needs a term to parse.
+_PLACEHOLDER_TERM = '\nterm template-placeholder {\n  action:: accept\n}\n'
+# parsed along with a term, which needs a header to parse.
+_PLACEHOLDER_HEADER = 'header {\n  target:: template\n}\n'
+
+
+class Error(Exception):
+  """Base Error class."""
+
+
+class TemplateError(Error):
+  """Raised when a template or its bindings are malformed."""
+
+
+class UnboundVariableError(Error):
+  """Raised when a template uses a variable its bindings don't define."""
+
+
+def IsTemplate(filename):
+  return filename.endswith(SUFFIX)
+
+
+def BindingsFile(template_file):
+  """Return the bindings file of a template file."""
+  return template_file[:-len(SUFFIX)] + BINDINGS_SUFFIX
+
+
+def InstanceFile(template_file, instance):
+  """Return the policy file name an instance of a template renders as."""
+  return os.path.join(os.path.dirname(template_file), '%s.pol' % instance)
+
+
+def InstanceDigest(template_digest, instance):
+  """Return the digest of an instance, from the digest of its template."""
+  return hashlib.sha1('%s %s' % (template_digest, instance)).hexdigest()
+
+
+def ParseBindings(data):
+  """Parse a bindings table.
+
+  Args:
+    data: the text of the table.
+
+  Returns:
+    a list of (instance name, {variable: value}) in the order of the table.
+
+  Raises:
+    TemplateError: if the table is malformed.
+  """
+  columns = None
+  instances = []
+  seen = set()
+  for line_number, line in enumerate(data.splitlines(), 1):
+    words = line.split('#')[0].split()
+    if not words:
+      continue
+    if columns is None:
+      columns = words
+      continue
+    if len(words) != len(columns):
+      raise TemplateError('line %d of bindings has %d columns, expected %d' %
+                          (line_number, len(words), len(columns)))
+    if words[0] in seen:
+      raise TemplateError('instance %s is bound twice' % words[0])
+    seen.add(words[0])
+    instances.append((words[0], dict(zip(columns[1:], words[1:]))))
+  return instances
+
+
+def SplitBlocks(data):
+  """Split policy text into its header and term blocks.
+
+  Args:
+    data: policy text, without includes.
+
+  Returns:
+    a list of (kind, text), kind being 'header' or 'term' and text the block
+    along with the comments preceding it.
+
+  Raises:
+    TemplateError: if the braces are not balanced.
+  """
+  blocks = []
+  start = 0
+  depth = 0
+  i = 0
+  while i < len(data):
+    c = data[i]
+    if c == '#':
+      end = data.find('\n', i)
+      i = len(data) if end < 0 else end
+      continue
+    if c == '"':
+      # a string ends at the next quote not escaped with a backslash.
+      end = i + 1
+      while end < len(data) and (data[end] != '"' or data[end - 1] == '\\'):
+        end += 1
+      i = end + 1
+      continue
+    if c == '{':
+      depth += 1
+    elif c == '}':
+      depth -= 1
+      if depth < 0:
+        raise TemplateError('unbalanced "}"')
+      if not depth:
+        text = data[start:i + 1]
+        kind = re.match(r'\s*(\w*)', _StripComments(text)).group(1)
+        if kind not in ('header', 'term'):
+          raise TemplateError('unexpected block %s' % kind)
+        blocks.append((kind, text))
+        start = i + 1
+    i += 1
+  if depth or _StripComments(data[start:]).strip():
+    raise TemplateError('unbalanced "{" or text after the last block')
+  return blocks
+
+
+def _StripComments(text):
+  return '\n'.join(x.split('#')[0] for x in text.splitlines())
+
+
+def Substitute(text, bindings):
+  """Replace the ${NAME} variables of text by their value in bindings.
+
+  Raises:
+    UnboundVariableError: if a variable is not in bindings.
+  """
+  def Value(match):
+    if match.group(1) not in bindings:
+      raise UnboundVariableError('variable %s is not bound' % match.group(1))
+    return bindings[match.group(1)]
+  return _VARIABLE.sub(Value, text)
+
+
+def Load(template_file, base_dir=''):
+  """Read a template file, its includes and its bindings file.
+
+  Args:
+    template_file: path of the template file.
+    base_dir: base path string where to look for include files.
+
+  Returns:
+    a Template object.
+
+  Raises:
+    policy.Error: if a file can't be read.
+    TemplateError: if the template or its bindings are malformed.
+  """
+  data = '\n'.join(policy._Preprocess(policy._ReadFile(template_file),
+                                      base_dir=base_dir))
+  bindings = ParseBindings(policy._ReadFile(BindingsFile(template_file)))
+  return Template(template_file, data, bindings, base_dir)
+
+
+class Template(object):
+  """A policy template and the bindings of its instances."""
+
+  def __init__(self, template_file, data, bindings, base_dir=''):
+    """Split a template into filters.
+
+    Args:
+      template_file: path of the template file, instances render like the
+        policy files of the same directory named after them.
+      data: the template text, without includes.
+      bindings: list of (instance name, {variable: value}).
+      base_dir: base path string where to look for include files.
+
+    Raises:
+      TemplateError: if the template is malformed.
+    """
+    self.template_file = template_file
+    self.data = data
+    self.bindings = bindings
+    self.base_dir = base_dir
+    # list of (header text, [term text])
+    self.filters = []
+    for kind, text in SplitBlocks(data):
+      if kind == 'header':
+        self.filters.append((text, []))
+      elif not self.filters:
+        raise TemplateError('term before the first header')
+      else:
+        self.filters[-1][1].append(text)
+    if not self.filters:
+      raise TemplateError('no header in %s' % template_file)
+    # parsed headers by text, parsed terms by (text, optimize).
+    self._headers = {}
+    self._terms = {}
+
+  def Instances(self):
+    return [x for x, _ in self.bindings]
+
+  def InstanceFile(self, instance):
+    return InstanceFile(self.template_file, instance)
+
+  def Platforms(self, instance, definitions):
+    """Return the set of platforms the headers of an instance target.
+
+    Raises:
+      policy.Error: if a header fails to parse.
+      UnboundVariableError: if a variable is not bound.
+    """
+    bindings = dict(self.bindings)[instance]
+    platforms = set()
+    for header_text, _ in self.filters:
+      platforms.update(self._Header(Substitute(header_text, bindings),
+                                    definitions).platforms)
+    return platforms
+
+  def Text(self, instance):
+    """Return the policy text of an instance, its bindings substituted.
+
+    Raises:
+      UnboundVariableError: if a variable is not bound.
+    """
+    bindings = dict(self.bindings)[instance]
+    texts = []
+    for header_text, term_texts in self.filters:
+      texts.extend(Substitute(x, bindings) for x in [header_text] + term_texts)
+    return '\n'.join(texts)
+
+  def _Parse(self, data, definitions, optimize):
+    pol = policy.ParsePolicy(data, definitions, optimize=optimize,
+                             base_dir=self.base_dir)
+    if not pol:
+      raise TemplateError('unable to parse %s' % self.template_file)
+    return pol.filters[0]
+
+  def _Header(self, text, definitions):
+    if text not in self._headers:
+      self._headers[text] = self._Parse(text + _PLACEHOLDER_TERM,
+                                        definitions, True)[0]
+    return self._headers[text]
+
+  def _Term(self, text, definitions, optimize):
+    """Return the translated term of a block, shared by all instances."""
+    if (text, optimize) not in self._terms:
+      self._terms[(text, optimize)] = self._Parse(
+          _PLACEHOLDER_HEADER + text, definitions, optimize)[1][0]
+    return self._terms[(text, optimize)]
+
+  def _FirstTerm(self, filters, definitions, platforms):
+    """Return where the term a standalone parse translates first is.
+
+    ParsePolicy only honors optimize=False for the first term it translates,
+    so that term is the only one not shared with optimized instances.
+
+    Returns:
+      a tuple of the index of the filter and of the term in the filter, or
+      None if no term is translated.
+    """
+    for i, (header, texts) in enumerate(filters):
+      header_platforms = header.platforms
+      if platforms:
+        header_platforms = [x for x in header_platforms if x in platforms]
+        if not header_platforms:
+          continue
+      for j, text in enumerate(texts):
+        if not platforms or policy.TermRendered(
+            self._Term(text, definitions, True), header_platforms):
+          return i, j
+    return None
+
+  def Parse(self, instance, definitions, optimize=True, shade_check=False,
+            platforms=None):
+    """Parse the policy of an instance, see policy.ParsePolicy.
+
+    Args:
+      instance: the instance name.
+      definitions: naming library definitions object.
+      optimize: bool - whether to summarize networks and services.
+      shade_check: bool - whether to raise an exception when a term is shaded.
+      platforms: optional list of the only platforms which will be rendered.
+
+    Returns:
+      a policy.Policy object, sharing its unchanged terms and headers with the
+      other instances; it must be copied before being modified.
+
+    Raises:
+      policy.Error: if the policy of the instance fails to parse.
+      Error: if the template is malformed or a variable is not bound.
+    """
+    bindings = dict(self.bindings)[instance]
+    filters = []
+    for header_text, term_texts in self.filters:
+      filters.append((self._Header(Substitute(header_text, bindings),
+                                   definitions),
+                      [Substitute(x, bindings) for x in term_texts]))
+    first = None
+    if not optimize:
+      first = self._FirstTerm(filters, definitions, platforms)
+    filters = [(header, [self._Term(x, definitions,
+                                    optimize or (i, j) != first)
+                         for j, x in enumerate(texts)])
+               for i, (header, texts) in enumerate(filters)]
+
+    # the terms are translated already, they are only pruned and checked for
+    # shading.
+    return policy.BuildPolicy(filters, definitions, shade_check=shade_check,
+                              platforms=platforms)
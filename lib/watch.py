@@ -0,0 +1,174 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Finding the policies affected by changes to their input files.
+
+A DependencyIndex records, for every policy, the files it includes and the
+network and service tokens its terms reference.  A changed policy or include
+file then maps to the policies which read it, and a change to the definitions
+maps to the policies referencing a token whose expanded value changed, nested
+tokens included.  A policy whose references can't be read is always
+affected, so it is never skipped wrongly.
+
+Files are watched by polling their size and mtime, which works on any
+filesystem and needs nothing beyond the standard library.
+
+Sample usage:
+    index = watch.DependencyIndex(base_dir='.')
+    index.Update('pol/foo.pol')
+    old = watch.Snapshot(index.Files())
+    ...
+    changed = watch.Changed(old, watch.Snapshot(index.Files()))
+    affected = index.Affected(changed)
+"""
+
+__author__ = 'pmoody@google.com'
+
+import os
+
+from lib import defstats
+from lib import manifest
+from lib import policy
+from lib import template
+
+import logging
+
+
+def Snapshot(files):
+  """Return a dict of file name to its (size, mtime), or None if missing."""
+  snapshot = {}
+  for file_name in files:
+    try:
+      stat = os.stat(file_name)
+      snapshot[file_name] = (stat.st_size, stat.st_mtime)
+    except OSError:
+      snapshot[file_name] = None
+  return snapshot
+
+
+def Changed(old, new):
+  """Return the set of files added, removed or modified between snapshots."""
+  return set(x for x in set(old) | set(new) if old.get(x) != new.get(x))
+
+
+def ChangedTokens(old_definitions, new_definitions, networks, services):
+  """Find the tokens whose expanded values differ between two definitions.
+
+  Args:
+    old_definitions: the naming.Naming object before the change.
+    new_definitions: the naming.Naming object after the change.
+    networks: the network tokens to compare.
+    services: the service tokens to compare.
+
+  Returns:
+    a tuple of the sets of changed network and service tokens.
+  """
+  changed = []
+  for def_type, tokens in (('networks', networks), ('services', services)):
+    changed.append(set(
+        x for x in tokens
+        if (manifest._TokenValues(old_definitions, x, def_type) !=
+            manifest._TokenValues(new_definitions, x, def_type))))
+  return tuple(changed)
+
+
+class DependencyIndex(object):
+  """The files and tokens each policy depends on."""
+
+  def __init__(self, base_dir=''):
+    self.base_dir = base_dir
+    # policy file -> (include files, network tokens, service tokens)
+    self._policies = {}
+    # policy files whose references can't be read, always affected.
+    self._unscanned = set()
+
+  def __contains__(self, policy_file):
+    return policy_file in self._policies
+
+  def Policies(self):
+    return set(self._policies)
+
+  def Update(self, policy_file):
+    """Read the includes and token references of policy_file again.
+
+    A policy whose references can't be read is marked unscanned: rendering
+    it reports the problem, and Affected always returns it.
+    """
+    includes = []
+    if template.IsTemplate(policy_file):
+      # the instances of a template are rendered from its bindings too.
+      includes.append(template.BindingsFile(policy_file))
+    networks = set()
+    services = set()
+    self._unscanned.discard(policy_file)
+    try:
+      policy_includes, terms = defstats.ReadPolicyReferences(policy_file,
+                                                             self.base_dir)
+    except (policy.Error, IOError, ValueError, IndexError) as e:
+      logging.debug('unable to read references of %s: %s', policy_file, e)
+      self._unscanned.add(policy_file)
+    else:
+      includes.extend(policy_includes)
+      for _, term_networks, term_services in terms:
+        networks.update(term_networks)
+        services.update(term_services)
+    self._policies[policy_file] = (set(includes), networks, services)
+
+  def Unscanned(self):
+    """Return the set of policies whose references can't be read."""
+    return set(self._unscanned)
+
+  def Remove(self, policy_file):
+    self._policies.pop(policy_file, None)
+    self._unscanned.discard(policy_file)
+
+  def Files(self):
+    """Return the set of policy, include and bindings files to watch."""
+    files = set(self._policies)
+    for includes, _, _ in self._policies.values():
+      files.update(includes)
+    return files
+
+  def Tokens(self):
+    """Return the sets of network and service tokens referenced."""
+    networks = set()
+    services = set()
+    for _, policy_networks, policy_services in self._policies.values():
+      networks.update(policy_networks)
+      services.update(policy_services)
+    return networks, services
+
+  def Affected(self, changed_files=(), networks=(), services=()):
+    """Return the policies affected by changed files or tokens.
+
+    Args:
+      changed_files: policy, include and bindings files which changed.
+      networks: network tokens whose value changed.
+      services: service tokens whose value changed.
+
+    Returns:
+      the set of policy files which need to be rendered again, the unscanned
+      policies always included.
+    """
+    changed_files = set(changed_files)
+    networks = set(networks)
+    services = set(services)
+    affected = set(self._unscanned)
+    for policy_file, (includes, policy_networks, policy_services) in (
+        self._policies.items()):
+      if (policy_file in changed_files or includes & changed_files or
+          policy_networks & networks or policy_services & services):
+        affected.add(policy_file)
+    return affected
@@ -0,0 +1,115 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for aclstore.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import aclstore
+from lib import aclwriter
+
+
+class AclStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.store_dir = self._Path('.aclstore')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def _Path(self, name):
+    return os.path.join(self.tmp_dir, name)
+
+  def _Write(self, store, files):
+    aclwriter.WriteFiles([(self._Path(x), y) for x, y in files], store=store)
+
+  def _Objects(self):
+    return sorted(x for x in os.listdir(self.store_dir)
+                  if x != aclstore.MANIFEST)
+
+  def testHardlink(self):
+    store = aclstore.AclStore(self.store_dir, aclstore.HARDLINK)
+    self._Write(store, [('a.acl', 'loopback'), ('b.acl', 'loopback'),
+                        ('c.acl', 'edge')])
+    self.assertEqual(open(self._Path('b.acl')).read(), 'loopback')
+    self.assertTrue(os.path.samefile(self._Path('a.acl'), self._Path('b.acl')))
+    self.assertTrue(aclstore.IsLinked(self._Path('c.acl'), aclstore.HARDLINK))
+    self.assertEqual(self._Objects(), sorted([aclstore.Digest('loopback'),
+                                              aclstore.Digest('edge')]))
+    self.assertEqual((store.objects, store.links, store.saved_bytes),
+                     (2, 3, len('loopback')))
+    self.assertEqual(store.Shared(), {aclstore.Digest('loopback'): [
+        self._Path('a.acl'), self._Path('b.acl')]})
+    # no temporary files are left behind.
+    self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                     ['.aclstore', 'a.acl', 'b.acl', 'c.acl'])
+
+  def testReplaceOneOutput(self):
+    store = aclstore.AclStore(self.store_dir, aclstore.HARDLINK)
+    self._Write(store, [('a.acl', 'loopback'), ('b.acl', 'loopback')])
+    self._Write(store, [('a.acl', 'edge')])
+    self.assertEqual(open(self._Path('a.acl')).read(), 'edge')
+    self.assertEqual(open(self._Path('b.acl')).read(), 'loopback')
+    self.assertEqual(store.Shared(), {})
+
+  def testSymlink(self):
+    store = aclstore.AclStore(self.store_dir, aclstore.SYMLINK)
+    os.mkdir(self._Path('corp'))
+    self._Write(store, [('corp/a.acl', 'loopback'), ('b.acl', 'loopback')])
+    self.assertEqual(os.readlink(self._Path('corp/a.acl')),
+                     '../.aclstore/%s' % aclstore.Digest('loopback'))
+    self.assertEqual(open(self._Path('corp/a.acl')).read(), 'loopback')
+    self.assertTrue(aclstore.IsLinked(self._Path('b.acl'), aclstore.SYMLINK))
+    self.assertFalse(aclstore.IsLinked(self._Path('c.acl'), aclstore.SYMLINK))
+
+  def testSave(self):
+    store = aclstore.AclStore(self.store_dir, aclstore.SYMLINK)
+    self._Write(store, [('a.acl', 'loopback'), ('b.acl', 'loopback'),
+                        ('c.acl', 'edge')])
+    self.assertEqual(store.Save(), 0)
+    with open(os.path.join(self.store_dir, aclstore.MANIFEST)) as f:
+      self.assertEqual(json.load(f)['objects'], {
+          aclstore.Digest('loopback'): [self._Path('a.acl'),
+                                        self._Path('b.acl')],
+          aclstore.Digest('edge'): [self._Path('c.acl')]})
+
+    # c.acl is rewritten without the store, its object is no longer used.
+    aclwriter.WriteFiles([(self._Path('c.acl'), 'edge')])
+    store = aclstore.AclStore(self.store_dir, aclstore.SYMLINK)
+    self.assertEqual(store.Save(), 1)
+    self.assertEqual(self._Objects(), [aclstore.Digest('loopback')])
+    self.assertEqual(len(store.Shared()), 1)
+
+  def testSaveWithoutManifest(self):
+    store = aclstore.AclStore(self.store_dir, aclstore.SYMLINK)
+    self._Write(store, [('a.acl', 'loopback')])
+    # the links to the objects are unknown without the manifest.
+    store = aclstore.AclStore(self.store_dir, aclstore.SYMLINK)
+    self.assertEqual(store.Save(), 0)
+    self.assertEqual(open(self._Path('a.acl')).read(), 'loopback')
+
+  def testUnknownMode(self):
+    self.assertRaises(aclstore.UnknownModeError, aclstore.AclStore,
+                      self.store_dir, 'copy')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,86 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for aclwriter.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from lib import aclwriter
+
+
+class AclWriterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def _Path(self, name):
+    return os.path.join(self.tmp_dir, name)
+
+  def testWriteFiles(self):
+    with open(self._Path('a.acl'), 'w') as f:
+      f.write('old')
+    aclwriter.WriteFiles([(self._Path('a.acl'), 'new a'),
+                          (self._Path('b.acl'), 'new b')], fsync=True,
+                         umask=022)
+    self.assertEqual(open(self._Path('a.acl')).read(), 'new a')
+    self.assertEqual(open(self._Path('b.acl')).read(), 'new b')
+    self.assertEqual(stat.S_IMODE(os.stat(self._Path('b.acl')).st_mode), 0644)
+    # no temporary files are left behind.
+    self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['a.acl', 'b.acl'])
+
+  def testWriteFilesError(self):
+    with open(self._Path('a.acl'), 'w') as f:
+      f.write('old')
+    self.assertRaises(aclwriter.WriteError, aclwriter.WriteFiles,
+                      [(self._Path('a.acl'), 'new a'),
+                       (self._Path('missing/b.acl'), 'new b')])
+    # nothing is replaced when a file of the batch can't be written.
+    self.assertEqual(open(self._Path('a.acl')).read(), 'old')
+    self.assertEqual(os.listdir(self.tmp_dir), ['a.acl'])
+
+  def testAclWriter(self):
+    written = []
+    writer = aclwriter.AclWriter(batch_size=2,
+                                 written_callback=lambda *x: written.append(x))
+    writer.start()
+    files = [(self._Path('%d.acl' % x), 'acl %d' % x) for x in range(5)]
+    writer.Write(files[:3])
+    writer.Write(files[3:])
+    writer.Close()
+    for output_file, file_string in files:
+      self.assertEqual(open(output_file).read(), file_string)
+    self.assertEqual(sorted(written), files)
+    self.assertEqual(writer.files, 5)
+    self.assertEqual(writer.bytes, 25)
+    self.assertTrue(writer.Stats().startswith('wrote 5 files, 25 bytes'))
+
+  def testAclWriterError(self):
+    writer = aclwriter.AclWriter()
+    writer.start()
+    writer.Write([(self._Path('missing/a.acl'), 'acl')])
+    writer.Write([(self._Path('b.acl'), 'acl')])
+    self.assertRaises(aclwriter.WriteError, writer.Close)
+
+
+if __name__ == '__main__':
+  unittest.main()
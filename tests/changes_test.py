@@ -0,0 +1,168 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for changes.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from lib import changes
+from lib import naming
+from lib import watch
+
+
+WEB_POLICY = """
+header {
+  target:: juniper web-filter
+}
+#include 'includes/common.inc'
+term allow-web {
+  destination-address:: WEB_SERVERS
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+MAIL_POLICY = """
+header {
+  target:: juniper mail-filter
+}
+term allow-mail {
+  destination-address:: MAIL_SERVERS
+  destination-port:: SMTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+INCLUDE = """
+term deny-rest {
+  action:: deny
+}
+"""
+
+NETWORKS = """
+WEB_SERVERS = 10.0.0.0/24
+MAIL_SERVERS = 10.1.0.0/24
+"""
+
+SERVICES = """
+HTTP = 80/tcp
+SMTP = 25/tcp
+"""
+
+
+class ChangesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+    for name in ('def', 'policies', 'policies/includes'):
+      os.mkdir(os.path.join(self.tmpdir, name))
+    self._Write('def/NETWORK.net', NETWORKS)
+    self._Write('def/SERVICES.svc', SERVICES)
+    self._Write('policies/web.pol', WEB_POLICY)
+    self._Write('policies/mail.pol', MAIL_POLICY)
+    self._Write('policies/includes/common.inc', INCLUDE)
+    self._Git('init', '-q')
+    self._Commit('initial')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Write(self, name, data):
+    with open(os.path.join(self.tmpdir, name), 'w') as f:
+      f.write(data)
+
+  def _Git(self, *args):
+    subprocess.check_call(('git',) + args, cwd=self.tmpdir)
+
+  def _Path(self, name):
+    return os.path.join(self.tmpdir, name)
+
+  def _Affected(self, policies=('web.pol', 'mail.pol')):
+    index = watch.DependencyIndex(self._Path('policies'))
+    for name in policies:
+      index.Update(self._Path('policies/' + name))
+    changed = changes.ChangedFiles('HEAD', self._Path('policies'))
+    old_definitions = changes.DefinitionsAt('HEAD', self._Path('def'))
+    definitions = naming.Naming(self._Path('def'))
+    return set(os.path.basename(x) for x in changes.Affected(
+        index, changed, old_definitions, definitions))
+
+  def testNoChanges(self):
+    self.assertEqual(changes.ChangedFiles('HEAD', self.tmpdir), set())
+    self.assertEqual(self._Affected(), set())
+
+  def testChangedFiles(self):
+    self._Write('policies/mail.pol', MAIL_POLICY.replace('accept', 'deny'))
+    self._Write('policies/new.pol', MAIL_POLICY)
+    os.remove(self._Path('policies/includes/common.inc'))
+    self.assertEqual(changes.ChangedFiles('HEAD', self._Path('def')),
+                     set([self._Path('policies/mail.pol'),
+                          self._Path('policies/new.pol'),
+                          self._Path('policies/includes/common.inc')]))
+
+  def testChangedInclude(self):
+    self._Write('policies/includes/common.inc',
+                INCLUDE.replace('deny', 'reject'))
+    self.assertEqual(self._Affected(), set(['web.pol']))
+
+  def testChangedToken(self):
+    self._Write('def/SERVICES.svc', SERVICES.replace('25/tcp', '587/tcp'))
+    self.assertEqual(self._Affected(), set(['mail.pol']))
+
+  def testDefinitionsAt(self):
+    self._Write('def/NETWORK.net', NETWORKS.replace('10.0.0.0', '10.2.0.0'))
+    old_definitions = changes.DefinitionsAt('HEAD', self._Path('def'))
+    self.assertEqual(str(old_definitions.GetNet('WEB_SERVERS')[0]),
+                     '10.0.0.0/24')
+
+  def _Commit(self, message):
+    self._Git('add', '.')
+    self._Git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+              'commit', '-q', '-m', message)
+
+  def testUnscannablePolicyAffected(self):
+    self._Write('policies/odd.pol', 'term odd {\n  unknown:: value\n}\n')
+    self._Commit('unscannable')
+    self._Write('def/SERVICES.svc', SERVICES.replace('25/tcp', '587/tcp'))
+    # its references are unknown, so any change may affect it.
+    self.assertEqual(self._Affected(('web.pol', 'mail.pol', 'odd.pol')),
+                     set(['mail.pol', 'odd.pol']))
+
+  def testDefinitionsAtCompressed(self):
+    with gzip.open(self._Path('def/EXTRA.net.gz'), 'wb') as f:
+      f.write('EXTRA = 10.9.0.0/24\n')
+    with gzip.open(self._Path('def/EXTRA.svc.gz'), 'wb') as f:
+      f.write('EXTRA_PORT = 8080/tcp\n')
+    self._Commit('compressed')
+    os.remove(self._Path('def/EXTRA.net.gz'))
+    old_definitions = changes.DefinitionsAt('HEAD', self._Path('def'))
+    self.assertEqual(str(old_definitions.GetNet('EXTRA')[0]), '10.9.0.0/24')
+    self.assertEqual(old_definitions.GetService('EXTRA_PORT'), ['8080/tcp'])
+
+  def testBadRevision(self):
+    self.assertRaises(changes.GitError, changes.ChangedFiles, 'no-such-rev',
+                      self.tmpdir)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,100 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for defstats.py module."""
+
+__author__ = 'watson@google.com (Tony Watson)'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import defstats
+from lib import naming
+
+
+POLICY = """
+header {
+  target:: juniper test-filter
+}
+#include 'extra.inc'
+term allow-web {
+  destination-address:: WEB_SERVERS
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+INCLUDE = """
+term allow-hosts {
+  source-address:: HOSTS
+  destination-address:: WEB_SERVERS
+  action:: accept
+}
+"""
+
+
+class DefstatsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.defs = naming.Naming(None)
+    self.defs.ParseNetworkList([
+        'HOSTS = 10.0.0.0/32 10.0.0.1/32 10.0.0.2/32 10.0.0.3/32',
+        'WEB_SERVERS = HOSTS',
+        '              192.168.0.0/24',
+    ])
+    self.defs.ParseServiceList(['HTTP = 80/tcp', 'WEB = HTTP 443/tcp'])
+    self.tmpdir = tempfile.mkdtemp()
+    self.policy_file = os.path.join(self.tmpdir, 'test.pol')
+    with open(self.policy_file, 'w') as f:
+      f.write(POLICY)
+    with open(os.path.join(self.tmpdir, 'extra.inc'), 'w') as f:
+      f.write(INCLUDE)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testReadPolicyReferences(self):
+    includes, terms = defstats.ReadPolicyReferences(self.policy_file,
+                                                    base_dir=self.tmpdir)
+    self.assertEqual(includes, [os.path.join(self.tmpdir, 'extra.inc')])
+    self.assertEqual(terms, [('allow-hosts', set(['HOSTS', 'WEB_SERVERS']),
+                              set()),
+                             ('allow-web', set(['WEB_SERVERS']),
+                              set(['HTTP']))])
+
+  def testTokenReport(self):
+    report = defstats.TokenReport(self.defs, [self.policy_file],
+                                  base_dir=self.tmpdir)
+    self.assertEqual(report['networks']['HOSTS'],
+                     {'expanded': 4, 'collapsed': 1, 'depth': 1,
+                      'token_fanin': 1, 'term_fanin': 1, 'cost': 8})
+    self.assertEqual(report['networks']['WEB_SERVERS'],
+                     {'expanded': 5, 'collapsed': 2, 'depth': 2,
+                      'token_fanin': 0, 'term_fanin': 2, 'cost': 15})
+    self.assertEqual(report['services']['WEB'],
+                     {'expanded': 2, 'depth': 2, 'token_fanin': 0,
+                      'term_fanin': 0, 'cost': 2})
+
+  def testMostExpensive(self):
+    report = defstats.TokenReport(self.defs, [self.policy_file],
+                                  base_dir=self.tmpdir)
+    self.assertEqual([x[1] for x in defstats.MostExpensive(report, 2)],
+                     ['WEB_SERVERS', 'HOSTS'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,104 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for discovery.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import discovery
+
+
+class DiscoveryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.base_dir = tempfile.mkdtemp()
+    for path in ('pol/a.pol', 'pol/b.pol.gz', 'pol/notes.txt', 'pol/sub/c.pol',
+                 'corp/pol/d.pol', 'corp/lab/pol/e.pol', 'def/pol/f.pol',
+                 'a.pol', 'corp/pol/g.tmpl', 'corp/pol/g.bindings'):
+      self._Touch(path)
+    self.expected = [
+        (self._Path('corp/lab/pol/e.pol'), 'corp/lab'),
+        (self._Path('corp/pol/d.pol'), 'corp'),
+        (self._Path('corp/pol/g.tmpl'), 'corp'),
+        (self._Path('pol/a.pol'), ''),
+        (self._Path('pol/b.pol.gz'), ''),
+    ]
+
+  def tearDown(self):
+    shutil.rmtree(self.base_dir)
+
+  def _Path(self, path):
+    return os.path.join(self.base_dir, path)
+
+  def _Touch(self, path):
+    if not os.path.isdir(os.path.dirname(self._Path(path))):
+      os.makedirs(os.path.dirname(self._Path(path)))
+    open(self._Path(path), 'w').close()
+
+  def _Age(self):
+    """Make every directory look older than the racy window."""
+    for dirname, _, _ in os.walk(self.base_dir):
+      os.utime(dirname, (0, 0))
+
+  def testListDirectory(self):
+    self.assertEqual(discovery.ListDirectory(self._Path('pol')),
+                     (['sub'], ['a.pol', 'b.pol.gz', 'notes.txt']))
+
+  def testFindPolicies(self):
+    self.assertEqual(discovery.FindPolicies(self.base_dir, ['def']),
+                     self.expected)
+
+  def testFindPoliciesConcurrent(self):
+    self.assertEqual(discovery.FindPolicies(self.base_dir + '/', ['def'],
+                                            workers=4),
+                     self.expected)
+
+  def testFindPoliciesMissingDirectory(self):
+    self.assertEqual(discovery.FindPolicies(self._Path('missing')), [])
+
+  def testIndex(self):
+    self._Age()
+    index = {}
+    discovery.FindPolicies(self.base_dir, ['def'], index=index)
+    self.assertIn(self._Path('corp/pol'), index)
+
+    # an unchanged directory isn't listed again.
+    index[self._Path('corp/pol')]['files'].append('cached.pol')
+    self.assertIn((self._Path('corp/pol/cached.pol'), 'corp'),
+                  discovery.FindPolicies(self.base_dir, ['def'], index=index))
+
+    # a modified directory is.
+    self._Touch('corp/pol/g.pol')
+    policies = discovery.FindPolicies(self.base_dir, ['def'], index=index)
+    self.assertIn((self._Path('corp/pol/g.pol'), 'corp'), policies)
+    self.assertNotIn((self._Path('corp/pol/cached.pol'), 'corp'), policies)
+    # and, being modified just now, is not trusted on the next run either.
+    self.assertNotIn(self._Path('corp/pol'), index)
+
+  def testSaveIndex(self):
+    index_file = self._Path('index')
+    self.assertEqual(discovery.LoadIndex(index_file), {})
+    discovery.SaveIndex(index_file, {'/x': {'mtime': 1.5, 'subdirs': [],
+                                            'files': ['a.pol']}})
+    self.assertEqual(discovery.LoadIndex(index_file),
+                     {'/x': {'mtime': 1.5, 'subdirs': [], 'files': ['a.pol']}})
+
+
+if __name__ == '__main__':
+  unittest.main()
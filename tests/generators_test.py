@@ -0,0 +1,76 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for generators.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import subprocess
+import sys
+import unittest
+
+from lib import aclgenerator
+from lib import generators
+
+
+class GeneratorsTest(unittest.TestCase):
+
+  def testPlatforms(self):
+    platforms = generators.Platforms()
+    self.assertEqual(platforms[:3], ('juniper', 'srx', 'cisco'))
+    self.assertEqual(len(platforms), len(set(platforms)))
+    self.assertTrue('gce' in platforms)
+
+  def testGenerators(self):
+    (suffix_prefix, generator, kwargs), = generators.Generators('juniper')
+    self.assertEqual((suffix_prefix, generator.__name__, kwargs),
+                     ('', 'Juniper', {}))
+    self.assertTrue(issubclass(generator, aclgenerator.ACLGenerator))
+    self.assertEqual(
+        [(x, y.__name__, z) for x, y, z in generators.Generators('pcap')],
+        [('-accept', 'PcapFilter', {}),
+         ('-deny', 'PcapFilter', {'invert': True})])
+
+  def testUnknownPlatform(self):
+    self.assertRaises(generators.UnknownPlatformError,
+                      generators.Generators, 'foo')
+
+  def testErrors(self):
+    generators.Generators('juniper')
+    errors = generators.Errors()
+    self.assertTrue(aclgenerator.Error in errors)
+    self.assertTrue(sys.modules['lib.juniper'].Error in errors)
+
+  def testLazyImport(self):
+    # in a separate interpreter, as other tests may have imported them.
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys; from lib import generators; '
+        'generators.Generators("iptables"); '
+        'print sorted(x for x in ("lib.iptables", "lib.juniper", "lib.gce") '
+        'if x in sys.modules)'])
+    self.assertEqual(output.strip(), "['lib.iptables']")
+
+  def testImportTimes(self):
+    # in a separate interpreter, modules already imported are not timed.
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'from lib import generators; '
+        'generators.Generators("juniper"); '
+        'print sorted(generators.ImportTimes())'])
+    self.assertEqual(output.strip(), "['juniper']")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,184 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for impact.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from lib import impact
+
+
+POLICY = """
+header {
+  target:: juniper edge-inbound inet
+  target:: cisco edge-inbound
+}
+term allow-web {
+  destination-address:: WEB_SERVERS
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+#include 'includes/common.inc'
+header {
+  target:: juniper edge-outbound
+}
+term allow-dns {
+  destination-address:: DNS_SERVERS
+  destination-port:: DNS
+  protocol:: udp
+  action:: accept
+}
+"""
+
+INCLUDE = """
+term deny-internal {
+  source-address:: INTERNAL
+  action:: deny
+}
+"""
+
+NETWORKS = """
+WEB_SERVERS = 10.0.0.0/24
+DNS_SERVERS = 10.1.0.0/24
+PRIVATE = 192.168.0.0/16
+INTERNAL = PRIVATE
+           WEB_SERVERS
+"""
+
+SERVICES = """
+HTTP = 80/tcp
+DNS = 53/udp
+"""
+
+
+class ImpactTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    for name in ('def', 'corp', 'corp/pol', 'includes'):
+      os.mkdir(os.path.join(self.tmpdir, name))
+    self._Write('def/NETWORK.net', NETWORKS)
+    self._Write('def/SERVICES.svc', SERVICES)
+    self._Write('corp/pol/edge.pol', POLICY)
+    self._Write('includes/common.inc', INCLUDE)
+    self.index = {}
+    self.assertEqual(self._Update(), 2)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Write(self, name, data):
+    filename = os.path.join(self.tmpdir, name)
+    with open(filename, 'w') as f:
+      f.write(data)
+    # files modified within the last seconds are not trusted by the index.
+    mtime = time.time() - 60
+    os.utime(filename, (mtime, mtime))
+
+  def _Update(self):
+    return impact.Update(self.index, self.tmpdir,
+                         os.path.join(self.tmpdir, 'def'))
+
+  def _Targets(self, token):
+    return [(x['platform'], x['filter'], x['terms'])
+            for x in impact.Impact(self.index, token)['references']]
+
+  def testDirectReference(self):
+    self.assertEqual(self._Targets('HTTP'),
+                     [('juniper', 'edge-inbound', ['allow-web']),
+                      ('cisco', 'edge-inbound', ['allow-web'])])
+
+  def testNestedToken(self):
+    self.assertEqual(impact.Impact(self.index, 'PRIVATE')['networks'],
+                     ['INTERNAL', 'PRIVATE'])
+    self.assertEqual(self._Targets('PRIVATE'),
+                     [('juniper', 'edge-inbound', ['deny-internal']),
+                      ('cisco', 'edge-inbound', ['deny-internal'])])
+    self.assertEqual(self._Targets('WEB_SERVERS'),
+                     [('juniper', 'edge-inbound',
+                       ['allow-web', 'deny-internal']),
+                      ('cisco', 'edge-inbound',
+                       ['allow-web', 'deny-internal'])])
+
+  def testUnreferencedToken(self):
+    self.assertEqual(self._Targets('UNKNOWN'), [])
+
+  def testOutputs(self):
+    reference = impact.Impact(self.index, 'DNS')['references'][0]
+    self.assertEqual(reference['filter'], 'edge-outbound')
+    self.assertEqual(impact.Outputs(reference), ['corp/edge.jcl'])
+
+  def testIncrementalUpdate(self):
+    self.assertEqual(self._Update(), 0)
+    self._Write('includes/common.inc', INCLUDE.replace('INTERNAL', 'PRIVATE'))
+    self.assertEqual(self._Update(), 1)
+    self.assertEqual(self._Targets('WEB_SERVERS'),
+                     [('juniper', 'edge-inbound', ['allow-web']),
+                      ('cisco', 'edge-inbound', ['allow-web'])])
+    self._Write('def/NETWORK.net', NETWORKS + 'EDGE = DNS_SERVERS\n')
+    self.assertEqual(self._Update(), 1)
+    self.assertEqual(impact.Impact(self.index, 'DNS_SERVERS')['networks'],
+                     ['DNS_SERVERS', 'EDGE'])
+
+  def testTemplate(self):
+    self._Write('corp/pol/site.tmpl',
+                POLICY.replace('WEB_SERVERS', '${SERVERS}')
+                .replace('edge-inbound', '${SITE}-inbound'))
+    self._Write('corp/pol/site.bindings',
+                'instance SITE SERVERS\nnyc1 nyc1 WEB_SERVERS\n'
+                'lon1 lon1 PRIVATE\n')
+    self.assertEqual(self._Update(), 1)
+    self.assertEqual(
+        [(x['policy'], x['filter'])
+         for x in impact.Impact(self.index, 'HTTP')['references']
+         if x['platform'] == 'juniper'],
+        [(os.path.join(self.tmpdir, 'corp/pol/edge.pol'), 'edge-inbound'),
+         (os.path.join(self.tmpdir, 'corp/pol/lon1.pol'), 'lon1-inbound'),
+         (os.path.join(self.tmpdir, 'corp/pol/nyc1.pol'), 'nyc1-inbound')])
+    self.assertEqual(
+        [x['filter'] for x in impact.Impact(self.index, 'PRIVATE')['references']
+         if x['platform'] == 'juniper' and 'allow-web' in x['terms']],
+        ['lon1-inbound'])
+    self._Write('corp/pol/site.bindings', 'instance SITE SERVERS\n')
+    self.assertEqual(self._Update(), 1)
+
+  def testUnreadablePolicy(self):
+    os.remove(os.path.join(self.tmpdir, 'includes/common.inc'))
+    self._Write('corp/pol/edge.pol', POLICY + ' ')
+    self.assertEqual(self._Update(), 1)
+    self.assertEqual(self._Targets('PRIVATE'), [])
+    self.assertEqual(self._Update(), 1)
+    self._Write('includes/common.inc', INCLUDE)
+    self.assertEqual(self._Update(), 1)
+    self.assertEqual(len(self._Targets('PRIVATE')), 2)
+    self.assertEqual(self._Update(), 0)
+
+  def testSaveLoad(self):
+    index_file = os.path.join(self.tmpdir, 'impact.json')
+    self.assertEqual(impact.Load(index_file), {})
+    impact.Save(index_file, self.index)
+    self.index = impact.Load(index_file)
+    self.assertEqual(self._Update(), 0)
+    self.assertEqual(len(self._Targets('DNS')), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
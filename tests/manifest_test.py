@@ -0,0 +1,202 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for manifest.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import manifest
+from lib import naming
+
+
+POLICY = """
+header {
+  target:: juniper test-filter
+}
+#include 'extra.inc'
+term allow-web {
+  destination-address:: WEB_SERVERS
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+INCLUDE = """
+term allow-dns {
+  destination-port:: DNS
+  protocol:: udp
+  action:: accept
+}
+"""
+
+NEXT_IP_TERM = """
+term route {
+  destination-address:: WEB_SERVERS
+  next-ip:: NHOP
+  action:: accept
+}
+"""
+
+TEMPLATE = """
+header {
+  target:: juniper ${SITE}-edge
+}
+#include 'extra.inc'
+term allow-web {
+  destination-address:: ${SERVERS}
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+BINDINGS = """
+instance  SITE  SERVERS
+nyc1      nyc1  WEB_SERVERS
+"""
+
+
+class ManifestTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.policy_file = os.path.join(self.tmpdir, 'test.pol')
+    self._Write('test.pol', POLICY)
+    self._Write('extra.inc', INCLUDE)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Write(self, name, data):
+    with open(os.path.join(self.tmpdir, name), 'w') as f:
+      f.write(data)
+
+  def _Digest(self, networks=None, services=None, flags=None):
+    defs = naming.Naming(None)
+    defs.ParseNetworkList(networks or ['WEB_SERVERS = 10.0.0.0/24',
+                                       'UNUSED = 10.1.0.0/24'])
+    defs.ParseServiceList(services or ['HTTP = 80/tcp', 'DNS = 53/udp',
+                                       'SSH = 22/tcp'])
+    return manifest.PolicyDigest(self.policy_file, defs, base_dir=self.tmpdir,
+                                 flags=flags)
+
+  def testDigestStable(self):
+    self.assertEqual(self._Digest(), self._Digest())
+
+  def testDigestIgnoresUnreferencedTokens(self):
+    self.assertEqual(self._Digest(),
+                     self._Digest(services=['HTTP = 80/tcp', 'DNS = 53/udp',
+                                            'SSH = 2222/tcp']))
+
+  def testDigestTokenChange(self):
+    self.assertNotEqual(self._Digest(),
+                        self._Digest(networks=['WEB_SERVERS = 10.0.0.0/25',
+                                               'UNUSED = 10.1.0.0/24']))
+
+  def testDigestIncludedTokenChange(self):
+    self.assertNotEqual(self._Digest(),
+                        self._Digest(services=['HTTP = 80/tcp',
+                                               'DNS = 5353/udp',
+                                               'SSH = 22/tcp']))
+
+  def testDigestNextIpTokenChange(self):
+    self._Write('test.pol', POLICY + NEXT_IP_TERM)
+    networks = ['WEB_SERVERS = 10.0.0.0/24', 'NHOP = 10.1.1.1/32']
+    digest = self._Digest(networks=networks)
+    self.assertEqual(digest, self._Digest(networks=networks))
+    self.assertNotEqual(digest, self._Digest(
+        networks=['WEB_SERVERS = 10.0.0.0/24', 'NHOP = 10.7.7.7/32']))
+
+  def testTemplateDigest(self):
+    self._Write('edge.tmpl', TEMPLATE)
+    self._Write('edge.bindings', BINDINGS)
+    self.policy_file = os.path.join(self.tmpdir, 'edge.tmpl')
+    digest = self._Digest()
+    self.assertEqual(digest, self._Digest(networks=['WEB_SERVERS = 10.0.0.0/24',
+                                                    'UNUSED = 10.2.0.0/24']))
+    # a token referenced through a variable.
+    self.assertNotEqual(digest, self._Digest(
+        networks=['WEB_SERVERS = 10.0.0.0/25', 'UNUSED = 10.1.0.0/24']))
+    # an included token.
+    self.assertNotEqual(digest, self._Digest(
+        services=['HTTP = 80/tcp', 'DNS = 5353/udp', 'SSH = 22/tcp']))
+    self._Write('edge.bindings', BINDINGS + 'lon1 lon1 UNUSED\n')
+    lon1 = self._Digest()
+    self.assertNotEqual(digest, lon1)
+    self.assertNotEqual(lon1, self._Digest(
+        networks=['WEB_SERVERS = 10.0.0.0/24', 'UNUSED = 10.2.0.0/24']))
+
+  def testDigestIncludeChange(self):
+    digest = self._Digest()
+    self._Write('extra.inc', INCLUDE.replace('accept', 'deny'))
+    self.assertNotEqual(digest, self._Digest())
+
+  def testDigestRelocatable(self):
+    digest = self._Digest()
+    moved = os.path.join(self.tmpdir, 'checkout')
+    os.mkdir(moved)
+    for name in ('test.pol', 'extra.inc'):
+      os.rename(os.path.join(self.tmpdir, name), os.path.join(moved, name))
+    self.tmpdir, self.policy_file = moved, os.path.join(moved, 'test.pol')
+    try:
+      self.assertEqual(digest, self._Digest())
+    finally:
+      self.tmpdir = os.path.dirname(moved)
+
+  def testDigestFlags(self):
+    self.assertNotEqual(self._Digest(flags={'optimize': True}),
+                        self._Digest(flags={'optimize': False}))
+
+  def testRecordSaveLoad(self):
+    output = os.path.join(self.tmpdir, 'test.jcl')
+    manifest_file = os.path.join(self.tmpdir, 'manifest')
+    entries = manifest.Load(manifest_file)
+    self.assertEqual(entries, {})
+    manifest.Record(entries, self.policy_file, 'abc', [output])
+    manifest.Save(manifest_file, entries)
+    entries = manifest.Load(manifest_file)
+    # the output has not been written yet.
+    self.assertFalse(manifest.IsCurrent(entries, self.policy_file, 'abc'))
+    self._Write('test.jcl', '')
+    self.assertTrue(manifest.IsCurrent(entries, self.policy_file, 'abc'))
+    self.assertFalse(manifest.IsCurrent(entries, self.policy_file, 'def'))
+
+  def testPrune(self):
+    entries = {}
+    for name in ('a.pol', 'b.pol', 'c.pol'):
+      manifest.Record(entries, name, 'abc', [])
+    self.assertEqual(manifest.Prune(entries, ['b.pol', 'd.pol']),
+                     ['a.pol', 'c.pol'])
+    self.assertEqual(sorted(entries), ['b.pol'])
+
+  def testRecordWithoutDigest(self):
+    output = os.path.join(self.tmpdir, 'test.jcl')
+    self._Write('test.jcl', '')
+    entries = {}
+    manifest.Record(entries, self.policy_file, None, [output])
+    # the outputs are recorded, but the policy is never current.
+    self.assertEqual(entries[self.policy_file]['outputs'], [output])
+    self.assertFalse(manifest.IsCurrent(entries, self.policy_file, None))
+    self.assertFalse(manifest.IsCurrent(entries, self.policy_file,
+                                        manifest.UNKNOWN_DIGEST))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,117 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for naming_sqlite.py module."""
+
+__author__ = 'watson@google.com (Tony Watson)'
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from lib import nacaddr
+from lib import naming
+from lib import naming_sqlite
+from tests import naming_test
+
+
+class SQLiteNamingUnitTest(naming_test.NamingUnitTest):
+  """Run the naming.py unit tests against the SQLite backend."""
+
+  naming_class = naming_sqlite.SQLiteNaming
+
+
+class SQLiteNamingDatabaseTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    with open(os.path.join(self.tmpdir, 'NETWORK.net'), 'w') as f:
+      f.write('NET1 = 10.0.0.0/8 # network1\n'
+              'NET2 = 192.168.0.0/16\n'
+              '       NET1\n')
+    with open(os.path.join(self.tmpdir, 'SERVICES.svc'), 'w') as f:
+      f.write('DNS = 53/tcp\n'
+              '      53/udp\n')
+    self.database = os.path.join(self.tmpdir, 'defs.sqlite')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testImportMatchesTextBackend(self):
+    text_defs = naming.Naming(self.tmpdir)
+    sql_defs = naming_sqlite.SQLiteNaming(self.tmpdir, database=self.database)
+    self.assertEqual(text_defs.GetNet('NET2'), sql_defs.GetNet('NET2'))
+    self.assertEqual(text_defs.GetService('DNS'), sql_defs.GetService('DNS'))
+    self.assertEqual(text_defs.GetIpParents('10.1.1.1'),
+                     sql_defs.GetIpParents('10.1.1.1'))
+    self.assertItemsEqual(text_defs.GetServiceNames(),
+                          sql_defs.GetServiceNames())
+
+  def testReopenDatabase(self):
+    naming_sqlite.SQLiteNaming(self.tmpdir, database=self.database)
+    defs = naming_sqlite.SQLiteNaming(database=self.database)
+    self.assertEqual(defs.GetNet('NET2'),
+                     [nacaddr.IP('192.168.0.0/16'), nacaddr.IP('10.0.0.0/8')])
+    self.assertEqual(defs.GetServiceByProto('DNS', 'udp'), ['53'])
+    self.assertEqual(defs.GetIpParents('192.168.1.1'), ['NET2'])
+
+  def testImportTwice(self):
+    naming_sqlite.SQLiteNaming(self.tmpdir, database=self.database)
+    with open(os.path.join(self.tmpdir, 'NETWORK.net'), 'w') as f:
+      f.write('NET2 = 172.16.0.0/12\n')
+    defs = naming_sqlite.SQLiteNaming(self.tmpdir, database=self.database)
+    self.assertEqual(defs.GetNet('NET2'), [nacaddr.IP('172.16.0.0/12')])
+    self.assertFalse('NET1' in defs.networks)
+    self.assertEqual(defs.GetIpParents('192.168.1.1'), [])
+    self.assertEqual(defs.GetIpParents('172.16.1.1'), ['NET2'])
+    defs = naming_sqlite.SQLiteNaming(self.tmpdir, 'NETWORK.net', 'networks',
+                                      database=self.database)
+    self.assertEqual(len(defs.networks), 1)
+    self.assertEqual(defs.GetServiceByProto('DNS', 'udp'), ['53'])
+
+  def testIpParentsOfNestedPrefixes(self):
+    networks = ['WIDE = 10.0.0.0/8', 'MID = 10.1.0.0/16', '10.2.0.0/16',
+                'NARROW = 10.1.1.0/24', 'HOST = 10.1.1.1/32',
+                'OTHER = 10.1.2.0/23', 'V6 = 2001:db8::/32']
+    text_defs = naming.Naming(None)
+    text_defs.ParseNetworkList(networks)
+    sql_defs = naming_sqlite.SQLiteNaming()
+    sql_defs.ParseNetworkList(networks)
+    for query in ('10.1.1.1', '10.1.1.2', '10.1.3.1', '10.1.0.0/16',
+                  '10.0.0.0/7', '11.0.0.1', '2001:db8::1'):
+      self.assertEqual(sql_defs.GetIpParents(query),
+                       text_defs.GetIpParents(query))
+    self.assertEqual(sql_defs.GetIpParents('10.1.1.1'),
+                     ['HOST', 'MID', 'NARROW', 'WIDE'])
+
+  def testPickle(self):
+    defs = naming_sqlite.SQLiteNaming(self.tmpdir, database=self.database)
+    copied = pickle.loads(pickle.dumps(defs))
+    self.assertEqual(copied.GetNetParents('NET1'), ['NET2'])
+
+  def testPickleInMemory(self):
+    defs = naming_sqlite.SQLiteNaming(self.tmpdir)
+    copied = pickle.loads(pickle.dumps(defs))
+    self.assertEqual(copied.GetNet('NET2'), defs.GetNet('NET2'))
+    self.assertEqual(copied.GetIpParents('10.1.1.1'), ['NET1', 'NET2'])
+    self.assertEqual(copied.GetServiceByProto('DNS', 'udp'), ['53'])
+    # the copy is a database of its own.
+    copied.ParseNetworkList(['NET3 = 172.16.0.0/12'])
+    self.assertFalse('NET3' in defs.networks)
+
+
+if __name__ == '__main__':
+  unittest.main()
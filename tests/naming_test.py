@@ -16,7 +16,11 @@
 
 __author__ = 'watson@google.com (Tony Watson)'
 
+import gzip
 import io
+import os
+import shutil
+import tempfile
 import unittest
 
 from lib import nacaddr
@@ -32,8 +36,11 @@ class NamingUnitTest(unittest.TestCase):
      to the ParseList method, or in some cases, pass an io.BytesIO stream.
   """
 
+  # the naming backend under test, see naming_sqlite_test.py.
+  naming_class = naming.Naming
+
   def setUp(self):
-    self.defs = naming.Naming(None)
+    self.defs = self.naming_class(None)
     servicedata = []
     servicedata.append('SVC1 = 80/tcp 81/udp 82/tcp')
     servicedata.append('SVC2 = 80/tcp 81/udp 82/tcp SVC2')
@@ -104,7 +111,7 @@ class NamingUnitTest(unittest.TestCase):
     badservicedata = []
     badservicedata.append('SVC1 = 80/tcp')
     badservicedata.append('SVC1 = 81/udp')
-    testdefs = naming.Naming(None)
+    testdefs = self.naming_class(None)
     self.assertRaises(naming.NamespaceCollisionError,
                       testdefs.ParseServiceList, badservicedata)
 
@@ -130,6 +137,30 @@ class NamingUnitTest(unittest.TestCase):
     self.assertListEqual(self.defs.GetServiceByProto('SVC6', 'tcp'),
                          ['80', '82', '90'])
 
+  def testServiceIndex(self):
+    index = self.defs.GetServiceIndex()
+    self.assertEqual(index[('SVC6', 'TCP')], ('80', '82', '90'))
+    self.assertEqual(index[('SVC6', 'UDP')], ('81',))
+    self.assertNotIn(('SVC5', 'UDP'), index)
+
+  def testServiceByProtoMissingFromIndex(self):
+    self.defs.GetServiceIndex()
+    # a service without ports of proto is answered from the index alone.
+    self.defs.GetService = lambda query: self.fail('expanded %s' % query)
+    self.assertListEqual(self.defs.GetServiceByProto('SVC5', 'udp'), [])
+
+  def testServiceIndexUpdatedAfterParse(self):
+    self.defs.ParseServiceList(['SVC7 = SVC3 83/udp'])
+    self.assertListEqual(self.defs.GetServiceByProto('SVC7', 'udp'),
+                         ['81', '83'])
+
+  def testServiceIndexUndefinedNesting(self):
+    baddefs = self.naming_class(None)
+    baddefs.ParseServiceList(['FOO = 7/tcp BAR'])
+    self.assertNotIn(('FOO', 'TCP'), baddefs.GetServiceIndex())
+    self.assertRaises(naming.UndefinedServiceError, baddefs.GetServiceByProto,
+                      'FOO', 'tcp')
+
   def testServiceParents(self):
     """SVC6 contains SVC5 which contains TCP_90 which contains 90/tcp."""
     self.assertListEqual(self.defs.GetServiceParents('90/tcp'),
@@ -149,7 +180,7 @@ class NamingUnitTest(unittest.TestCase):
   def testUndefinedTokenNesting(self):
     bad_servicedata = ['FOO = 7/tcp BAR']
     bad_networkdata = ['NETGROUP = 10.0.0.0/8 FOOBAR']
-    baddefs = naming.Naming(None)
+    baddefs = self.naming_class(None)
     baddefs.ParseServiceList(bad_servicedata)
     baddefs.ParseNetworkList(bad_networkdata)
     self.assertRaises(naming.UndefinedServiceError,
@@ -158,16 +189,31 @@ class NamingUnitTest(unittest.TestCase):
                       baddefs._CheckUnseen, 'networks')
 
   def testParseNetFile(self):
-    filedefs = naming.Naming(None)
+    filedefs = self.naming_class(None)
     data = io.BytesIO('FOO = 127.0.0.1 # some network\n')
     filedefs._ParseFile(data, 'networks')
     self.assertEqual(filedefs.GetNetAddr('FOO'), [nacaddr.IPv4('127.0.0.1')])
 
   def testParseServiceFile(self):
-    filedefs = naming.Naming(None)
+    filedefs = self.naming_class(None)
     data = io.BytesIO('HTTP = 80/tcp\n')
     filedefs._ParseFile(data, 'services')
     self.assertEqual(filedefs.GetService('HTTP'), ['80/tcp'])
 
+  def testParseGzipDirectory(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      net_file = gzip.open(os.path.join(tmpdir, 'NETWORK.net.gz'), 'w')
+      net_file.write('FOO = 127.0.0.1 # some network\n')
+      net_file.close()
+      with open(os.path.join(tmpdir, 'SERVICES.svc'), 'w') as svc_file:
+        svc_file.write('HTTP = 80/tcp\n')
+      filedefs = self.naming_class(tmpdir)
+      self.assertEqual(filedefs.GetNetAddr('FOO'),
+                       [nacaddr.IPv4('127.0.0.1')])
+      self.assertEqual(filedefs.GetService('HTTP'), ['80/tcp'])
+    finally:
+      shutil.rmtree(tmpdir)
+
 if __name__ == '__main__':
   unittest.main()
@@ -212,6 +212,23 @@ class PolicyParserTest(unittest.TestCase):
     pol = parser.Parse()
     self.assertEqual(expected, pol.members[0])
 
+  def testParseTermKeywords(self):
+    parser = self.Parser('term testy {\naddress-exclude:: BOGON\n'
+                         'apply-groups:: group1\n'
+                         'apply-groups-except:: group2\n'
+                         'dscp-except:: be\nforwarding-class:: fc1\n'
+                         'hop-limit:: 64\n}')
+    expected = policy_simple.Term('testy')
+    expected.AddField(policy_simple.AddressExclude(' BOGON'))
+    expected.AddField(policy_simple.ApplyGroups(' group1'))
+    expected.AddField(policy_simple.ApplyGroupsExcept(' group2'))
+    expected.AddField(policy_simple.DscpExcept(' be'))
+    expected.AddField(policy_simple.ForwardingClass(' fc1'))
+    expected.AddField(policy_simple.HopLimit(' 64'))
+
+    pol = parser.Parse()
+    self.assertEqual(expected, pol.members[0])
+
   def testParseTermBadField(self):
     parser = self.Parser('term testy {\nbad_field::Test\n}')
     self.assertRaises(ValueError, parser.Parse)
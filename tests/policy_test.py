@@ -16,6 +16,10 @@
 
 __author__ = 'watson@google.com (Tony Watson)'
 
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
 
 from lib import nacaddr
@@ -372,6 +376,22 @@ term term-sub {
   action:: accept
 }
 """
+GOOD_TERM_36 = """
+term good-term-36 {
+  protocol:: tcp
+  source-address:: PROD_NETWRK
+  platform:: cisco
+  action:: accept
+}
+"""
+GOOD_TERM_37 = """
+term good-term-37 {
+  protocol:: tcp
+  source-address:: PROD_NETWRK
+  expiration:: 2001-12-31
+  action:: accept
+}
+"""
 BAD_TERM_1 = """
 term bad-term- 1 {
   protocol:: tcp
@@ -1080,6 +1100,49 @@ class PolicyTest(unittest.TestCase):
     self.assertNotEqual(policy1, policy3)
     self.assertNotEqual(policy2, policy3)
 
+  def testPlatformsDropHeaders(self):
+    pol = HEADER_3 + GOOD_TERM_2 + HEADER_2 + GOOD_TERM_3
+    # the cisco filter's addresses are never looked up.
+    self.naming.GetNetAddr('PROD_NETWRK').AndReturn([nacaddr.IPv4('10.0.0.0/8')])
+    self.naming.GetServiceByProto('SMTP', 'tcp').AndReturn(['25'])
+    self.mox.ReplayAll()
+    ret = policy.ParsePolicy(pol, self.naming, platforms=['juniper'])
+    self.assertEqual(len(ret.filters), 1)
+    header, terms = ret.filters[0]
+    self.assertEqual(header.platforms, ['juniper'])
+    self.assertEqual([x.name for x in terms], ['good-term-3'])
+
+  def testPlatformsPruneTerms(self):
+    pol = HEADER + GOOD_TERM_1 + GOOD_TERM_36 + GOOD_TERM_37
+    self.mox.ReplayAll()
+    ret = policy.ParsePolicy(pol, self.naming, platforms=['juniper'])
+    _, terms = ret.filters[0]
+    self.assertEqual([x.name for x in terms], ['good-term-1'])
+
+  def testPlatformsKeepTermsRenderedAnyway(self):
+    # aruba renders terms restricted to other platforms.
+    pol = HEADER_3.replace('cisco 50 standard', 'aruba test') + GOOD_TERM_36
+    self.naming.GetNetAddr('PROD_NETWRK').AndReturn([nacaddr.IPv4('10.0.0.0/8')])
+    self.mox.ReplayAll()
+    ret = policy.ParsePolicy(pol, self.naming, platforms=['aruba'])
+    _, terms = ret.filters[0]
+    self.assertEqual([x.name for x in terms], ['good-term-36'])
+
+  def testBuildPolicy(self):
+    self.naming.GetNetAddr('PROD_NETWRK').AndReturn([nacaddr.IPv4('10.0.0.0/8')])
+    self.mox.ReplayAll()
+    parsed = policy.ParsePolicy(HEADER + GOOD_TERM_1 + GOOD_TERM_36,
+                                self.naming)
+    _, terms = parsed.filters[0]
+    self.assertTrue(policy.TermRendered(terms[1], ['cisco', 'juniper']))
+    self.assertFalse(policy.TermRendered(terms[1], ['juniper']))
+    # the translated terms are pruned, not expanded again.
+    ret = policy.BuildPolicy(parsed.filters, self.naming,
+                             platforms=['juniper'])
+    self.assertEqual([x.name for x in ret.filters[0][1]], ['good-term-1'])
+    ret = policy.BuildPolicy(parsed.filters, self.naming)
+    self.assertEqual(ret, parsed)
+
   def testNextIP(self):
     pol = HEADER_2 + GOOD_TERM_35
     expected = nacaddr.IPv4('10.1.1.1/32')
@@ -1098,5 +1161,34 @@ class PolicyTest(unittest.TestCase):
 # pylint: enable=maybe-no-member
 
 
+class ReadFileTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _WriteGzip(self, name, data):
+    filename = os.path.join(self.tmpdir, name)
+    gz_file = gzip.open(filename, 'w')
+    gz_file.write(data)
+    gz_file.close()
+    return filename
+
+  def testReadGzipFile(self):
+    filename = self._WriteGzip('x.pol.gz', HEADER)
+    self.assertEqual(policy._ReadFile(filename), HEADER)
+
+  def testReadGzipFallback(self):
+    self._WriteGzip('y.inc.gz', INCLUDED_Y_FILE)
+    self.assertEqual(policy._ReadFile(os.path.join(self.tmpdir, 'y.inc')),
+                     INCLUDED_Y_FILE)
+
+  def testMissingFile(self):
+    self.assertRaises(policy.FileNotFoundError, policy._ReadFile,
+                      os.path.join(self.tmpdir, 'missing.inc'))
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,166 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for profiling.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from lib import profiling
+
+
+class ProfilingTest(unittest.TestCase):
+
+  def setUp(self):
+    profiling.Reset()
+    profiling.Enable()
+
+  def tearDown(self):
+    profiling.Enable(False)
+    profiling.EnableTrace(False)
+    profiling.Reset()
+
+  def testDisabled(self):
+    profiling.Enable(False)
+    with profiling.Record('a.pol', 'juniper'):
+      with profiling.Stage('render'):
+        pass
+      profiling.Count('lines', 10)
+    self.assertEqual(profiling.Collect(), {})
+
+  def testStageOutsideRecord(self):
+    with profiling.Stage('render'):
+      pass
+    self.assertEqual(profiling.Collect(), {})
+
+  def testNestedStages(self):
+    with profiling.Record('a.pol'):
+      with profiling.Stage('parse'):
+        time.sleep(0.02)
+        with profiling.Stage('translate_terms'):
+          time.sleep(0.05)
+      profiling.Count('terms', 3)
+    records = profiling.Collect()
+    stages = records[('a.pol', None)]['stages']
+    # the nested stage isn't counted in its parent.
+    self.assertTrue(stages['translate_terms']['wall'] >= 0.05)
+    self.assertTrue(stages['parse']['wall'] < 0.05)
+    self.assertEqual(stages['parse']['calls'], 1)
+    self.assertEqual(records[('a.pol', None)]['counts'], {'terms': 3})
+    self.assertEqual(profiling.Collect(), {})
+
+  def testRecordRestored(self):
+    with profiling.Record('a.pol'):
+      with profiling.Record('a.pol', 'cisco'):
+        with profiling.Stage('render'):
+          pass
+      with profiling.Stage('parse'):
+        pass
+    records = profiling.Collect()
+    self.assertEqual(records[('a.pol', None)]['stages'].keys(), ['parse'])
+    self.assertEqual(records[('a.pol', 'cisco')]['stages'].keys(), ['render'])
+
+  def testMergeAndReport(self):
+    profiling.Merge({
+        ('a.pol', None): {'stages': {'parse': {'wall': 1.0, 'cpu': 0.5,
+                                               'calls': 1}},
+                          'counts': {'terms': 2}},
+        ('a.pol', 'cisco'): {'stages': {'render': {'wall': 3.0, 'cpu': 3.0,
+                                                   'calls': 1}},
+                             'counts': {'lines': 20}},
+    })
+    profiling.Add(('b.pol', None), 'parse', 1.5, 1.0)
+    report = profiling.Report(profiling.Collect(), top=2)
+    self.assertEqual(report['policies']['a.pol']['counts'], {'terms': 2})
+    self.assertEqual(
+        report['policies']['a.pol']['platforms']['cisco']['counts'],
+        {'lines': 20})
+    self.assertEqual(report['totals']['parse'],
+                     {'wall': 2.5, 'cpu': 1.5, 'calls': 2})
+    self.assertEqual([(x['policy'], x['platform']) for x in report['slowest']],
+                     [('a.pol', 'cisco'), ('b.pol', None)])
+    summary = profiling.Summary(report)
+    self.assertTrue(summary[1].startswith('render'))
+    self.assertIn('a.pol:cisco', summary[-2])
+
+  def testSave(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      report_file = os.path.join(tmpdir, 'profile.json')
+      profiling.Save(report_file, {'totals': {}})
+      self.assertEqual(json.load(open(report_file)), {'totals': {}})
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def testTraceDisabled(self):
+    with profiling.Span('discover'):
+      with profiling.Record('a.pol'):
+        with profiling.Stage('parse'):
+          pass
+    self.assertEqual(profiling.CollectTrace(), [])
+
+  def testTrace(self):
+    profiling.EnableTrace()
+    with profiling.Span('a.pol:cisco', 'task'):
+      with profiling.Record('a.pol', 'cisco'):
+        with profiling.Stage('render'):
+          time.sleep(0.01)
+    events = profiling.CollectTrace()
+    self.assertEqual([(x['name'], x['cat']) for x in events],
+                     [('render', 'stage'), ('cisco', 'platform'),
+                      ('a.pol:cisco', 'task')])
+    stage, platform, task = events
+    self.assertEqual(platform['args'], {'policy': 'a.pol'})
+    self.assertTrue(stage['dur'] >= 10000)
+    self.assertTrue(task['ts'] <= platform['ts'] <= stage['ts'])
+    self.assertTrue(stage['ts'] + stage['dur'] <= task['ts'] + task['dur'])
+    self.assertEqual(set(x['pid'] for x in events), set([os.getpid()]))
+    self.assertEqual(profiling.CollectTrace(), [])
+
+  def testTraceSummary(self):
+    events = [{'cat': 'task', 'pid': 1, 'ts': 0, 'dur': 1000000},
+              {'cat': 'task', 'pid': 2, 'ts': 0, 'dur': 500000},
+              {'cat': 'task', 'pid': 2, 'ts': 500000, 'dur': 250000},
+              {'cat': 'stage', 'pid': 2, 'ts': 500000, 'dur': 250000}]
+    summary = profiling.TraceSummary(events)
+    self.assertEqual(summary['processes'], 2)
+    self.assertEqual(summary['seconds'], 1.0)
+    self.assertEqual(summary['busy'], 0.875)
+    self.assertEqual(summary['idle'], {1: 0.0, 2: 0.25})
+    self.assertEqual(profiling.TraceSummary([])['processes'], 0)
+
+  def testSaveTrace(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      trace_file = os.path.join(tmpdir, 'trace.json')
+      profiling.MergeTrace([{'name': 'render', 'cat': 'stage', 'ph': 'X',
+                             'ts': 5000, 'dur': 10, 'pid': 7, 'tid': 1}])
+      profiling.SaveTrace(trace_file, profiling.CollectTrace(),
+                          {7: 'renderer 1'})
+      trace = json.load(open(trace_file))['traceEvents']
+      self.assertEqual(trace[0], {'name': 'process_name', 'ph': 'M', 'pid': 7,
+                                  'args': {'name': 'renderer 1'}})
+      self.assertEqual((trace[1]['name'], trace[1]['ts']), ('render', 0))
+    finally:
+      shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,130 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for rendercache.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import manifest
+from lib import naming
+from lib import rendercache
+
+
+NEXT_IP_POLICY = """
+header {
+  target:: juniper test-filter inet
+}
+term route {
+  destination-address:: WEB_SERVERS
+  next-ip:: NHOP
+  action:: accept
+}
+"""
+
+
+class RenderCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.cache = rendercache.RenderCache(self.tmpdir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testKey(self):
+    self.assertEqual(rendercache.Key('abc', 'juniper'),
+                     rendercache.Key('abc', 'juniper'))
+    self.assertNotEqual(rendercache.Key('abc', 'juniper'),
+                        rendercache.Key('abc', 'cisco'))
+    self.assertNotEqual(rendercache.Key('abc', 'juniper'),
+                        rendercache.Key('abd', 'juniper'))
+
+  def _PolicyKey(self, policy_file, networks):
+    defs = naming.Naming(None)
+    defs.ParseNetworkList(networks)
+    return rendercache.Key(
+        manifest.PolicyDigest(policy_file, defs, base_dir=self.tmpdir),
+        'juniper')
+
+  def testKeyFollowsNextIpDefinition(self):
+    policy_file = os.path.join(self.tmpdir, 'test.pol')
+    with open(policy_file, 'w') as f:
+      f.write(NEXT_IP_POLICY)
+    key = self._PolicyKey(policy_file, ['WEB_SERVERS = 10.0.0.0/24',
+                                        'NHOP = 10.1.1.1/32'])
+    self.cache.Put(key, [('.jcl', 'next-ip 10.1.1.1/32')])
+    # only the next-ip definition changes, the cached rendering is stale.
+    key = self._PolicyKey(policy_file, ['WEB_SERVERS = 10.0.0.0/24',
+                                        'NHOP = 10.7.7.7/32'])
+    self.assertEqual(self.cache.Get(key), None)
+
+  def testGetPut(self):
+    key = rendercache.Key('abc', 'pcap')
+    self.assertEqual(self.cache.Get(key), None)
+    texts = [('-accept.pcap', 'tcp\n'), ('-deny.pcap', 'not tcp\n')]
+    self.cache.Put(key, texts)
+    self.assertEqual(self.cache.Get(key), texts)
+    # shared with another process using the same directory.
+    self.assertEqual(rendercache.RenderCache(self.tmpdir).Get(key), texts)
+    self.assertEqual(self.cache.stats,
+                     {'hits': 1, 'misses': 1, 'puts': 1, 'evictions': 0})
+    # no temporary file is left behind.
+    self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'objects', key[:2])),
+                     [key])
+
+  def testCorruptEntryIsMiss(self):
+    key = rendercache.Key('abc', 'juniper')
+    self.cache.Put(key, [('.jcl', 'term')])
+    with open(os.path.join(self.tmpdir, 'objects', key[:2], key), 'w') as f:
+      f.write('[[')
+    self.assertEqual(self.cache.Get(key), None)
+
+  def testFlushStats(self):
+    self.cache.Get(rendercache.Key('abc', 'juniper'))
+    other = rendercache.RenderCache(self.tmpdir)
+    other.Merge({'hits': 2, 'misses': 1})
+    self.cache.Merge(other.Collect())
+    self.assertEqual(other.stats['hits'], 0)
+    totals = self.cache.Flush()
+    self.assertEqual((totals['hits'], totals['misses']), (2, 2))
+    self.assertEqual(self.cache.stats['misses'], 0)
+    other.Merge({'hits': 1})
+    self.assertEqual(other.Flush()['hits'], 3)
+    self.assertEqual(self.cache.Stats()['hits'], 3)
+
+  def testEvictLeastRecentlyUsed(self):
+    keys = [rendercache.Key(str(x), 'juniper') for x in range(4)]
+    for i, key in enumerate(keys):
+      self.cache.Put(key, [('.jcl', 'x' * 1000)])
+      path = os.path.join(self.tmpdir, 'objects', key[:2], key)
+      os.utime(path, (1000 + i, 1000 + i))
+    # reading the oldest entry makes it the most recently used.
+    self.cache.Get(keys[0])
+    self.cache.max_bytes = 2500
+    self.cache.Flush()
+    self.assertEqual(self.cache.Stats()['evictions'], 2)
+    self.assertEqual(self.cache.Stats()['entries'], 2)
+    self.assertNotEqual(self.cache.Get(keys[0]), None)
+    self.assertEqual(self.cache.Get(keys[1]), None)
+    self.assertEqual(self.cache.Get(keys[2]), None)
+    self.assertNotEqual(self.cache.Get(keys[3]), None)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,93 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for renderd.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from lib import renderd
+
+
+def _Echo(request):
+  return {'echo': request['value']}
+
+
+def _Fail(unused_request):
+  raise ValueError('failed')
+
+
+class RenderdTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.socket_path = os.path.join(self.tmp_dir, 'aclgen.sock')
+    self.server = renderd.Server(self.socket_path,
+                                 {'echo': _Echo, 'fail': _Fail})
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.start()
+    self.client = renderd.Client(self.socket_path, timeout=10)
+
+  def tearDown(self):
+    self.client.Close()
+    self.server.shutdown()
+    self.thread.join()
+    self.server.server_close()
+    shutil.rmtree(self.tmp_dir)
+
+  def testCall(self):
+    self.assertEqual(self.client.Call('echo', value='foo'),
+                     {'ok': True, 'echo': 'foo'})
+    # the connection is reused for further requests.
+    self.assertEqual(self.client.Call('echo', value='bar')['echo'], 'bar')
+
+  def testErrors(self):
+    self.assertRaisesRegexp(renderd.RequestError, 'failed',
+                            self.client.Call, 'fail')
+    self.assertRaisesRegexp(renderd.RequestError, 'bad request',
+                            self.client.Call, 'unknown')
+    self.assertRaisesRegexp(renderd.RequestError, 'missing argument',
+                            self.client.Call, 'echo')
+    self.assertEqual(self.client.Call('echo', value='ok')['echo'], 'ok')
+
+  def testStatus(self):
+    self.client.Call('echo', value='foo')
+    self.assertRaises(renderd.RequestError, self.client.Call, 'fail')
+    status = self.client.Call('status')
+    self.assertEqual(status['pid'], os.getpid())
+    self.assertEqual(status['requests'], 3)
+    self.assertEqual(status['errors'], 1)
+
+  def testLoadTest(self):
+    result = renderd.LoadTest(self.socket_path,
+                              {'command': 'echo', 'value': 'x'},
+                              count=10, concurrency=3)
+    self.assertEqual(result['requests'], 10)
+    self.assertEqual(result['errors'], 0)
+    self.assertTrue(result['rps'] > 0)
+    self.assertTrue(result['p99'] >= result['p50'])
+
+  def testShutdown(self):
+    self.client.Call('shutdown')
+    self.thread.join(10)
+    self.assertFalse(self.thread.is_alive())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,113 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for renderpool.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import threading
+import unittest
+
+from lib import renderpool
+
+
+_MIB = 1024 * 1024
+_INITIALIZED = []
+
+
+def _Init(value):
+  _INITIALIZED.append(value)
+
+
+def _Task(args):
+  """Allocate args MiB, or fail for negative args, returning the pid."""
+  if args < 0:
+    if args == -1:
+      raise ValueError('bad task')
+    os._exit(3)  # pylint: disable=protected-access
+  data = 'x' * (args * _MIB)
+  return os.getpid(), _INITIALIZED[0], len(data)
+
+
+class RenderPoolTest(unittest.TestCase):
+
+  def _Run(self, tasks, processes=2, **kwargs):
+    pool = renderpool.RenderPool(processes, _Task, initializer=_Init,
+                                 initargs=('init',), **kwargs)
+    try:
+      results = list(pool.Run(tasks))
+    finally:
+      pool.Close()
+    return pool, results
+
+  def testRun(self):
+    pool, results = self._Run([(x, 0) for x in range(5)])
+    self.assertEqual(sorted(x[0] for x in results), range(5))
+    for args, (pid, init, size), stats in results:
+      self.assertNotEqual(pid, os.getpid())
+      self.assertEqual(init, 'init')
+      self.assertEqual(size, args * _MIB)
+      self.assertEqual(stats['pid'], pid)
+      self.assertTrue(stats['peak_rss'] >= stats['growth'] >= 0)
+    self.assertEqual((pool.recycled, pool.died, pool.throttled), (0, 0, 0))
+
+  def testPeakRss(self):
+    _, results = self._Run([(64, 0)], processes=1)
+    self.assertTrue(results[0][2]['growth'] >= 48 * _MIB)
+    self.assertTrue(results[0][2]['peak_rss'] >= 64 * _MIB)
+
+  def testMaxTasks(self):
+    pool, results = self._Run([(0, 0)] * 6, processes=1, max_tasks=2)
+    self.assertEqual(len(set(x[1][0] for x in results)), 3)
+    self.assertEqual(pool.recycled, 3)
+
+  def testMaxRss(self):
+    pool, results = self._Run([(0, 0), (0, 0)], processes=1, max_rss=1)
+    self.assertEqual(len(set(x[1][0] for x in results)), 2)
+    self.assertEqual(pool.recycled, 2)
+
+  def testMemoryBudget(self):
+    # the two large tasks don't run at once, the small ones run alongside.
+    pool, results = self._Run([(0, 60), (0, 60), (0, 10), (0, 10)],
+                              processes=3, memory_budget=100)
+    self.assertEqual(len(results), 4)
+    self.assertEqual(pool.peak_admitted, 80)
+    self.assertEqual(pool.throttled, 1)
+
+  def testAboveBudgetRunsAlone(self):
+    pool, results = self._Run([(0, 200), (0, 10)], memory_budget=100)
+    self.assertEqual(len(results), 2)
+    self.assertEqual(pool.peak_admitted, 200)
+
+  def testFailures(self):
+    pool, results = self._Run([(-1, 0), (-2, 0), (1, 0)], processes=1)
+    results = dict((x[0], x) for x in results)
+    self.assertEqual(results[-1][1], None)
+    self.assertTrue('ValueError: bad task' in results[-1][2]['error'])
+    self.assertEqual(results[-2][1], None)
+    self.assertTrue('exit code 3' in results[-2][2]['error'])
+    self.assertEqual(results[1][1][2], _MIB)
+    self.assertEqual(pool.died, 1)
+
+  def testForkLock(self):
+    lock = threading.Lock()
+    pool, _ = self._Run([(0, 0)] * 2, processes=1, max_tasks=1,
+                        fork_lock=lock)
+    self.assertEqual(pool.recycled, 2)
+    self.assertFalse(lock.locked())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,117 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for schedule.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import schedule
+
+
+POLICY = """
+header {
+  target:: juniper test-filter
+}
+header {
+  target:: cisco test-filter
+}
+term a {
+  action:: accept
+}
+term b {
+  action:: deny
+}
+"""
+
+
+class ScheduleTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testScanUnits(self):
+    policy_file = os.path.join(self.tmpdir, 'test.pol')
+    with open(policy_file, 'w') as f:
+      f.write(POLICY)
+    size = len(POLICY) / 1024.0
+    self.assertAlmostEqual(schedule.ScanUnits(policy_file), 3 + size)
+    self.assertAlmostEqual(schedule.ScanUnits(policy_file, platforms=None),
+                           2 * (3 + size))
+    self.assertEqual(schedule.ScanUnits(os.path.join(self.tmpdir, 'missing')),
+                     1.0)
+
+  def testEstimateCalibratesFromTimings(self):
+    tasks = [schedule.Task('a', 10, None), schedule.Task('b', 5, None)]
+    schedule.Estimate(tasks, {'a': {'seconds': 2.0, 'units': 10}})
+    self.assertEqual([x.estimate for x in tasks], [2.0, 1.0])
+
+  def testEstimateWithoutTimings(self):
+    tasks = [schedule.Task('a', 10, None)]
+    schedule.Estimate(tasks, {})
+    self.assertAlmostEqual(tasks[0].estimate,
+                           10 * schedule.DEFAULT_SECONDS_PER_UNIT)
+
+  def testEstimateMemory(self):
+    tasks = [schedule.Task('a', 10, None), schedule.Task('b', 5, None),
+             schedule.Task('c', 2, None)]
+    schedule.EstimateMemory(tasks, {'a': {'seconds': 2.0, 'units': 10,
+                                          'memory': 1000},
+                                    'c': {'seconds': 1.0, 'units': 2}})
+    self.assertEqual([x.memory for x in tasks], [1000, 500, 200])
+    schedule.EstimateMemory(tasks, {})
+    self.assertEqual(tasks[1].memory, 5 * schedule.DEFAULT_BYTES_PER_UNIT)
+
+  def testLptOrderAndMakespan(self):
+    tasks = []
+    for key, seconds in (('a', 1), ('b', 3), ('c', 2), ('d', 3), ('e', 1)):
+      task = schedule.Task(key, seconds, None)
+      task.estimate = seconds
+      tasks.append(task)
+    self.assertEqual(schedule.PredictMakespan(tasks, 2), 6)
+    tasks = schedule.LptOrder(tasks)
+    self.assertEqual([x.key for x in tasks], ['b', 'd', 'c', 'a', 'e'])
+    self.assertEqual(schedule.PredictMakespan(tasks, 2), 5)
+
+  def testLptOrderKeepsGroups(self):
+    tasks = [schedule.Task('a.pol:juniper', 1, None, group='a.pol'),
+             schedule.Task('a.pol:cisco', 1, None, group='a.pol'),
+             schedule.Task('b.pol:juniper', 1, None, group='b.pol'),
+             schedule.Task('b.pol:cisco', 1, None, group='b.pol')]
+    schedule.Estimate(tasks, {'a.pol:juniper': {'seconds': 4.0, 'units': 1},
+                              'a.pol:cisco': {'seconds': 1.0, 'units': 1},
+                              'b.pol:juniper': {'seconds': 3.0, 'units': 1},
+                              'b.pol:cisco': {'seconds': 3.0, 'units': 1}})
+    # by estimate alone the tasks of the two policies would interleave.
+    self.assertEqual([x.key for x in schedule.LptOrder(tasks)],
+                     ['b.pol:juniper', 'b.pol:cisco', 'a.pol:juniper',
+                      'a.pol:cisco'])
+
+  def testSaveLoadTimings(self):
+    timings_file = os.path.join(self.tmpdir, 'timings')
+    self.assertEqual(schedule.LoadTimings(timings_file), {})
+    timings = {'a': {'seconds': 1.5, 'units': 3}}
+    schedule.SaveTimings(timings_file, timings)
+    self.assertEqual(schedule.LoadTimings(timings_file), timings)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,226 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for shard.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from lib import discovery
+from lib import manifest
+from lib import shard
+
+
+ACLGEN = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'aclgen.py')
+
+EDGE_TEMPLATE = """
+header {
+  target:: juniper ${SITE}-edge inet
+}
+term allow-web {
+  destination-address:: ${SERVERS}
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+EDGE_BINDINGS = """
+instance  SITE  SERVERS
+nyc1      nyc1  NYC1_SERVERS
+lon1      lon1  LON1_SERVERS
+"""
+
+HOP_LIMIT_POLICY = """
+header {
+  target:: juniper hops inet6
+}
+term limit-hops {
+  destination-address:: EDGE_SERVERS
+  hop-limit:: 64
+  action:: accept
+}
+"""
+
+NETWORKS = """
+NYC1_SERVERS = 10.0.0.0/24
+LON1_SERVERS = 10.1.0.0/24
+EDGE_SERVERS = 2001:db8::/64
+"""
+
+
+class ShardTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Write(self, path, data):
+    path = os.path.join(self.tmpdir, path)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(data)
+    return path
+
+  def testStableShard(self):
+    # the assignment must not change between releases or machines.
+    self.assertEqual([shard.StableShard('corp/pol/%d.pol' % x, 4)
+                      for x in range(8)],
+                     [shard.StableShard('corp/pol/%d.pol' % x, 4)
+                      for x in range(8)])
+    self.assertEqual(shard.StableShard('corp/pol/a.pol', 4), 3)
+
+  def testAssignByHash(self):
+    keys = ['pol/%d.pol' % x for x in range(100)]
+    shards = shard.Assign(keys, 3)
+    self.assertEqual(sorted(shards), sorted(keys))
+    self.assertEqual(set(shards.values()), set([0, 1, 2]))
+    # adding a policy doesn't move the others.
+    more = shard.Assign(keys + ['pol/new.pol'], 3)
+    self.assertEqual(dict((x, more[x]) for x in keys), shards)
+
+  def testAssignByCost(self):
+    costs = {'a': 10.0, 'b': 6.0, 'c': 5.0, 'd': 4.0, 'e': 1.0}
+    self.assertEqual(shard.Assign(costs, 2, costs),
+                     {'a': 0, 'b': 1, 'c': 1, 'd': 0, 'e': 1})
+
+  def testMerge(self):
+    a = self._Write('out0/corp/a.jcl', 'a')
+    b = self._Write('out1/b.acl', 'b')
+    merged_dir = os.path.join(self.tmpdir, 'merged')
+    entries = shard.Merge([
+        (os.path.join(self.tmpdir, 'out0'),
+         {'corp/pol/a.pol': {'digest': '1', 'outputs': [a]}}),
+        (os.path.join(self.tmpdir, 'out1'),
+         {'pol/b.pol': {'digest': '2', 'outputs': [b]}})], merged_dir)
+    self.assertEqual(entries, {
+        'corp/pol/a.pol': {'digest': '1', 'outputs': [
+            os.path.join(merged_dir, 'corp/a.jcl')]},
+        'pol/b.pol': {'digest': '2', 'outputs': [
+            os.path.join(merged_dir, 'b.acl')]}})
+    self.assertEqual(open(os.path.join(merged_dir, 'corp/a.jcl')).read(), 'a')
+    self.assertEqual(shard.Verify(entries, ['corp/pol/a.pol', 'pol/c.pol']),
+                     (['pol/c.pol'], ['pol/b.pol']))
+
+  def testMergeDuplicate(self):
+    a = self._Write('out0/a.jcl', 'a')
+    entries = {'pol/a.pol': {'digest': '1', 'outputs': [a]}}
+    self.assertRaises(shard.MergeError, shard.Merge,
+                      [(os.path.join(self.tmpdir, 'out0'), entries),
+                       (os.path.join(self.tmpdir, 'out0'), entries)],
+                      os.path.join(self.tmpdir, 'merged'))
+
+  def testMergeMissingOutput(self):
+    self.assertRaises(shard.MergeError, shard.Merge,
+                      [(os.path.join(self.tmpdir, 'out0'), {
+                          'pol/a.pol': {'digest': '1', 'outputs': [
+                              os.path.join(self.tmpdir, 'out0/a.jcl')]}})],
+                      os.path.join(self.tmpdir, 'merged'))
+
+  def _Setup(self):
+    self._Write('policies/pol/edge.tmpl', EDGE_TEMPLATE)
+    self._Write('policies/pol/edge.bindings', EDGE_BINDINGS)
+    self._Write('policies/pol/hops.pol', HOP_LIMIT_POLICY)
+    self._Write('def/NETWORK.net', NETWORKS)
+    self._Write('def/SERVICES.svc', 'HTTP = 80/tcp\n')
+    return os.path.join(self.tmpdir, 'policies')
+
+  def _RenderShards(self, *flags):
+    """Render the policies in two shards, returning their (outputs, entries)."""
+    shards = []
+    for index in range(2):
+      output_directory = os.path.join(self.tmpdir, 'out%d' % index)
+      manifest_file = os.path.join(self.tmpdir, 'manifest%d' % index)
+      if not os.path.isdir(output_directory):
+        os.mkdir(output_directory)
+      subprocess.check_call([
+          sys.executable, ACLGEN,
+          '--base_directory=%s' % os.path.join(self.tmpdir, 'policies'),
+          '--definitions_directory=%s' % os.path.join(self.tmpdir, 'def'),
+          '--output_directory=%s' % output_directory,
+          '--manifest_file=%s' % manifest_file, '--shard_count=2',
+          '--shard_index=%d' % index, '--max_renderers=1'] + list(flags))
+      shards.append((output_directory, manifest.Load(manifest_file)))
+    return shards
+
+  def testMergeShardedRun(self):
+    base_dir = self._Setup()
+    merged_dir = os.path.join(self.tmpdir, 'merged')
+    entries = shard.Merge(self._RenderShards(), merged_dir)
+    # the template and the policy are both recorded by their shard.
+    policies = [x for x, _ in discovery.FindPolicies(base_dir)]
+    self.assertEqual(shard.Verify(entries, policies), ([], []))
+    self.assertEqual(sorted(os.listdir(merged_dir)),
+                     ['hops.jcl', 'lon1.jcl', 'nyc1.jcl'])
+
+  def testManifestDropsDeletedPolicy(self):
+    base_dir = self._Setup()
+    hops = os.path.join(base_dir, 'pol', 'hops.pol')
+    self.assertIn(hops, [x for _, y in self._RenderShards() for x in y])
+    os.remove(hops)
+    self.assertEqual([sorted(y) for _, y in self._RenderShards()],
+                     [[os.path.join(base_dir, 'pol', 'edge.tmpl')], []])
+
+  def _Merge(self, shards, base_dir):
+    merged_dir = os.path.join(self.tmpdir, 'merged')
+    if os.path.isdir(merged_dir):
+      shutil.rmtree(merged_dir)
+    entries = shard.Merge(shards, merged_dir)
+    return shard.Verify(entries,
+                        [x for x, _ in discovery.FindPolicies(base_dir)])
+
+  def testMergeAfterDelete(self):
+    base_dir = self._Setup()
+    self._RenderShards()
+    os.remove(os.path.join(base_dir, 'pol', 'hops.pol'))
+    self.assertEqual(self._Merge(self._RenderShards(), base_dir), ([], []))
+
+  def testMergeAfterMove(self):
+    base_dir = self._Setup()
+    hops = os.path.join(base_dir, 'pol', 'hops.pol')
+    # the largest policy is assigned to the first shard.
+    self._Write('policies/pol/hops.pol', HOP_LIMIT_POLICY + ''.join(
+        HOP_LIMIT_POLICY.split('}', 1)[1].replace('limit-hops', 'hops%d' % x)
+        for x in range(20)))
+    shards = self._RenderShards('--shard_balance')
+    self.assertIn(hops, shards[0][1])
+    self._Write('policies/pol/hops.pol', HOP_LIMIT_POLICY)
+    shards = self._RenderShards('--shard_balance')
+    self.assertIn(hops, shards[1][1])
+    self.assertEqual(self._Merge(shards, base_dir), ([], []))
+
+  def testCompareTrees(self):
+    self._Write('full/a.jcl', 'a')
+    self._Write('full/sub/b.acl', 'b')
+    self._Write('full/c.acl', 'c')
+    self._Write('merged/a.jcl', 'a')
+    self._Write('merged/sub/b.acl', 'changed')
+    self._Write('merged/d.acl', 'd')
+    self.assertEqual(shard.CompareTrees(os.path.join(self.tmpdir, 'merged'),
+                                        os.path.join(self.tmpdir, 'full')),
+                     ['c.acl', 'd.acl', 'sub/b.acl'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,172 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for template.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import naming
+from lib import policy
+from lib import template
+
+
+TEMPLATE = """
+# site edge filters
+header {
+  comment:: "edge filter of ${SITE} { braces } # in a string"
+  target:: juniper ${SITE}-edge inet
+  target:: cisco ${SITE}-edge
+}
+term allow-web {
+  destination-address:: ${SERVERS}
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+term allow-dns {
+  destination-address:: DNS_SERVERS
+  destination-port:: DNS
+  protocol:: udp
+  action:: accept
+}
+header {
+  target:: speedway INPUT
+}
+term juniper-only {
+  platform:: juniper
+  destination-address:: DNS_SERVERS
+  action:: accept
+}
+term deny-rest {
+  action:: deny
+}
+"""
+
+BINDINGS = """
+# instance  variables
+instance  SITE  SERVERS
+nyc1      nyc1  NYC1_SERVERS  # comment
+lon1      lon1  LON1_SERVERS
+"""
+
+NETWORKS = ['NYC1_SERVERS = 10.0.0.0/25',
+            '               10.0.0.128/25',
+            'LON1_SERVERS = 10.1.0.0/24',
+            'DNS_SERVERS = 10.2.0.1/32',
+            '              10.2.0.0/32']
+
+SERVICES = ['HTTP = 80/tcp', 'DNS = 53/udp']
+
+
+class TemplateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.defs = naming.Naming(None)
+    self.defs.ParseNetworkList(NETWORKS)
+    self.defs.ParseServiceList(SERVICES)
+    self.tmpl = template.Template('pol/edge.tmpl', TEMPLATE,
+                                  template.ParseBindings(BINDINGS))
+
+  def _Standalone(self, instance, **kwargs):
+    return policy.ParsePolicy(
+        template.Substitute(TEMPLATE, dict(self.tmpl.bindings)[instance]),
+        self.defs, **kwargs)
+
+  def testParseBindings(self):
+    self.assertEqual(template.ParseBindings(BINDINGS),
+                     [('nyc1', {'SITE': 'nyc1', 'SERVERS': 'NYC1_SERVERS'}),
+                      ('lon1', {'SITE': 'lon1', 'SERVERS': 'LON1_SERVERS'})])
+    self.assertRaises(template.TemplateError, template.ParseBindings,
+                      'instance SITE\nnyc1\n')
+    self.assertRaises(template.TemplateError, template.ParseBindings,
+                      'instance SITE\nnyc1 a\nnyc1 b\n')
+
+  def testSplitBlocks(self):
+    self.assertEqual([x for x, _ in template.SplitBlocks(TEMPLATE)],
+                     ['header', 'term', 'term', 'header', 'term', 'term'])
+    self.assertRaises(template.TemplateError, template.SplitBlocks,
+                      'header { target:: juniper a')
+    self.assertRaises(template.TemplateError, template.SplitBlocks,
+                      'foo { }')
+
+  def testUnboundVariable(self):
+    self.assertRaises(template.UnboundVariableError, template.Substitute,
+                      '${FOO}', {'BAR': 'x'})
+
+  def testInstances(self):
+    self.assertEqual(self.tmpl.Instances(), ['nyc1', 'lon1'])
+    self.assertEqual(self.tmpl.InstanceFile('nyc1'), 'pol/nyc1.pol')
+
+  def testParseLikeStandalone(self):
+    for instance in self.tmpl.Instances():
+      pol = self.tmpl.Parse(instance, self.defs, optimize=False)
+      self.assertEqual(pol, self._Standalone(instance, optimize=False))
+      self.assertEqual(str(pol.filters[0][1][0].destination_address),
+                       str(self._Standalone(instance, optimize=False)
+                           .filters[0][1][0].destination_address))
+    # ParsePolicy only leaves the first term unoptimized.
+    pol = self.tmpl.Parse('nyc1', self.defs, optimize=False)
+    self.assertEqual(len(pol.filters[0][1][0].destination_address), 2)
+    self.assertEqual(len(pol.filters[0][1][1].destination_address), 1)
+    self.assertEqual(self.tmpl.Parse('nyc1', self.defs),
+                     self._Standalone('nyc1'))
+
+  def testSharedTerms(self):
+    nyc1 = self.tmpl.Parse('nyc1', self.defs)
+    lon1 = self.tmpl.Parse('lon1', self.defs)
+    self.assertTrue(nyc1.filters[0][1][1] is lon1.filters[0][1][1])
+    self.assertFalse(nyc1.filters[0][1][0] is lon1.filters[0][1][0])
+    self.assertEqual(nyc1.filters[0][0].FilterName('juniper'), 'nyc1-edge')
+
+  def testPlatforms(self):
+    pol = self.tmpl.Parse('nyc1', self.defs, platforms=['speedway'])
+    self.assertEqual(pol, self._Standalone('nyc1', platforms=['speedway']))
+    self.assertEqual([x.name for x in pol.filters[0][1]], ['deny-rest'])
+
+  def testInstancePlatforms(self):
+    self.assertEqual(self.tmpl.Platforms('nyc1', self.defs),
+                     set(['juniper', 'cisco', 'speedway']))
+
+  def testText(self):
+    self.assertEqual(
+        policy.ParsePolicy(self.tmpl.Text('lon1'), self.defs),
+        self._Standalone('lon1'))
+    self.assertNotEqual(template.InstanceDigest('abc', 'nyc1'),
+                        template.InstanceDigest('abc', 'lon1'))
+
+  def testLoad(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      os.mkdir(os.path.join(tmpdir, 'pol'))
+      template_file = os.path.join(tmpdir, 'pol', 'edge.tmpl')
+      with open(template_file, 'w') as f:
+        f.write(TEMPLATE)
+      with open(template.BindingsFile(template_file), 'w') as f:
+        f.write(BINDINGS)
+      tmpl = template.Load(template_file, base_dir=tmpdir)
+      self.assertEqual(tmpl.InstanceFile('lon1'),
+                       os.path.join(tmpdir, 'pol', 'lon1.pol'))
+      self.assertEqual(tmpl.Parse('lon1', self.defs),
+                       self._Standalone('lon1'))
+    finally:
+      shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+  unittest.main()
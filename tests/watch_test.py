@@ -0,0 +1,182 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for watch.py module."""
+
+__author__ = 'pmoody@google.com'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib import naming
+from lib import watch
+
+
+WEB_POLICY = """
+header {
+  target:: juniper web-filter
+}
+#include 'dns.inc'
+term allow-web {
+  destination-address:: WEB_SERVERS
+  destination-port:: HTTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+MAIL_POLICY = """
+header {
+  target:: juniper mail-filter
+}
+term allow-mail {
+  destination-address:: MAIL_SERVERS
+  destination-port:: SMTP
+  protocol:: tcp
+  action:: accept
+}
+"""
+
+DNS_INCLUDE = """
+term allow-dns {
+  destination-port:: DNS
+  protocol:: udp
+  action:: accept
+}
+"""
+
+HOP_LIMIT_POLICY = """
+header {
+  target:: juniper edge-filter inet6
+}
+term limit-hops {
+  destination-address:: EDGE_SERVERS
+  hop-limit:: 64
+  forwarding-class:: fc1
+  dscp-except:: be
+  action:: accept
+}
+"""
+
+
+class WatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.web = self._Write('web.pol', WEB_POLICY)
+    self.mail = self._Write('mail.pol', MAIL_POLICY)
+    self.include = self._Write('dns.inc', DNS_INCLUDE)
+    self.index = watch.DependencyIndex(base_dir=self.tmpdir)
+    self.index.Update(self.web)
+    self.index.Update(self.mail)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Write(self, name, data):
+    path = os.path.join(self.tmpdir, name)
+    with open(path, 'w') as f:
+      f.write(data)
+    return path
+
+  def _Definitions(self, networks):
+    defs = naming.Naming(None)
+    defs.ParseNetworkList(networks)
+    defs.ParseServiceList(['HTTP = 80/tcp', 'SMTP = 25/tcp', 'DNS = 53/udp'])
+    return defs
+
+  def testSnapshot(self):
+    old = watch.Snapshot([self.web, self.mail, self._Write('gone', '')])
+    os.unlink(os.path.join(self.tmpdir, 'gone'))
+    self._Write('mail.pol', MAIL_POLICY + '\n')
+    new = watch.Snapshot([self.web, self.mail, os.path.join(self.tmpdir,
+                                                            'gone')])
+    self.assertEqual(watch.Changed(old, new),
+                     set([self.mail, os.path.join(self.tmpdir, 'gone')]))
+
+  def testFiles(self):
+    self.assertEqual(self.index.Files(),
+                     set([self.web, self.mail, self.include]))
+
+  def testTokens(self):
+    self.assertEqual(self.index.Tokens(),
+                     (set(['WEB_SERVERS', 'MAIL_SERVERS']),
+                      set(['HTTP', 'SMTP', 'DNS'])))
+
+  def testAffectedByFiles(self):
+    self.assertEqual(self.index.Affected([self.mail]), set([self.mail]))
+    self.assertEqual(self.index.Affected([self.include]), set([self.web]))
+
+  def testAffectedByTokens(self):
+    self.assertEqual(self.index.Affected(networks=['MAIL_SERVERS']),
+                     set([self.mail]))
+    self.assertEqual(self.index.Affected(services=['DNS']), set([self.web]))
+    self.assertEqual(self.index.Affected(networks=['UNUSED']), set())
+
+  def testChangedTokens(self):
+    old = self._Definitions(['INTERNAL = 10.0.0.0/8',
+                             'WEB_SERVERS = INTERNAL',
+                             'MAIL_SERVERS = 192.168.0.1/32'])
+    new = self._Definitions(['INTERNAL = 172.16.0.0/12',
+                             'WEB_SERVERS = INTERNAL',
+                             'MAIL_SERVERS = 192.168.0.1/32'])
+    self.assertEqual(
+        watch.ChangedTokens(old, new, *self.index.Tokens()),
+        (set(['WEB_SERVERS']), set()))
+
+  def testRemove(self):
+    self.index.Remove(self.web)
+    self.assertEqual(self.index.Policies(), set([self.mail]))
+    self.assertEqual(self.index.Affected([self.include]), set())
+
+  def testUpdateUnreadablePolicy(self):
+    self.index.Update(os.path.join(self.tmpdir, 'missing.pol'))
+    self.assertIn(os.path.join(self.tmpdir, 'missing.pol'), self.index)
+
+  def testUnscannedPolicyAlwaysAffected(self):
+    bad = self._Write('bad.pol', 'term broken {\n  bogus:: value\n}\n')
+    self.index.Update(bad)
+    self.assertEqual(self.index.Unscanned(), set([bad]))
+    self.assertEqual(self.index.Affected([self.mail]), set([self.mail, bad]))
+    self.assertEqual(self.index.Affected(networks=['UNUSED']), set([bad]))
+    # once readable, it only follows its references.
+    self._Write('bad.pol', MAIL_POLICY)
+    self.index.Update(bad)
+    self.assertEqual(self.index.Unscanned(), set())
+    self.assertEqual(self.index.Affected(networks=['UNUSED']), set())
+
+  def testHopLimitPolicyScanned(self):
+    edge = self._Write('edge.pol', HOP_LIMIT_POLICY)
+    self.index.Update(edge)
+    self.assertEqual(self.index.Unscanned(), set())
+    self.assertEqual(self.index.Affected(networks=['EDGE_SERVERS']),
+                     set([edge]))
+
+  def testTemplateBindingsWatched(self):
+    edge = self._Write('edge.tmpl', HOP_LIMIT_POLICY.replace(
+        'edge-filter', '${SITE}-filter'))
+    bindings = self._Write('edge.bindings', 'instance SITE\nnyc1 nyc1\n')
+    self.index.Update(edge)
+    self.assertIn(bindings, self.index.Files())
+    old = watch.Snapshot(self.index.Files())
+    self._Write('edge.bindings', 'instance SITE\nnyc1 nyc1\nlon1 lon1\n')
+    changed = watch.Changed(old, watch.Snapshot(self.index.Files()))
+    self.assertEqual(changed, set([bindings]))
+    self.assertEqual(self.index.Affected(changed), set([edge]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,103 @@
+# Copyright 2016 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Send requests to an aclgen daemon, started with
+#   $ aclgen.py --serve=/tmp/aclgen.sock
+# Examples:
+#   To render a policy, as "aclgen.py --policy_file" would
+#   $ aclgen_client.py render ../policies/pol/sample_cisco_lab.pol
+#
+#   To only check that policies parse
+#   $ aclgen_client.py check ../policies/pol/*.pol
+#
+#   To measure the request rate of the daemon, 4 clients rendering a policy
+#   500 times without writing it
+#   $ aclgen_client.py loadtest -n 500 -c 4 ../policies/pol/sample_srx.pol
+#
+__author__ = "pmoody@google.com"
+
+import json
+import os
+import sys
+sys.path.append('../')
+from lib import renderd
+from optparse import OptionParser
+
+def main(argv):
+  parser = OptionParser(
+      usage='usage: %prog [options] render|check|loadtest|status|shutdown '
+            '[policy files]')
+
+  parser.add_option("-s", "--socket", dest="socket", action="store",
+                    help="Socket of the aclgen daemon.",
+                    default="/tmp/aclgen.sock")
+  parser.add_option("-o", "--output_directory", dest="output_directory",
+                    action="store",
+                    help="Directory to render into, instead of the daemon's.")
+  parser.add_option("--dry_run", dest="dry_run", action="store_true",
+                    help="Only report the files which would change.",
+                    default=False)
+  parser.add_option("-n", "--requests", dest="requests", action="store",
+                    type="int", help="loadtest: number of requests.",
+                    default=100)
+  parser.add_option("-c", "--concurrency", dest="concurrency", action="store",
+                    type="int", help="loadtest: number of concurrent clients.",
+                    default=1)
+
+  (options, args) = parser.parse_args(argv[1:])
+  if not args:
+    parser.error('no command given')
+  command, policy_files = args[0], [os.path.abspath(x) for x in args[1:]]
+
+  request = {}
+  if options.output_directory:
+    request['output_directory'] = os.path.abspath(options.output_directory)
+  if options.dry_run:
+    request['dry_run'] = True
+
+  if command == 'loadtest':
+    if len(policy_files) != 1:
+      parser.error('loadtest needs one policy file')
+    request.update(command='render', dry_run=True,
+                   policy_file=policy_files[0])
+    print json.dumps(renderd.LoadTest(options.socket, request,
+                                      options.requests, options.concurrency),
+                     indent=2, sort_keys=True)
+    return 0
+
+  client = renderd.Client(options.socket)
+  failed = False
+  try:
+    if command in ('render', 'check'):
+      for policy_file in policy_files:
+        try:
+          result = client.Call(command, policy_file=policy_file, **request)
+        except renderd.RequestError as e:
+          print >>sys.stderr, '%s: %s' % (policy_file, e)
+          failed = True
+          continue
+        print json.dumps(dict(result, policy_file=policy_file),
+                         sort_keys=True)
+    else:
+      print json.dumps(client.Call(command), indent=2, sort_keys=True)
+  except renderd.RequestError as e:
+    print >>sys.stderr, e
+    failed = True
+  finally:
+    client.Close()
+  return int(failed)
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
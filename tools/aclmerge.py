@@ -0,0 +1,93 @@
+# Copyright 2016 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Merge the outputs and manifests of sharded aclgen runs.
+# Examples:
+#   To render the policies in two shards, as two separate processes or on two
+#   machines, then merge them and check every policy was rendered
+#   $ aclgen.py --shard_count=2 --shard_index=0 --output_directory=out0 \
+#       --manifest_file=m0
+#   $ aclgen.py --shard_count=2 --shard_index=1 --output_directory=out1 \
+#       --manifest_file=m1
+#   $ aclmerge.py -o merged -m merged.manifest -b ./policies out0:m0 out1:m1
+#
+#   To also check that the merged outputs are those of a full run
+#   $ aclgen.py --output_directory=full
+#   $ aclmerge.py -o merged -b ./policies --compare full out0:m0 out1:m1
+#
+__author__ = "pmoody@google.com"
+
+import sys
+sys.path.append('../')
+from lib import discovery
+from lib import manifest
+from lib import shard
+from optparse import OptionParser
+
+def main(argv):
+  parser = OptionParser(
+      usage='usage: %prog [options] shard_output_directory:manifest_file ...')
+
+  parser.add_option("-o", "--output_directory", dest="output_directory",
+                    action="store", help="Directory to merge the outputs into.")
+  parser.add_option("-m", "--manifest_file", dest="manifest_file",
+                    action="store", help="Where to save the merged manifest.")
+  parser.add_option("-b", "--base_directory", dest="base_directory",
+                    action="store",
+                    help="Check that every policy under this directory, as "
+                    "given to aclgen.py, was rendered by exactly one shard.")
+  parser.add_option("-i", "--ignore_directories", dest="ignore_directories",
+                    action="store", default="DEPRECATED,def",
+                    help="Directories not searched for policies.")
+  parser.add_option("--compare", dest="compare", action="store",
+                    help="Check the merged outputs against a full run's.")
+
+  (options, args) = parser.parse_args(argv[1:])
+  if not options.output_directory or not args:
+    parser.error('an output directory and shards are required')
+
+  shards = []
+  for arg in args:
+    shard_directory, manifest_file = arg.split(':', 1)
+    shards.append((shard_directory, manifest.Load(manifest_file)))
+
+  try:
+    entries = shard.Merge(shards, options.output_directory)
+  except shard.MergeError as e:
+    print >>sys.stderr, e
+    return 1
+  if options.manifest_file:
+    manifest.Save(options.manifest_file, entries)
+  print 'merged %d policies from %d shards' % (len(entries), len(shards))
+
+  failed = False
+  if options.base_directory:
+    policies = [x for x, _ in discovery.FindPolicies(
+        options.base_directory, options.ignore_directories.split(','))]
+    missing, unexpected = shard.Verify(entries, policies)
+    for policy_file in missing:
+      print >>sys.stderr, 'not rendered by any shard: %s' % policy_file
+    for policy_file in unexpected:
+      print >>sys.stderr, 'not a policy of a full run: %s' % policy_file
+    failed = failed or missing or unexpected
+  if options.compare:
+    for relative in shard.CompareTrees(options.output_directory,
+                                       options.compare):
+      print >>sys.stderr, 'differs from the full run: %s' % relative
+      failed = True
+  return int(bool(failed))
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
@@ -0,0 +1,56 @@
+# Copyright 2016 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Report per token expansion statistics and estimated cost as JSON.
+# Examples:
+#   To report on all tokens, counting references from every policy use
+#   $ defstats.py -d ../def -b .. ../policies/pol/*.pol
+#
+#   To list the 20 tokens which make policies most expensive use
+#   $ defstats.py -d ../def -b .. --top 20 ../policies/pol/*.pol
+#
+__author__ = "watson@google.com (Tony Watson)"
+
+import json
+import sys
+sys.path.append('../')
+from lib import defstats
+from lib import naming
+from optparse import OptionParser
+
+def main(argv):
+  parser = OptionParser(usage='usage: %prog [options] [policy files]')
+
+  parser.add_option("-d", "--def", dest="defs", action="store",
+                    help="Network Definitions directory location",
+                    default="../def")
+  parser.add_option("-b", "--base", dest="base", action="store",
+                    help="Base directory to look for included files.",
+                    default="../")
+  parser.add_option("--top", dest="top", action="store", type="int",
+                    help="Only report the N most expensive tokens.")
+
+  (options, args) = parser.parse_args(argv[1:])
+
+  db = naming.Naming(options.defs)
+  report = defstats.TokenReport(db, args, base_dir=options.base)
+
+  if options.top:
+    report = [dict(stats, type=def_type, token=token) for def_type, token, stats
+              in defstats.MostExpensive(report, options.top)]
+  print json.dumps(report, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+  main(sys.argv)
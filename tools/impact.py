@@ -0,0 +1,72 @@
+# Copyright 2016 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Report the policies, filters, terms and rendered files affected by a change
+# of naming tokens, as JSON.
+# Examples:
+#   To see what changing RFC1918 would touch, keeping the index in
+#   impact.json so later queries only read the files which changed
+#   $ impact.py -d ../def -b .. -i impact.json RFC1918
+#
+#   To also list the rendered files of the affected filters use
+#   $ impact.py -d ../def -b .. -i impact.json --outputs RFC1918 DNS
+#
+__author__ = "pmoody@google.com"
+
+import json
+import sys
+sys.path.append('../')
+from lib import impact
+from optparse import OptionParser
+
+def main(argv):
+  parser = OptionParser(usage='usage: %prog [options] token [token...]')
+
+  parser.add_option("-d", "--def", dest="defs", action="store",
+                    help="Network Definitions directory location",
+                    default="../def")
+  parser.add_option("-b", "--base", dest="base", action="store",
+                    help="Base directory to look for policies and included "
+                    "files.",
+                    default="../")
+  parser.add_option("-i", "--index", dest="index", action="store",
+                    help="Keep the index in this file between runs.")
+  parser.add_option("--outputs", dest="outputs", action="store_true",
+                    help="List the rendered files of the affected filters.",
+                    default=False)
+
+  (options, args) = parser.parse_args(argv[1:])
+  if not args:
+    parser.error('no token given')
+
+  index = {}
+  if options.index:
+    index = impact.Load(options.index)
+  impact.Update(index, options.base, options.defs)
+  if options.index:
+    impact.Save(options.index, index)
+
+  report = {}
+  for token in args:
+    report[token] = impact.Impact(index, token)
+    if options.outputs:
+      outputs = set()
+      for reference in report[token]['references']:
+        outputs.update(impact.Outputs(reference))
+      report[token]['outputs'] = sorted(outputs)
+  print json.dumps(report, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -0,0 +1,91 @@
+# Copyright 2016 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Report the time spent importing each module, like python3's -X importtime.
+# Examples:
+#   To see what importing aclgen costs, nested imports indented under the
+#   module importing them, from the top of the tree
+#   $ python tools/importtime.py aclgen
+#
+#   To list the 10 modules slowest to import, excluding their own imports
+#   $ python tools/importtime.py -t 10 aclgen
+#
+__author__ = "pmoody@google.com"
+
+import __builtin__
+import sys
+import time
+sys.path.append('../')
+sys.path.insert(0, '.')
+from optparse import OptionParser
+
+_IMPORT = __builtin__.__import__
+# [label, start, time of the nested imports] of the imports in progress.
+_STACK = []
+# (depth, label, self seconds, cumulative seconds), innermost first.
+_RECORDS = []
+
+
+def _TimedImport(name, *args, **kwargs):
+  fromlist = args[2] if len(args) > 2 else kwargs.get('fromlist')
+  label = name
+  if fromlist:
+    label = ','.join('%s.%s' % (name, x) for x in fromlist)
+  modules = len(sys.modules)
+  frame = [label, time.time(), 0.0]
+  _STACK.append(frame)
+  try:
+    return _IMPORT(name, *args, **kwargs)
+  finally:
+    _STACK.pop()
+    cumulative = time.time() - frame[1]
+    if _STACK:
+      _STACK[-1][2] += cumulative
+    # only imports which loaded a module are worth reporting.
+    if len(sys.modules) > modules:
+      _RECORDS.append((len(_STACK), label, cumulative - frame[2], cumulative))
+
+
+def main(argv):
+  parser = OptionParser(usage='usage: %prog [options] module')
+  parser.add_option("-t", "--top", dest="top", type="int", action="store",
+                    help="Only list the N slowest imports, by self time.")
+  (options, args) = parser.parse_args(argv[1:])
+  if len(args) != 1:
+    parser.error('exactly one module must be given')
+
+  # flags parsing modules look at argv when imported.
+  sys.argv = sys.argv[:1]
+  __builtin__.__import__ = _TimedImport
+  start = time.time()
+  try:
+    __import__(args[0])
+  finally:
+    __builtin__.__import__ = _IMPORT
+  total = time.time() - start
+
+  records = _RECORDS
+  if options.top:
+    records = sorted(records, key=lambda x: -x[2])[:options.top]
+  print 'import time: self [us] | cumulative | imported package'
+  for depth, label, self_time, cumulative in records:
+    if options.top:
+      depth = 0
+    print 'import time: %9d | %10d | %s%s' % (
+        self_time * 1e6, cumulative * 1e6, '  ' * depth, label)
+  print 'total: %.1fms, %d imports' % (total * 1000, len(_RECORDS))
+
+if __name__ == '__main__':
+  main(sys.argv)